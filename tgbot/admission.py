@@ -0,0 +1,133 @@
+import asyncio
+import functools
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from tgbot.broadcast import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+USER_RATE = 2  # updates per second of a single user
+USER_BURST = 5  # updates of a user admitted at once
+DUPLICATE_WINDOW = 1  # seconds a repeated press of a button is ignored
+CONCURRENCY = 8  # expensive handlers running at once
+BUSY_TEXT = '⏳ Please wait...'
+
+
+class Admission:
+    """
+    Admission control of updates in front of the handlers.
+
+    Every user has a token bucket of `rate` updates per second, repeated
+    presses of the same button of a message within `window` are dropped,
+    handlers wrapped by `limit` run at most `concurrency` at once. Updates
+    over the limits get a short "please wait" answer instead of handling.
+    """
+
+    def __init__(
+        self,
+        rate: float = USER_RATE,
+        burst: float = USER_BURST,
+        window: float = DUPLICATE_WINDOW,
+        concurrency: int = CONCURRENCY,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.concurrency = concurrency
+        self.rejected = 0
+
+        self._buckets: dict[int, TokenBucket] = {}
+        # (user id, message id, callback data) -> time of the last press
+        self._presses: dict[tuple, float] = {}
+        self._warned: set[int] = set()
+        self._semaphore = None
+
+    def _get_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) > 10_000:
+                self._buckets = {
+                    k: v for k, v in self._buckets.items() if not v.is_full
+                }
+            bucket = TokenBucket(self.rate, capacity=self.burst)
+            self._buckets[user_id] = bucket
+        return bucket
+
+    def is_duplicate(self, update: Update) -> bool:
+        """Return True if the button was pressed within the window."""
+        query = update.callback_query
+        if query is None:
+            return False
+
+        now = time.monotonic()
+        # Presses are kept in the time order, expired ones are at the start
+        while self._presses:
+            key, pressed_at = next(iter(self._presses.items()))
+            if now - pressed_at < self.window:
+                break
+            del self._presses[key]
+
+        message_id = query.message.message_id if query.message \
+            else query.inline_message_id
+        key = (query.from_user.id, message_id, query.data)
+        if key in self._presses:
+            return True
+        self._presses[key] = now
+        return False
+
+    async def _reject(self, update: Update, warn: bool = True) -> None:
+        self.rejected += 1
+        if query := update.callback_query:
+            await query.answer(BUSY_TEXT if warn else None)
+        elif warn and update.effective_message:
+            await update.effective_message.reply_text(BUSY_TEXT)
+
+    async def check(self, update: Update,
+                    context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Stop handling of the update over the limits of its user."""
+        user = update.effective_user
+        if user is None:
+            return
+
+        if self.is_duplicate(update):
+            logger.debug(f'Duplicate callback is dropped. TG: {user.id}')
+            await self._reject(update, warn=False)
+            raise ApplicationHandlerStop
+
+        if not self._get_bucket(user.id).try_acquire():
+            logger.info(f'Update is over the rate limit. TG: {user.id}')
+            # A message is answered once while the user keeps the pace
+            await self._reject(
+                update, warn=bool(update.callback_query)
+                or user.id not in self._warned
+            )
+            self._warned.add(user.id)
+            raise ApplicationHandlerStop
+
+        self._warned.discard(user.id)
+
+    def limit(self, handler: Callable[..., Awaitable]) -> Callable:
+        """Decorator answers "please wait" when the handlers are busy."""
+
+        @functools.wraps(handler)
+        async def _limited(update: Update,
+                           context: ContextTypes.DEFAULT_TYPE):
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+
+            if self._semaphore.locked():
+                logger.info(
+                    f'{handler.__name__} is busy. '
+                    f'TG: {update.effective_user.id}'
+                )
+                await self._reject(update)
+                return None
+
+            async with self._semaphore:
+                return await handler(update, context)
+        return _limited
@@ -0,0 +1,78 @@
+import hashlib
+import logging
+
+from django.utils import timezone
+from telegram import Bot
+
+from web_dashboard.bot_api.models import CrewAnnouncement
+from tgbot.broadcast import Broadcaster, BroadcastReport
+from tgbot.db import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+
+def get_text_hash(text: str) -> str:
+    """Return short hash of the message text."""
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+@run_in_pool
+def get_announcements(crew_id: int) -> dict[int, tuple[int, str]]:
+    """Return {chat id: (message id, text hash)} of the crew announcements."""
+    return {
+        chat_id: (message_id, text_hash)
+        for chat_id, message_id, text_hash in
+        CrewAnnouncement.objects.filter(crew=crew_id)
+        .values_list('chat_id', 'message_id', 'text_hash')
+    }
+
+
+@run_in_pool
+def save_announcements(crew_id: int, messages: dict[int, int],
+                       text_hash: str) -> None:
+    """Insert or update announcements {chat id: message id} of the crew."""
+    now = timezone.now()
+    CrewAnnouncement.objects.bulk_create(
+        [
+            CrewAnnouncement(
+                crew_id=crew_id,
+                chat_id=chat_id,
+                message_id=message_id,
+                text_hash=text_hash,
+                updated_at=now,
+            ) for chat_id, message_id in messages.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['crew', 'chat_id'],
+        update_fields=['message_id', 'text_hash', 'updated_at'],
+    )
+
+
+async def announce_crew(
+    broadcaster: Broadcaster,
+    crew_id: int,
+    bot: Bot,
+    chat_ids: list[int],
+    text: str,
+) -> BroadcastReport:
+    """
+    Send the crew announcement to the chats and edit it in place in all
+    chats announced before. Chats with the same text are skipped.
+    """
+    text_hash = get_text_hash(text)
+    previous = await get_announcements(crew_id)
+
+    messages = {
+        chat_id: previous.get(chat_id, (None, None))[0]
+        for chat_id in [*chat_ids, *previous]
+        if previous.get(chat_id, (None, None))[1] != text_hash
+    }
+    report, delivered = await broadcaster.announce(bot, messages, text)
+
+    try:
+        if delivered:
+            await save_announcements(crew_id, delivered, text_hash)
+    except Exception:
+        # e.g. the crew is deleted meanwhile
+        logger.exception(f'Announcements of crew {crew_id} are not saved.')
+    return report
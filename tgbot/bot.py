@@ -1,11 +1,15 @@
 import os
+import asyncio
+import functools
 import logging
 import django
 import re
+import tempfile
 import datetime as dt
+from collections.abc import Callable
 from dateutil.parser import parse
+from xml.etree.ElementTree import ParseError
 # from decimal import Decimal
-from yandex_geocoder import Client
 from asgiref.sync import sync_to_async
 
 from telegram import (
@@ -14,13 +18,14 @@ from telegram import (
     # ReplyKeyboardRemove,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
-    error
 )
 
 from telegram.ext import (
     filters, MessageHandler, ApplicationBuilder, CommandHandler, ContextTypes,
+    Application,
     CallbackQueryHandler,
     ConversationHandler,
+    TypeHandler,
 )
 
 from warnings import filterwarnings
@@ -28,10 +33,22 @@ from telegram.warnings import PTBUserWarning
 
 from tgbot.logging_config import setup_logging_config
 from tgbot.utils import str_to_dt
+from tgbot.admission import Admission
+from tgbot.broadcast import Broadcaster, Coalescer
+from tgbot.user_state import (
+    UserDataLimiter, end_idle_conversation, get_user_data_stats
+)
+from tgbot.update_processor import UserUpdateProcessor
 
 filterwarnings(
     action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning
 )
+# Every nested conversation has the same timeout as the parent one, all of
+# them end together (see ConversationTimeoutTest)
+filterwarnings(
+    action="ignore", message=r".*conversation_timeout.*nested",
+    category=PTBUserWarning
+)
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_dashboard.settings')
 django.setup()
@@ -39,10 +56,9 @@ django.setup()
 from django.conf import settings  # noqa: E402
 from django.db.models import F, Q  # noqa: E402
 from django.contrib.gis.geos import Point  # noqa: E402
-from django.contrib.gis.db.models.functions import Distance  # noqa: E402
 from django.utils import timezone  # noqa: E402
 from django.db.models.query import QuerySet  # noqa: E402
-from django.db.models import Count  # noqa: E402
+from django.db.models import Max  # noqa: E402
 
 from web_dashboard.logistics.models import (  # noqa: E402
     Departure,
@@ -52,7 +68,27 @@ from web_dashboard.logistics.models import (  # noqa: E402
 from web_dashboard.search_requests.models import SearchRequest   # noqa: E402
 from web_dashboard.users.models import CustomUser  # noqa: E402
 from web_dashboard.users.forms import TZOffsetHandler  # noqa: E402
-from web_dashboard.bot_api.models import TelegramUser  # noqa E402
+from web_dashboard.bot_api.models import (  # noqa: E402
+    AllowedUserEvent, TelegramUser
+)
+from tgbot import callback  # noqa: E402
+from tgbot.announcements import announce_crew  # noqa: E402
+from tgbot.geocoding import GeocodingService, get_backend  # noqa: E402
+from tgbot.gpx import save_track  # noqa: E402
+from tgbot.db import db_pool, run_in_pool  # noqa: E402
+from tgbot.ops_board import OpsBoard, render_ops_board  # noqa: E402
+from tgbot.outbox import (  # noqa: E402
+    OutboxWorker, commit_with_message, delete_sent_messages
+)
+from tgbot.persistence import DatabasePersistence  # noqa: E402
+from tgbot.queries import (  # noqa: E402
+    get_crew_snapshot, get_dashboard, get_nearest_crews, get_open_departures,
+    get_ops_board, get_user_profile
+)
+from tgbot.reachability import (  # noqa: E402
+    ReachabilityRegistry, load_reachability
+)
+from tgbot.render import render  # noqa: E402
 
 logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -63,7 +99,24 @@ logging.getLogger("pudb").setLevel(logging.WARNING)
 # logger.setLevel(logging.DEBUG)
 logger.info(f'Start logging: {logger.getEffectiveLevel()}')
 
-geocoder = Client(os.getenv('YMAP_TOKEN'))
+geocoder = GeocodingService(
+    get_backend(settings.GEOCODER_BACKEND, os.getenv('YMAP_TOKEN')),
+    cache_size=settings.GEOCODE_CACHE_SIZE,
+    ttl=dt.timedelta(days=settings.GEOCODE_CACHE_TTL),
+)
+# Users who started the bot and are not known to have blocked it
+reachability = ReachabilityRegistry(*load_reachability())
+broadcaster = Broadcaster(registry=reachability)
+coalescer = Coalescer(broadcaster, window=settings.NOTIFICATION_WINDOW)
+outbox = OutboxWorker(broadcaster)
+user_data_limiter = UserDataLimiter(settings.USER_DATA_MAX_USERS)
+admission = Admission(
+    rate=settings.USER_UPDATE_RATE,
+    burst=settings.USER_UPDATE_BURST,
+    concurrency=settings.BOT_HANDLER_CONCURRENCY,
+)
+ops_board = OpsBoard(broadcaster, settings.OPS_BOARD_CHAT_ID)\
+    if settings.OPS_BOARD_CHAT_ID else None
 
 
 class ConversationStates:
@@ -114,8 +167,19 @@ class ConversationStates:
 
 CS = ConversationStates
 
+# Static buttons shared by keyboards
+BACK_BUTTON = InlineKeyboardButton("🔙 Back", callback_data=CS.BACK)
+CANCEL_BUTTON = InlineKeyboardButton("❌ Cancel", callback_data=CS.END)
+
+# Update types used by the handlers, the rest are not requested from Telegram
+ALLOWED_UPDATES = [
+    Update.MESSAGE,
+    Update.EDITED_MESSAGE,
+    Update.CALLBACK_QUERY,
+]
+
 
-def str_to_coordinates(psn: str) -> tuple[float, float]:
+async def str_to_coordinates(psn: str) -> tuple[float, float]:
     """Parse coordinates string, validate it, and return tuple (lat, long)."""
     pattern = r'([-+]?\d*\.?\d+)[,\s]+([-+]?\d*\.?\d+)'
     matches = re.findall(pattern, psn)
@@ -124,8 +188,7 @@ def str_to_coordinates(psn: str) -> tuple[float, float]:
     is_address = re.search(address_pattern, psn)
 
     if is_address:
-        lon, lat = map(float, geocoder.coordinates(psn))
-        return lat, lon
+        return await geocoder.coordinates(psn)
 
     if matches:
         lat, lon = map(float, matches[0])
@@ -140,7 +203,7 @@ def str_to_coordinates(psn: str) -> tuple[float, float]:
     )
 
 
-def get_coordinates(update: Update) -> tuple[float, float]:
+async def get_coordinates(update: Update) -> tuple[float, float]:
     """Parse update and return coordinates if location is present."""
     if update.message:
         location = update.message.location
@@ -152,7 +215,7 @@ def get_coordinates(update: Update) -> tuple[float, float]:
         return location.latitude, location.longitude
 
     try:
-        return str_to_coordinates(update.message.text)
+        return await str_to_coordinates(update.message.text)
 
     except Exception as e:
         user_id = update.message.from_user.id
@@ -162,11 +225,50 @@ def get_coordinates(update: Update) -> tuple[float, float]:
         raise e
 
 
+def get_lat_lon(point: Point) -> tuple[float, float]:
+    """Return (latitude, longitude) of the point stored as (lon, lat)."""
+    return point.y, point.x
+
+
 def get_allowed_users() -> set:
     """Return a set of allowed_users."""
     return set(CustomUser.objects.values_list('telegram_id', flat=True))
 
 
+def get_last_allowed_user_event_id() -> int:
+    """Return id of the last published change of allowed users."""
+    return AllowedUserEvent.objects.aggregate(
+        last_id=Max('pk')
+    )['last_id'] or 0
+
+
+@run_in_pool
+def get_allowed_user_events(last_id: int) -> list[tuple[int, int, str]]:
+    """
+    Return (id, telegram_id, action) of new changes of allowed users.
+
+    Recent events are returned again: an event with a smaller id may be
+    committed after the bigger one. Applying an event twice is safe.
+    """
+    recent = timezone.now() - dt.timedelta(seconds=10)
+    return list(
+        AllowedUserEvent.objects
+        .filter(Q(pk__gt=last_id) | Q(created_at__gte=recent))
+        .order_by('pk')
+        .values_list('pk', 'telegram_id', 'action')
+    )
+
+
+@run_in_pool
+def delete_allowed_user_events() -> int:
+    """Delete applied changes of allowed users older than a day."""
+    expired = timezone.now() - dt.timedelta(days=1)
+    deleted, _ = AllowedUserEvent.objects.filter(
+        created_at__lt=expired
+    ).delete()
+    return deleted
+
+
 def get_formated_dtime(dtime: dt.datetime, tz=False) -> str:
     if tz:
         timestr = dtime.strftime('%d.%m.%Y - %H:%M (UTC %z)')
@@ -174,6 +276,8 @@ def get_formated_dtime(dtime: dt.datetime, tz=False) -> str:
     return dtime.strftime('%d.%m.%Y - %H:%M ')
 
 
+# Events published while users are loaded are applied twice, it is safe
+allowed_user_event_id = get_last_allowed_user_event_id()
 allowed_users = get_allowed_users()
 filter_users = filters.User(user_id=allowed_users)
 
@@ -232,7 +336,7 @@ async def get_user(
     context: ContextTypes.DEFAULT_TYPE,
     extra_fields: set[str] = set()
 ) -> CustomUser:
-    """Return user instance and record it to context if not present."""
+    """Return user instance with the base and extra fields loaded."""
     fields = {
         'id',
         'telegram_id',
@@ -245,14 +349,7 @@ async def get_user(
         'nickname',
     }.union(extra_fields)
 
-    if not extra_fields:
-        if user := context.user_data.get('user'):
-            return user
-
-    user_id = update.effective_user.id
-    user = await CustomUser.objects.only(*fields).aget(telegram_id=user_id)
-    context.user_data['user'] = user
-    return user
+    return await get_user_profile(update.effective_user.id, fields)
 
 
 # Authorization
@@ -266,8 +363,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     await TelegramUser.objects.aupdate_or_create(
         user_id=user_id,
-        defaults={'last_action': dt.datetime.now(dt.UTC)}
+        defaults={
+            'last_action': dt.datetime.now(dt.UTC),
+            'reachability': TelegramUser.ReachabilityVerbose.REACHABLE,
+        }
     )
+    reachability.mark_started(user_id)
 
     global allowed_users
     if user_id not in allowed_users:
@@ -326,38 +427,11 @@ async def restrict(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 # Start of conversation
-async def start_conversation(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE
-) -> int:
-    """Start top level conversation handler."""
-
-    query = update.callback_query
-
-    user = await get_user(update, context)
-    logger.info(f'TG: {user.telegram_id}')
-    crews = Crew.objects.exclude(status=Crew.StatusVerbose.COMPLETED)
-    user_crews = crews.filter(driver=user).prefetch_related('driver')
-    context.user_data['user_crews'] = user_crews
-
-    time = get_formated_dtime(dt.datetime.now(tz=user.tz), tz=True)
-    msg = f"🕰️ Now: {time} 🕰️\nTotal number of crews: {await crews.acount()}"
-
-    if await user_crews.aexists():
-        lines = [
-            f"{get_formated_dtime(timezone.localtime(crew.pickup_datetime, user.tz))}: "  # noqa: E501
-            f"{crew.__str__()}: {crew.passengers_count} p."
-
-            async for crew in crews.only(
-                'title', 'pickup_datetime', 'status',
-            ).annotate(passengers_count=Count('passengers'))
-        ]
-
-        msg += f"\n\nYour crews: {await user_crews.acount()}\n\t"
-        msg += ('\n\t').join(lines)
-
-    msg += "\n\nI'm a Volunteer Rescue Bot!\nWhat do you want to do?"
-
+def build_main_menu_keyboard(
+    has_car: bool,
+    has_join_requests: bool
+) -> InlineKeyboardMarkup:
+    """Return main menu keyboard of the user options."""
     buttons = [
         [
             InlineKeyboardButton('🆕 Reload', callback_data=CS.SHOWING)
@@ -371,7 +445,7 @@ async def start_conversation(
         ],
     ]
 
-    if user.has_car:
+    if has_car:
         buttons.append([
             InlineKeyboardButton('🏗️ Create crew',
                                  callback_data=CS.CREW_CREATION),
@@ -383,7 +457,7 @@ async def start_conversation(
                              callback_data=CS.CREW_MANAGE_PASSENGERS),
     ])
 
-    if await user.join_requests.aexists():
+    if has_join_requests:
         buttons[-1].append(InlineKeyboardButton(
             '📝 Manage joined crews', callback_data=CS.CREW_MANAGE_JOINED
         ))
@@ -393,7 +467,51 @@ async def start_conversation(
                              callback_data=CS.CREW_ARCHIVE),
     ])
 
-    keyboard = InlineKeyboardMarkup(buttons)
+    return InlineKeyboardMarkup(buttons)
+
+
+# Keyboards don't depend on the user, only on the options
+MAIN_MENU_KEYBOARDS = {
+    (has_car, has_join_requests):
+    build_main_menu_keyboard(has_car, has_join_requests)
+    for has_car in (False, True)
+    for has_join_requests in (False, True)
+}
+
+
+@admission.limit
+async def start_conversation(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    """Start top level conversation handler."""
+
+    query = update.callback_query
+
+    user = await get_user(update, context)
+    logger.info(f'TG: {user.telegram_id}')
+    menu = await get_dashboard(user)
+
+    time = get_formated_dtime(dt.datetime.now(tz=user.tz), tz=True)
+    msg = f"🕰️ Now: {time} 🕰️\n"\
+        f"Total number of crews: {menu['crews_count']}"
+
+    if user_crews := menu['user_crews']:
+        lines = [
+            f"{get_formated_dtime(timezone.localtime(crew['pickup_datetime'], user.tz))}: "  # noqa: E501
+            f"{crew['title']}-{crew['pk']} "
+            f"({Crew.StatusVerbose(crew['status']).label}): "
+            f"{crew['passengers_count']} p."
+            for crew in user_crews
+        ]
+        msg += f"\n\nYour crews: {len(user_crews)}\n\t"
+        msg += ('\n\t').join(lines)
+
+    msg += "\n\nI'm a Volunteer Rescue Bot!\nWhat do you want to do?"
+
+    keyboard = MAIN_MENU_KEYBOARDS[
+        bool(user.has_car), menu['has_join_requests']
+    ]
 
     if query:
         await query.answer()
@@ -404,22 +522,29 @@ async def start_conversation(
     return CS.SELECT_ACTION
 
 
-async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Display present number of the open SearchRequest and Departures."""
-    query = update.callback_query
-
-    logger.info(f'TG: {update.effective_user.id}')
-    search_requests = await SearchRequest.objects.filter(
+@run_in_pool
+def get_info_counts() -> tuple[int, int, int]:
+    """Return number of open SearchRequests, Departures and Crews."""
+    search_requests = SearchRequest.objects.filter(
         status=SearchRequest.StatusVerbose.OPEN
-    ).acount()
+    ).count()
 
-    departures = await Departure.objects.filter(
+    departures = Departure.objects.filter(
         status=Departure.StatusVerbose.OPEN
-    ).acount()
+    ).count()
 
-    crews = await Crew.objects.filter(
+    crews = Crew.objects.filter(
         status=Crew.StatusVerbose.AVAILABLE
-    ).acount()
+    ).count()
+    return search_requests, departures, crews
+
+
+async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Display present number of the open SearchRequest and Departures."""
+    query = update.callback_query
+
+    logger.info(f'TG: {update.effective_user.id}')
+    search_requests, departures, crews = await get_info_counts()
 
     msg = (
         f'\n\n{SearchRequest._meta.verbose_name_plural}: {search_requests}'
@@ -543,16 +668,14 @@ async def list_departures(
 
     logger.info(f'TG: {update.effective_user.id}')
 
-    departures = Departure.objects.filter(status=Departure.StatusVerbose.OPEN)\
-        .select_related('search_request')
+    departures = await get_open_departures()
 
-    if not await departures.aexists():
-        await update.message.reply_text(
+    if not departures:
+        await query.edit_message_text(
             "There are no available Departures, please try later."
         )
         return CS.END
 
-    departures = [dep async for dep in departures]
     keyboard = []
 
     for ind, dep in enumerate(departures):
@@ -560,14 +683,11 @@ async def list_departures(
             InlineKeyboardButton(
                 f"{ind}. {dep.search_request.full_name} - "
                 f"{dep.search_request.city} "
-                f"(Crews: {await dep.crews.acount()})",
-                callback_data=str(ind)
+                f"(Crews: {dep.crews_count})",
+                callback_data=callback.encode(CS.DISPLAY_ITEM, dep.pk)
             )
         ])
 
-    context.user_data['departures'] = departures
-    # context.user_data['dep_keyboards'] = keyboard
-
     await query.edit_message_text(
         f"Total number of departures: {len(departures)}\n"
         "Let's create a crew! Please choose Departure.",
@@ -584,29 +704,61 @@ async def display_departure(
     query = update.callback_query
     await query.answer()
 
-    index = int(query.data)
-    logger.info(f'TG: {update.effective_user.id}, departure: {index}')
+    _, (pk,) = callback.decode(query.data)
+    logger.info(f'TG: {update.effective_user.id}, departure: {pk}')
+
+    departures = await get_open_departures()
+    dep = next((dep for dep in departures if dep.pk == pk), None)
+
+    if dep is None:
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔙 Back", callback_data=CS.BACK)]
+        ])
+        await query.edit_message_text(
+            "The departure is not open anymore.", reply_markup=keyboard
+        )
+        return CS.SELECT_ITEM_ACTION
+
+    async def build_departure_info() -> str:
+        return get_departure_info(dep)
 
-    dep = context.user_data['departures'][index]
-    context.user_data['departure'] = dep
+    msg = await render('info', 'departure', pk, None, build_departure_info)
 
-    # Display detailed information about the selected departure with buttons
+    buttons = [
+        [
+            InlineKeyboardButton(
+                "☑️ Select", callback_data=callback.encode(CS.SELECT, dep.pk)
+            ),
+            InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
+            InlineKeyboardButton("❌ Cancel", callback_data=str(CS.END)),
+        ]
+    ]
+
+    keyboard = InlineKeyboardMarkup(buttons)
+    await query.edit_message_text(msg, reply_markup=keyboard)
+
+    return CS.SELECT_ITEM_ACTION
+
+
+def get_departure_info(dep: Departure) -> str:
+    """Return detailed information of the open departure."""
+    # Tasks are prefetched by get_open_departures
     tasks = '\n'.join([
         f'* {task.title} - {task.coordinates.coords}:\n\t\t{task.description}'
-        async for task in dep.tasks.all()
+        for task in dep.tasks.all()
     ])
 
     msg = (
         f"""
 Departure ID: {dep.id}
-Number of crews: {await dep.crews.acount()}
+Number of crews: {dep.crews_count}
 
 Missing person: {dep.search_request.full_name}
 Diasappearance date: {dep.search_request.disappearance_date}
 Location: {dep.search_request.city}
 PSN: {dep.search_request.location.coords}
 
-Tasks ({await dep.tasks.acount()}):
+Tasks ({dep.tasks_count}):
 {tasks}
         """
         # raw json:\n{dep.__dict__}\n
@@ -614,35 +766,84 @@ Tasks ({await dep.tasks.acount()}):
         # raw tasks:\n{dep.tasks.__dict__}
         #         """
     )
+    return msg
 
-    buttons = [
-        [
-            InlineKeyboardButton("☑️ Select", callback_data=CS.SELECT),
-            InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
-            InlineKeyboardButton("❌ Cancel", callback_data=str(CS.END)),
-        ]
-    ]
-
-    keyboard = InlineKeyboardMarkup(buttons)
-    await query.edit_message_text(msg, reply_markup=keyboard)
 
-    return CS.SELECT_ITEM_ACTION
+# Crew creation & update
+def get_crew_draft(context: ContextTypes.DEFAULT_TYPE) -> Crew:
+    """Return unsaved crew built from the draft kept in user_data."""
+    draft = context.user_data['crew_draft']
+    crew = Crew(
+        id=draft['id'],
+        departure_id=draft['departure_id'],
+        title=draft['title'],
+        passengers_max=draft['passengers_max'],
+    )
+    if location := draft['pickup_location']:
+        crew.pickup_location = Point(*location, srid=4326)
+    if pickup_datetime := draft['pickup_datetime']:
+        crew.pickup_datetime = dt.datetime.fromisoformat(pickup_datetime)
+    return crew
+
+
+def set_crew_draft(context: ContextTypes.DEFAULT_TYPE, crew: Crew) -> None:
+    """Keep crew fields entered so far in user_data as scalars."""
+    location = crew.pickup_location
+    pickup_datetime = crew.pickup_datetime
+    context.user_data['crew_draft'] = {
+        'id': crew.pk,
+        'departure_id': crew.departure_id,
+        'title': crew.title,
+        'passengers_max': crew.passengers_max,
+        'pickup_location': location.coords if location else None,
+        'pickup_datetime': pickup_datetime.isoformat()
+        if pickup_datetime else None,
+    }
+
+
+def get_user_crews(user: CustomUser) -> QuerySet[Crew]:
+    """Return not completed crews of the driver."""
+    return Crew.objects.filter(driver=user)\
+        .exclude(status=Crew.StatusVerbose.COMPLETED)
+
+
+def get_passenger_crews(user: CustomUser, status: str) -> QuerySet[Crew]:
+    """Return crews available to join or joined by the user."""
+    if status == CS.CREW_MANAGE_JOINED:
+        return Crew.objects.filter(join_requests__passenger=user)
+    return Crew.objects.filter(status=Crew.StatusVerbose.AVAILABLE)
+
+
+def get_archived_crews(user: CustomUser) -> QuerySet[Crew]:
+    """Return completed crews the user took part in."""
+    return Crew.objects.filter(status=Crew.StatusVerbose.COMPLETED).filter(
+        Q(driver=user) | Q(join_requests__passenger=user)
+    )
 
 
-# Crew creation & update
 async def get_crew_public_info(crew: Crew, tz: dt.timezone) -> str:
     """Return public crew info."""
+    departures = await get_open_departures()
+    departure = next(
+        (dep for dep in departures if dep.pk == crew.departure_id), None
+    ) or await Departure.objects.aget(pk=crew.departure_id)
     msg = f"""
-Departure {crew.departure}
+Departure {departure}
 
 Crew title: '{crew.title}'
 Max passengers: {crew.passengers_max}
-Pickup location: {crew.pickup_location.coords}
+Pickup location: {get_lat_lon(crew.pickup_location)}
 Pickup datetime: {timezone.localtime(crew.pickup_datetime, tz)}
     """
     return msg
 
 
+async def get_crew_announcement(crew: Crew, tz: dt.timezone) -> str:
+    """Return crew announcement edited in place on crew changes."""
+    return f'📢 Crew is {crew.get_status_display().lower()}. 📢\n\n'\
+        + await get_crew_public_info(crew, tz)
+
+
 async def get_keyboard_crew(
     crew: Crew,
     field: str = None
@@ -671,23 +872,34 @@ async def receive_departure(
     await query.delete_message()
 
     user = await get_user(update, context)
-    crew = context.user_data.get('crew', Crew())
     logger.info(f'TG: {update.effective_user.id}')
 
+    if query.data != CS.BACK:
+        # Select of a departure or Edit of a crew: departure id[, crew id]
+        _, (departure_id, *crew_id) = callback.decode(query.data)
+        if crew_id:
+            crew = await get_user_crews(user).aget(pk=crew_id[0])
+        else:
+            crew = Crew(departure_id=departure_id)
+        set_crew_draft(context, crew)
+
+    crew = get_crew_draft(context)
+
     if getattr(crew, 'title'):
         msg = "Please edit the title of the crew:\n"\
             + crew.title
 
     else:
-        crew.departure = context.user_data["departure"]
-        context.user_data["crew"] = crew
+        departure = await Departure.objects\
+            .select_related('search_request')\
+            .aget(pk=crew.departure_id)
         dep_created_at = get_formated_dtime(
-            timezone.localtime(crew.departure.created_at, user.tz)
+            timezone.localtime(departure.created_at, user.tz)
         )
 
         msg = f"""
 Selected Departure:
-    ID {crew.departure.pk} {crew.departure.search_request.full_name}
+    ID {departure.pk} {departure.search_request.full_name}
     Created at {dep_created_at}
 
 Please enter the title of the crew:
@@ -707,10 +919,11 @@ async def receive_crew_title(
     """
     Display the crew title and request to enter a pickup location.
     """
-    crew = context.user_data["crew"]
+    crew = get_crew_draft(context)
     answer = update.message.text
     if answer != '>>> Next >>>':
         crew.title = answer
+        set_crew_draft(context, crew)
 
     logger.info(f'TG: {update.effective_user.id}, title: {answer}')
 
@@ -719,7 +932,7 @@ async def receive_crew_title(
           " (e.g., address or coordinates)."
 
     if crew.pickup_location:
-        msg += f'\n{crew.pickup_location.coords}'
+        msg += f'\n{get_lat_lon(crew.pickup_location)}'
 
     keyboard = await get_keyboard_crew(crew, 'pickup_location')
     await update.message.reply_text(msg, reply_markup=keyboard)
@@ -731,11 +944,13 @@ async def receive_crew_location(
     context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     """ Display the location and request to enter a crew capacity."""
-    crew = context.user_data["crew"]
+    crew = get_crew_draft(context)
 
     try:
         if update.message.text != '>>> Next >>>':
-            crew.pickup_location = Point(get_coordinates(update))
+            lat, lon = await get_coordinates(update)
+            crew.pickup_location = Point(lon, lat, srid=4326)
+            set_crew_draft(context, crew)
 
     except Exception as e:
         error_msg = f"Error: {e}\n"\
@@ -750,7 +965,7 @@ async def receive_crew_location(
 
     logger.info(f'TG: {update.effective_user.id}')
 
-    msg = f"Location: {crew.pickup_location.coords}\n\n"\
+    msg = f"Location: {get_lat_lon(crew.pickup_location)}\n\n"\
           "Awesome! How many passengers could you take:"
 
     if crew.passengers_max:
@@ -768,10 +983,11 @@ async def receive_crew_capacity(
     """
     Display crew capacity and request to enter a crew departure datetime.
     """
-    crew = context.user_data["crew"]
+    crew = get_crew_draft(context)
     answer = update.message.text
     if answer != '>>> Next >>>':
         crew.passengers_max = answer
+        set_crew_draft(context, crew)
 
     logger.info(f'TG: {update.effective_user.id}, capacity: {answer}')
 
@@ -795,12 +1011,13 @@ async def receive_crew_pickup_date(
     """
     Display crew capacity and request to enter a crew departure datetime.
     """
-    crew = context.user_data["crew"]
+    crew = get_crew_draft(context)
     user = await get_user(update, context)
     answer = update.message.text
     if answer != '>>> Next >>>':
         try:
             crew.pickup_datetime = str_to_dt(answer, user.tz)
+            set_crew_draft(context, crew)
         except Exception as e:
             logger.warning(f'Error: {e},  TG: {user.telegram_id}')
 
@@ -831,7 +1048,7 @@ async def receive_crew_pickup_time(
     context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     """Display entered summary and next action buttons."""
-    crew = context.user_data["crew"]
+    crew = get_crew_draft(context)
     user = await get_user(update, context)
     answer = update.message.text
 
@@ -842,6 +1059,7 @@ async def receive_crew_pickup_time(
                 hour=time.hour,
                 minute=time.minute
             )
+            set_crew_draft(context, crew)
         except Exception as e:
             logger.info(
                 f'Error: {e}, TG: {user.telegram_id}, pickup time: {answer}'
@@ -877,26 +1095,45 @@ async def make_broadcast(
     update: Update,
     context: ContextTypes,
     message: str,
-    users: list[int] | int = allowed_users
+    users: list[int] | int | None = None,
+    crew_id: int | None = None,
+    save: Callable[[], None] | None = None,
+    key: str | None = None,
 ) -> None:
-    """Broadcast message to all allowed users."""
+    """
+    Broadcast message to all allowed users.
+
+    The message is saved to the outbox in one transaction with the model
+    changes of sync `save` and sent by the outbox worker, so the handler
+    is not blocked. The message is saved once per user for the same `key`
+    of the update: a redelivered update doesn't repeat it, a later update
+    with the same change does.
+
+    An announcement of `crew_id` is delayed by the coalescer, dropped if
+    another announcement of the crew follows within its window and edits
+    the previous announcement of the crew in place.
+    """
+    if users is None:
+        users = allowed_users
     if isinstance(users, int):
         users = [users]
+    users = list(users)
 
     logger.info(
         f'TG: {update.effective_user.id} broacast `{message}` to {users}'
     )
 
-    for user_id in users:
-        try:
-            await context.bot.send_message(chat_id=user_id, text=message)
-        except error.Forbidden:
-            logger.warning(f'User has blocked the bot. TG: {user_id}')
-        except Exception as e:
-            logger.warning(
-                "Unexpected error. User doesn't receive broadcast msg. "
-                f'TG: {user_id}, Error: {e}'
-            )
+    if crew_id is not None:
+        coalescer.broadcast(
+            context.bot, ('crew', crew_id), users, message,
+            functools.partial(announce_crew, broadcaster, crew_id)
+        )
+        return
+
+    if key is not None:
+        key = f'{key}:{update.update_id}'
+    await commit_with_message(save, users, message, key)
+    context.job_queue.run_once(drain_outbox, 0)
 
 
 async def crew_save_or_update(
@@ -911,15 +1148,19 @@ async def crew_save_or_update(
 
     await query.delete_message()
     try:
-        crew = context.user_data["crew"]
+        crew = get_crew_draft(context)
         crew.driver = user
         crew.status = Crew.StatusVerbose.AVAILABLE
 
         if getattr(crew, 'id') is None:
             msg = "Created"
+            await crew.asave()
         else:
             msg = "Updated"
-        await crew.asave()
+            await crew.asave(update_fields=[
+                'departure', 'title', 'passengers_max', 'pickup_location',
+                'pickup_datetime', 'driver', 'status', 'updated_at',
+            ])
 
         logger.info(
             f'Crew {msg}: {crew.title}-{crew.id}. TG: {user.telegram_id}'
@@ -942,10 +1183,9 @@ async def crew_save_or_update(
         logger.warning(msg)
         return CS.SHOWING
 
-    broadcast_msg = f'📢 Crew is available ({msg}). 📢\n\n'\
-        + await get_crew_public_info(crew, user.tz)
-
-    await make_broadcast(update, context, broadcast_msg)
+    await make_broadcast(update, context,
+                         await get_crew_announcement(crew, user.tz),
+                         crew_id=crew.pk)
 
     msg += '\nReturn back to Main menu.'
 
@@ -977,34 +1217,19 @@ async def stop_nested(update: Update,
 # Crew update
 async def get_keyboard_crew_list(
     crews: QuerySet[list[Crew]],
-    distance: bool = False
 ) -> InlineKeyboardMarkup:
     """Return a list of crew as Keyboard with buttons and callback."""
-    if not distance:
-        buttons = [
-            [InlineKeyboardButton(
-                f"{get_formated_dtime(crew.pickup_datetime)}: "
-                f"{crew.__str__()}: {crew.passengers_count} p.",
-                callback_data=str(crew.id)
-            )]
-
-            async for crew in crews.only(
-                'title', 'pickup_datetime', 'status',
-            ).annotate(passengers_count=Count('passengers'))
-        ]
-    else:
-        buttons = [
-            [InlineKeyboardButton(
-                f"{get_formated_dtime(crew.pickup_datetime)}: "
-                f"{crew.__str__()}: {crew.passengers_count} p. "
-                f"({crew.distance.km:.2f} km)",
-                callback_data=str(crew.id)
-            )]
+    buttons = [
+        [InlineKeyboardButton(
+            f"{get_formated_dtime(crew.pickup_datetime)}: "
+            f"{crew.__str__()}: {crew.passengers_count} p.",
+            callback_data=callback.encode(CS.DISPLAY_ITEM, crew.id)
+        )]
 
-            async for crew in crews.only(
-                'title', 'pickup_datetime', 'status',
-            ).annotate(passengers_count=Count('passengers'))
-        ]
+        async for crew in crews.only(
+            'title', 'pickup_datetime', 'status', 'passengers_count',
+        )
+    ]
     # buttons.append([
     #     InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
     #     InlineKeyboardButton("❌ Cancel", callback_data=str(CS.END))
@@ -1014,6 +1239,29 @@ async def get_keyboard_crew_list(
     return keyboard
 
 
+async def get_keyboard_nearest_crews(
+    crews: list[Crew],
+    more: bool = False
+) -> InlineKeyboardMarkup:
+    """Return a page of crews with distances as Keyboard with buttons."""
+    buttons = [
+        [InlineKeyboardButton(
+            f"{get_formated_dtime(crew.pickup_datetime)}: "
+            f"{crew.__str__()}: {crew.passengers_count} p. "
+            f"({crew.distance / 1000:.2f} km)",
+            callback_data=callback.encode(CS.DISPLAY_ITEM, crew.id)
+        )]
+        for crew in crews
+    ]
+
+    if more:
+        buttons.append([
+            InlineKeyboardButton("⏩ More", callback_data=CS.LIST_ITEM)
+        ])
+
+    return InlineKeyboardMarkup(buttons)
+
+
 async def list_crews(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE
@@ -1022,12 +1270,10 @@ async def list_crews(
     query = update.callback_query
     await query.answer()
 
-    logger.info(f'TG: {update.effective_user.id}')
-
-    if context.user_data.get('crew'):
-        del context.user_data['crew']
+    user = await get_user(update, context)
+    logger.info(f'TG: {user.telegram_id}')
 
-    crews = context.user_data['user_crews']
+    crews = get_user_crews(user)
 
     btn_bottom_row = [[
         InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
@@ -1049,12 +1295,12 @@ async def list_crews(
 
 
 async def get_crew_info(crew: Crew, tz: dt.timezone) -> str:
-    """Display only the crew information."""
-
-    passengers = '\n'.join([
+    """Display only the crew information of the crew snapshot."""
+    passengers = crew.passengers.all()
+    passengers_info = '\n'.join([
         f"{ps.nickname if ps.nickname else ps.full_name} "
         f"{ps.phone_number} @{ps.telegram_id}"
-        async for ps in crew.passengers.all()
+        for ps in passengers
     ])
 
     d = crew.driver
@@ -1067,25 +1313,26 @@ Status: {crew.get_status_display()}
 ID: {crew.id}
 Title: {crew.title}
 Pickup time: {timezone.localtime(crew.pickup_datetime, tz)}
-Pickup location: {crew.pickup_location.coords}
+Pickup location: {get_lat_lon(crew.pickup_location)}
 
     Driver
 Nickname: {d.nickname if d.nickname else d.full_name}
 Phone: {d.phone_number}
 Telegram: # TODO: add @Username
 
-**** Passengers ({await crew.passengers.acount()}) ****
-{passengers}
+**** Passengers ({len(passengers)}) ****
+{passengers_info}
     """
     return info
 
 
 async def get_crew_detailed_info(crew: Crew, tz: dt.timezone) -> str:
-    """Display the crew and related information."""
+    """Display the crew snapshot and related information."""
     dep = crew.departure
-    tasks = '\n'.join([
+    tasks = dep.tasks.all()
+    tasks_info = '\n'.join([
         f'* {task.title} - {task.coordinates.coords}:\n{task.description}'
-        async for task in dep.tasks.all()
+        for task in tasks
     ])
 
     sreq = dep.search_request
@@ -1100,10 +1347,10 @@ Location: {sreq.city}
 PSN: {sreq.location.coords}
 
 **** Departure ****
-Number of crews: {await dep.crews.acount()}
+Number of crews: {crew.departure_crews_count}
 
-**** Tasks ({await crew.departure.tasks.acount()}) ****
-{tasks}
+**** Tasks ({len(tasks)}) ****
+{tasks_info}
         """
         # raw json:\n{dep.__dict__}\n
         # raw search_request:\n{dep.search_request.__dict__}\n
@@ -1113,6 +1360,36 @@ Number of crews: {await dep.crews.acount()}
     return msg
 
 
+async def get_crew_view(
+    crews: QuerySet[Crew],
+    pk: int,
+    tz: dt.timezone,
+    user: CustomUser | None = None,
+    detailed: bool = True,
+) -> tuple[Crew, str]:
+    """
+    Return the crew snapshot and its (detailed) info.
+
+    Info is rendered once per crew change and timezone, the crew is
+    loaded without related objects if the info is cached.
+    """
+    snapshot = None
+
+    async def build_crew_info() -> str:
+        nonlocal snapshot
+        snapshot = await get_crew_snapshot(crews, pk, user)
+        if detailed:
+            return await get_crew_detailed_info(snapshot, tz)
+        return await get_crew_info(snapshot, tz)
+
+    msg = await render(
+        'detailed' if detailed else 'info', 'crew', pk, tz, build_crew_info
+    )
+    if snapshot is None:
+        snapshot = await get_crew_snapshot(crews, pk, user, related=False)
+    return snapshot, msg
+
+
 async def display_crew(update: Update,
                        context: ContextTypes.DEFAULT_TYPE) -> int:
     """Display detailed information of the chosen crew with buttons."""
@@ -1121,40 +1398,21 @@ async def display_crew(update: Update,
 
     user = await get_user(update, context)
 
-    if context.user_data.get('crew'):
-        crew = context.user_data['crew']
-        logger.info(f'TG: {update.effective_user.id}, crew: {crew.id}')
-
-    else:
-        pk = int(query.data)
-        logger.info(f'TG: {update.effective_user.id}, crew: {pk}')
-
-        crew = await context.user_data['user_crews']\
-            .select_related('departure', 'departure__search_request')\
-            .aget(pk=pk)
-
-        context.user_data['crew'] = crew
-        context.user_data['departure'] = crew.departure
+    _, (pk,) = callback.decode(query.data)
+    logger.info(f'TG: {update.effective_user.id}, crew: {pk}')
 
-    join_requests = JoinRequest.objects.filter(crew=crew)\
-        .exclude(status=JoinRequest.StatusVerbose.ACCEPTED)
+    crew, info = await get_crew_view(get_user_crews(user), pk, user.tz)
 
-    if await join_requests.aexists():
-        pending = await join_requests.filter(
-            status=JoinRequest.StatusVerbose.PENDING
-        ).acount()
-
-        rejected = await join_requests.filter(
-            status=JoinRequest.StatusVerbose.REJECTED
-        ).acount()
+    if crew.pending_count or crew.rejected_count:
+        pending = crew.pending_count
         msg = f'📥 Join requests: ({pending}) 📥\n'\
-            f'Pending: {pending}\nRejected: {rejected}\n'\
-            f'Accepted: {await crew.passengers.acount()}/{crew.passengers_max}'
+            f'Pending: {pending}\nRejected: {crew.rejected_count}\n'\
+            f'Accepted: {crew.passengers_count}/{crew.passengers_max}'
 
     else:
         msg = ''
 
-    msg += await get_crew_detailed_info(crew, user.tz)
+    msg += info
 
     match crew.status:
         case crew.StatusVerbose.AVAILABLE:
@@ -1170,21 +1428,32 @@ async def display_crew(update: Update,
 
     if label:
         buttons.append(
-            [InlineKeyboardButton('🏷️ ' + label, callback_data=CS.STATUS)]
+            [InlineKeyboardButton(
+                '🏷️ ' + label, callback_data=callback.encode(CS.STATUS, pk)
+            )]
         )
 
     buttons.extend([
         [
-            InlineKeyboardButton('🛂 Manage passengers',
-                                 callback_data=CS.CREW_MANAGE_PASSENGERS)
+            InlineKeyboardButton(
+                '🛂 Manage passengers',
+                callback_data=callback.encode(CS.CREW_MANAGE_PASSENGERS, pk)
+            )
         ],
         [
-            InlineKeyboardButton("⚠ Delete", callback_data=CS.DELETE)
+            InlineKeyboardButton(
+                "⚠ Delete", callback_data=callback.encode(CS.DELETE, pk)
+            )
         ],
         [
-            InlineKeyboardButton("🔧 Edit", callback_data=CS.SELECT),
-            InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
-            InlineKeyboardButton("❌ Cancel", callback_data=CS.END),
+            InlineKeyboardButton(
+                "🔧 Edit",
+                callback_data=callback.encode(
+                    CS.SELECT, crew.departure_id, pk
+                )
+            ),
+            BACK_BUTTON,
+            CANCEL_BUTTON,
         ]
     ])
 
@@ -1201,17 +1470,23 @@ async def crew_delete_confirmation(update: Update,
     await query.answer()
 
     user = await get_user(update, context)
-    crew = context.user_data['crew']
+    _, (pk,) = callback.decode(query.data)
+    crew, info = await get_crew_view(
+        get_user_crews(user), pk, user.tz, detailed=False
+    )
 
     logger.info(f'TG: {update.effective_user.id}, crew: {crew.pk}')
 
-    msg = f'Do you want to delete crew: {crew.title}-{crew.pk}?\n'\
-          + await get_crew_info(crew, user.tz)
+    msg = f'Do you want to delete crew: {crew.title}-{crew.pk}?\n' + info
 
     buttons = [
         [
-            InlineKeyboardButton("🗑️ Yes", callback_data=CS.DELETE),
-            InlineKeyboardButton("🔙 No", callback_data=CS.BACK),
+            InlineKeyboardButton(
+                "🗑️ Yes", callback_data=callback.encode(CS.DELETE, pk)
+            ),
+            InlineKeyboardButton(
+                "🔙 No", callback_data=callback.encode(CS.BACK, pk)
+            ),
         ]
     ]
     keyboard = InlineKeyboardMarkup(buttons)
@@ -1224,13 +1499,15 @@ async def crew_delete(update: Update,
     """Delete crew instance."""
     query = update.callback_query
     await query.answer()
-    crew = context.user_data['crew']
+
+    user = await get_user(update, context)
+    _, (pk,) = callback.decode(query.data)
+    crew = await get_user_crews(user).only('title').aget(pk=pk)
     title = f'{crew.title}-{crew.pk}'
 
     try:
         msg = f"Deleted crew: {title}"
         await crew.adelete()
-        del context.user_data['crew']
 
         logger.info(f'Deleted crew: {title}. TG: {update.effective_user.id}')
 
@@ -1258,8 +1535,10 @@ async def crew_change_status(
     query = update.callback_query
     await query.answer()
 
-    crew = context.user_data['crew']
     user = await get_user(update, context)
+    _, (pk,) = callback.decode(query.data)
+    crew = await get_user_crews(user).aget(pk=pk)
+    passengers = []
 
     try:
         match crew.status:
@@ -1283,14 +1562,21 @@ async def crew_change_status(
                 )
 
                 logger.info(f"Broacast crew status completed to: {passengers}")
-                await make_broadcast(update, context, msg, passengers)
 
-        await crew.asave()
+        # Passengers are notified in the transaction of the status change
+        await make_broadcast(update, context, msg, passengers,
+                             save=crew.save,
+                             key=f'crew:{crew.pk}:{crew.status}')
         logger.info(
             f'New crew status: {crew.get_status_display()}. '
             f'TG: {user.telegram_id}'
         )
 
+        # Only the announcements sent before are edited
+        await make_broadcast(update, context,
+                             await get_crew_announcement(crew, user.tz),
+                             users=[], crew_id=crew.pk)
+
     except Exception as e:
         logger.warning("Can't change crew status."
                        f'TG: {user.telegram_id}, Crew: {crew.pk}, {e=}')
@@ -1311,26 +1597,32 @@ async def list_passengers(
     await query.answer()
 
     user = await get_user(update, context)
-    crew = context.user_data['crew']
+    _, (pk,) = callback.decode(query.data)
+    crew, info = await get_crew_view(
+        get_user_crews(user), pk, user.tz, detailed=False
+    )
 
     logger.info(f'TG: {user.telegram_id}, crew: {crew.id}')
 
-    joinrequests = crew.join_requests.prefetch_related('passenger')
-    context.user_data['joinrequests'] = joinrequests
+    joinrequests = crew.join_requests.select_related('passenger')
 
-    msg = await get_crew_info(crew, user.tz) + '\nPlease select the action:'
+    msg = info + '\nPlease select the action:'
 
     buttons = [
         [
-            InlineKeyboardButton(f"{jreq.passenger.full_name} {jreq.emoji}",
-                                 callback_data=f'{jreq.pk}'),
+            InlineKeyboardButton(
+                f"{jreq.passenger.full_name} {jreq.emoji}",
+                callback_data=callback.encode(CS.DISPLAY_ITEM, jreq.pk)
+            ),
         ]
         async for jreq in joinrequests.all()
     ]
 
     buttons.append(
         [
-            InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
+            InlineKeyboardButton(
+                "🔙 Back", callback_data=callback.encode(CS.BACK, pk)
+            ),
             InlineKeyboardButton("❌ Cancel", callback_data=CS.END),
         ]
     )
@@ -1349,13 +1641,12 @@ async def display_passenger(
     query = update.callback_query
     await query.answer()
 
-    pk = int(query.data)
+    _, (pk,) = callback.decode(query.data)
 
     logger.info(f'TG: {update.effective_user.id}, joinrequest: {pk}')
 
-    joinrequests = context.user_data['joinrequests']
-    jreq = await joinrequests.aget(pk=pk)
-    context.user_data['joinrequest'] = jreq
+    user = await get_user(update, context)
+    jreq = await get_crew_join_request(user, pk)
 
     p = jreq.passenger
 
@@ -1368,8 +1659,12 @@ Phone: {p.phone_number}
 Telegram: # TODO: @Username
     """
 
-    btn_accept = InlineKeyboardButton("🟢 Accept", callback_data=CS.ACCEPT)
-    btn_reject = InlineKeyboardButton("🔴 Reject", callback_data=CS.REJECT)
+    btn_accept = InlineKeyboardButton(
+        "🟢 Accept", callback_data=callback.encode(CS.ACCEPT, pk)
+    )
+    btn_reject = InlineKeyboardButton(
+        "🔴 Reject", callback_data=callback.encode(CS.REJECT, pk)
+    )
 
     match jreq.status:
         case JoinRequest.StatusVerbose.PENDING:
@@ -1382,8 +1677,12 @@ Telegram: # TODO: @Username
     buttons = [
         btn_row,
         [
-            InlineKeyboardButton("🔙 Back",
-                                 callback_data=CS.CREW_MANAGE_PASSENGERS),
+            InlineKeyboardButton(
+                "🔙 Back",
+                callback_data=callback.encode(
+                    CS.CREW_MANAGE_PASSENGERS, jreq.crew_id
+                )
+            ),
             InlineKeyboardButton("❌ Cancel", callback_data=CS.END),
         ]
     ]
@@ -1394,29 +1693,40 @@ Telegram: # TODO: @Username
     return CS.CREW_MANAGE_PASSENGERS
 
 
+async def get_crew_join_request(user: CustomUser, pk: int) -> JoinRequest:
+    """Return join request with passenger and crew of the driver crews."""
+    return await JoinRequest.objects\
+        .select_related('passenger', 'crew')\
+        .aget(pk=pk, crew__in=get_user_crews(user))
+
+
 async def accept_join_request(update: Update,
                               context: ContextTypes.DEFAULT_TYPE) -> int:
     """Accept passenger join request to the crew."""
     query = update.callback_query
     await query.answer()
 
-    crew = context.user_data['crew']
-    jreq = context.user_data['joinrequest']
+    user = await get_user(update, context)
+    _, (pk,) = callback.decode(query.data)
+    jreq = await get_crew_join_request(user, pk)
+    crew = jreq.crew
     title = f'{crew.title}-{crew.pk}'
 
     try:
         msg = f"Passenger '{jreq.passenger.full_name}' joined crew: {title}"
-        await crew.aaccept_join_request(jreq)
+        broadcast_msg = f"You are accepted to crew '{title}'"
+        await make_broadcast(update, context,
+                             broadcast_msg,
+                             jreq.passenger.telegram_id,
+                             save=functools.partial(
+                                 crew.accept_join_request, jreq
+                             ),
+                             key=f'join_request:{jreq.pk}:accepted')
 
         logger.info(
             f'Accepted JoinRequest: {jreq}. TG: {update.effective_user.id}'
         )
 
-        broadcast_msg = f"You are accepted to crew '{title}'"
-        await make_broadcast(update, context,
-                             broadcast_msg,
-                             jreq.passenger.telegram_id)
-
     except Exception as e:
         logger.warning('Passenger joining error. TG: {query.from_user.id},'
                        f'Crew: {title}, JoinRequest: {jreq} \n{e=}')
@@ -1425,8 +1735,12 @@ async def accept_join_request(update: Update,
 
     buttons = [
         [
-            InlineKeyboardButton("🔙 Back",
-                                 callback_data=CS.CREW_MANAGE_PASSENGERS),
+            InlineKeyboardButton(
+                "🔙 Back",
+                callback_data=callback.encode(
+                    CS.CREW_MANAGE_PASSENGERS, crew.pk
+                )
+            ),
         ]
     ]
 
@@ -1441,21 +1755,26 @@ async def reject_join_request(update: Update,
     query = update.callback_query
     await query.answer()
 
-    crew = context.user_data['crew']
-    jreq = context.user_data['joinrequest']
+    user = await get_user(update, context)
+    _, (pk,) = callback.decode(query.data)
+    jreq = await get_crew_join_request(user, pk)
+    crew = jreq.crew
     title = f'{crew.title}-{crew.pk}'
 
     try:
         msg = f"Passenger {jreq.passenger.full_name} rejected from crew: {title}"  # noqa: E501
-        await crew.areject_join_request(jreq)
+        broadcast_msg = f"You are rejected to crew '{title}'"
+        await make_broadcast(update, context,
+                             broadcast_msg,
+                             jreq.passenger.telegram_id,
+                             save=functools.partial(
+                                 crew.reject_join_request, jreq
+                             ),
+                             key=f'join_request:{jreq.pk}:rejected')
 
         logger.info(
             f'Rejected JoinRequest: {jreq}. TG: {update.effective_user.id}'
         )
-        broadcast_msg = f"You are rejected to crew '{title}'"
-        await make_broadcast(update, context,
-                             broadcast_msg,
-                             jreq.passenger.telegram_id)
 
     except Exception as e:
         logger.warning('Passenger rejection error. TG: {query.from_user.id},'
@@ -1464,8 +1783,12 @@ async def reject_join_request(update: Update,
 
     buttons = [
         [
-            InlineKeyboardButton("🔙 Back",
-                                 callback_data=CS.CREW_MANAGE_PASSENGERS),
+            InlineKeyboardButton(
+                "🔙 Back",
+                callback_data=callback.encode(
+                    CS.CREW_MANAGE_PASSENGERS, crew.pk
+                )
+            ),
         ]
     ]
 
@@ -1485,7 +1808,7 @@ async def change_tz(
     await query.delete_message()
     # await query.delete_message()
 
-    user = context.user_data['user']
+    user = await get_user(update, context)
     logger.info(f'TG: {user.telegram_id}')
 
     msg = 'Go /back to settings\n\nYou current TZ: '\
@@ -1508,7 +1831,7 @@ async def receive_user_tz(
     context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     """Receive timezone reply and save it."""
-    user = context.user_data["user"]
+    user = await get_user(update, context)
     tz = update.message.text
 
     logger.info(f'TG: {user.telegram_id}, tz: {tz}')
@@ -1607,7 +1930,7 @@ async def confirm_passenger_psn(
     logger.info(f'TG: {user_id}')
 
     try:
-        psn = get_coordinates(update)
+        psn = await get_coordinates(update)
 
     except Exception as e:
         error_msg = f"Error: {e}\n"\
@@ -1645,6 +1968,7 @@ async def confirm_passenger_psn(
     return CS.SELECT_ACTION
 
 
+@admission.limit
 async def list_public_crews(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE
@@ -1664,23 +1988,30 @@ async def list_public_crews(
 
     match status:
         case CS.CREW_JOINING:
-            lat, long = context.user_data['passenger_psn']
-            passenger_location = Point(lat, long, srid=4326)
-
-            crews = Crew.objects.filter(
-                status=Crew.StatusVerbose.AVAILABLE
-            ).annotate(
-                distance=Distance('pickup_location', passenger_location)
-            ).order_by('distance')
+            page = context.user_data.get('crews_page', 0)
+            if query.data == CS.LIST_ITEM:
+                page += 1
+            elif query.data != CS.BACK:
+                page = 0
+            context.user_data['crews_page'] = page
+
+            lat, lon = context.user_data['passenger_psn']
+            radius = settings.CREWS_SEARCH_RADIUS
+            size = settings.CREWS_PAGE_SIZE
+            nearest, more = await get_nearest_crews(
+                lat, lon, radius, limit=size, offset=page * size
+            )
+            exists = bool(nearest)
 
-            msg = "The total number of existing crews: "\
-                f"{await crews.acount()}\n\nPlease choose a Crew to join:"
+            msg = f"The nearest crews within {radius:g} km "\
+                f"(page {page + 1}).\n\nPlease choose a Crew to join:"
 
-            error_msg = "There are no available Crews to join."
-            keyboard = await get_keyboard_crew_list(crews, distance=True)
+            error_msg = f"There are no available Crews within {radius:g} km."
+            keyboard = await get_keyboard_nearest_crews(nearest, more)
 
         case CS.CREW_MANAGE_JOINED:
-            crews = Crew.objects.filter(join_requests__passenger=user)
+            crews = get_passenger_crews(user, status)
+            exists = await crews.aexists()
             msg = "The total number of Crews you took part in: "\
                 f"{await crews.acount()}\n\nPlease choose a Crew to edit:"
 
@@ -1688,15 +2019,13 @@ async def list_public_crews(
 
             keyboard = await get_keyboard_crew_list(crews)
 
-    if not await crews.aexists():
+    if not exists:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=error_msg
         )
         return CS.END
 
-    context.user_data['crews'] = crews
-
     await query.edit_message_text(msg, reply_markup=keyboard)
     return CS.DISPLAY_ITEM
 
@@ -1709,33 +2038,24 @@ async def display_crew_for_passenger(
     query = update.callback_query
     await query.answer()
 
-    pk = int(query.data)
+    _, (pk,) = callback.decode(query.data)
     user = await get_user(update, context)
 
     logger.info(f'TG: {user.telegram_id}, crew_id: {pk}')
 
-    crews = context.user_data['crews']
-    crew = await crews\
-        .select_related('departure', 'departure__search_request')\
-        .annotate(driver_tg_id=F('driver__telegram_id'))\
-        .prefetch_related('driver', 'passengers')\
-        .aget(pk=pk)
-
-    context.user_data['crew'] = crew
-
-    msg = await get_crew_detailed_info(crew, user.tz)
-
-    is_passenger = await JoinRequest.objects.filter(crew=crew, passenger=user)\
-        .aexists()
+    crews = get_passenger_crews(user, context.user_data['status'])
+    crew, msg = await get_crew_view(crews, pk, user.tz, user)
 
-    if is_passenger:
+    if crew.has_user_join_request:
         button = [InlineKeyboardButton(
-           "❗ Cancel joining request (& leave crew)", callback_data=CS.DELETE
+           "❗ Cancel joining request (& leave crew)",
+           callback_data=callback.encode(CS.DELETE, pk)
         )]
 
     else:
         button = [InlineKeyboardButton(
-           "☑️ Send joining request", callback_data=CS.SELECT
+           "☑️ Send joining request",
+           callback_data=callback.encode(CS.SELECT, pk)
         )]
 
     buttons = [
@@ -1753,6 +2073,19 @@ async def display_crew_for_passenger(
     return CS.SELECT_ITEM_ACTION
 
 
+async def get_passenger_crew(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    user: CustomUser
+) -> Crew:
+    """Return the crew of the callback with Telegram ID of the driver."""
+    _, (pk,) = callback.decode(update.callback_query.data)
+    return await get_passenger_crews(user, context.user_data['status'])\
+        .annotate(driver_tg_id=F('driver__telegram_id'))\
+        .aget(pk=pk)
+
+
+@admission.limit
 async def apply_to_crew(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE
@@ -1762,7 +2095,7 @@ async def apply_to_crew(
     await query.answer()
 
     user = await get_user(update, context)
-    crew = context.user_data['crew']
+    crew = await get_passenger_crew(update, context, user)
 
     logger.info(f'TG: {user.telegram_id}, crew: {crew.id}')
 
@@ -1774,13 +2107,13 @@ async def apply_to_crew(
             request_time=dt.datetime.now(tz=user.tz)
         )
 
-        num_joinrequests = await JoinRequest.objects.filter(crew=crew)\
-            .exclude(status=JoinRequest.StatusVerbose.REJECTED).acount()
-
-        broadcast_msg = f"🟢 Crew '{crew}': +1 join request! "\
-            f"({num_joinrequests}/{crew.passengers_max})"
+        await crew.arefresh_from_db(fields=Crew.COUNTERS)
+        num_joinrequests = crew.pending_count + crew.passengers_count
 
-        await make_broadcast(update, context, broadcast_msg, crew.driver_tg_id)
+        coalescer.count_join_requests(
+            context.bot, crew.driver_tg_id, crew.pk, str(crew), +1,
+            f'{num_joinrequests}/{crew.passengers_max}'
+        )
         msg = "Join request is sent"
 
     except Exception as e:
@@ -1807,7 +2140,7 @@ async def exempt_from_crew(
     await query.answer()
 
     user = await get_user(update, context)
-    crew = context.user_data['crew']
+    crew = await get_passenger_crew(update, context, user)
 
     logger.info(f'TG: {user.telegram_id}')
 
@@ -1819,23 +2152,25 @@ async def exempt_from_crew(
 
         await joinrequest.adelete()
 
-        num_joinrequests = await JoinRequest.objects.filter(crew=crew)\
-            .exclude(status=JoinRequest.StatusVerbose.REJECTED).acount()
-
-        broadcast_msg = f"🔴 Crew '{crew}': –1 join request! "\
-            f"({num_joinrequests}/{crew.passengers_max})"
-
         msg = "Join request is canceled"
+        left = False
 
         if await crew.passengers.filter(pk=user.pk).aexists():
             await crew.passengers.aremove(user)
-            broadcast_msg += f'\n⚠ {user.full_name} left the crew.'
+            left = True
             msg = f'You left crew {crew}'
             logger.info(
                     f"User '{user.pk}: {user.full_name}' left crew '{crew}'"
             )
 
-        await make_broadcast(update, context, broadcast_msg, crew.driver_tg_id)
+        await crew.arefresh_from_db(fields=Crew.COUNTERS)
+        num_joinrequests = crew.pending_count + crew.passengers_count
+
+        coalescer.count_join_requests(
+            context.bot, crew.driver_tg_id, crew.pk, str(crew), -1,
+            f'{num_joinrequests}/{crew.passengers_max}',
+            f'⚠ {user.full_name} left the crew.' if left else None
+        )
 
     except Exception as e:
         msg = 'Join request is failed. '\
@@ -1862,10 +2197,7 @@ async def list_user_archived_crews(
     user = await get_user(update, context)
     logger.info(f'TG: {user.telegram_id}')
 
-    crews = Crew.objects.filter(status=Crew.StatusVerbose.COMPLETED).filter(
-        Q(driver=user) | Q(join_requests__passenger=user)
-    )
-    context.user_data['user_archived_crews'] = crews
+    crews = get_archived_crews(user)
 
     msg = "The total number of Crews (Completed) you took part in: "\
         f"{await crews.acount()}\n\nPlease choose a Crew to upload track:"
@@ -1893,24 +2225,18 @@ async def display_user_archived_crew(
     query = update.callback_query
     await query.answer()
 
-    pk = int(query.data)
+    _, (pk,) = callback.decode(query.data)
     user = await get_user(update, context)
 
     logger.info(f'TG: {user.telegram_id}, pk: {pk}')
 
-    crew = await context.user_data['user_archived_crews']\
-        .select_related('departure', 'departure__search_request')\
-        .annotate(driver_tg_id=F('driver__telegram_id'))\
-        .prefetch_related('driver', 'passengers')\
-        .aget(pk=pk)
-
-    context.user_data['crew'] = crew
-
-    msg = await get_crew_detailed_info(crew, user.tz)
+    _, msg = await get_crew_view(get_archived_crews(user), pk, user.tz)
 
     buttons = [
         [
-            InlineKeyboardButton("☑️ Send track", callback_data=CS.SELECT)
+            InlineKeyboardButton(
+                "☑️ Send track", callback_data=callback.encode(CS.SELECT, pk)
+            )
         ],
         [
             InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
@@ -1934,7 +2260,10 @@ async def request_track(
     await query.delete_message()
 
     logger.info(f'TG: {update.effective_user.id}')
-    crew = context.user_data['crew']
+    user = await get_user(update, context)
+    _, (pk,) = callback.decode(query.data)
+    crew = await get_archived_crews(user).only('title').aget(pk=pk)
+    context.user_data['crew_id'] = crew.pk
 
     msg = "Please share the track file (.gpx) related to the crew"\
         f"'{crew.title}-{crew.id}' departure:"
@@ -1950,35 +2279,49 @@ async def receive_track(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE
 ) -> int:
-    """Recieve track."""
+    """
+    Recieve GPX track and save it to the crew tracks.
+
+    The file is downloaded to a temporary file and parsed as a stream,
+    so large files don't load into memory.
+    """
     user = await get_user(update, context)
-    crew = context.user_data['crew']
+    crew = await get_archived_crews(user).only('title', 'departure')\
+        .aget(pk=context.user_data['crew_id'])
 
     logger.info(f'TG: {user.telegram_id}')
 
-    upload_dir = f"share/dep_{crew.departure.id}/{crew.title}_{crew.id}/"
-    os.makedirs(upload_dir, exist_ok=True)
-
     new_file = await update.effective_message.effective_attachment.get_file()
 
     title = (
         user.nickname if user.nickname else user.full_name.replace(' ', '_')
-    ) + dt.datetime.now(dt.UTC).strftime('%Y.%m.%d_%H%m')\
-        + '.' + new_file.file_path.split('.')[-1]
-
-    await new_file.download_to_drive(
-        f'{upload_dir}/{title}'
-    )
+    ) + dt.datetime.now(dt.UTC).strftime('%Y.%m.%d_%H%m')
 
     buttons = [[
         InlineKeyboardButton("🔙 Back", callback_data=CS.BACK),
     ]]
 
     file_size = f'{new_file.file_size / 1024: .1f} Kb'
-    msg = f'Received track file: {file_size}'
+    try:
+        with tempfile.TemporaryFile() as gpx_file:
+            await new_file.download_to_memory(gpx_file)
+            gpx_file.seek(0)
+            track = await save_track(crew, user, gpx_file, title)
+
+        msg = f'Received track: {track.length / 1000:.1f} km'
+        if track.duration:
+            hours, minutes = divmod(
+                track.duration // dt.timedelta(minutes=1), 60
+            )
+            msg += f', {hours}h {minutes:02d}m'
+        msg += f', {track.points_count} points'
+
+    except (ParseError, ValueError) as e:
+        msg = f'Track file is not valid GPX: {e}'
+        logger.warning(f'Invalid GPX track. TG: {user.telegram_id}, {e}')
 
     logger.info(
-        f'TG: {user.telegram_id}, new_file: {title}, file_size: {file_size}'
+        f'TG: {user.telegram_id}, {msg}, file_size: {file_size}'
     )
 
     keyboard = InlineKeyboardMarkup(buttons)
@@ -1987,9 +2330,161 @@ async def receive_track(
     return CS.SHOWING
 
 
-def main() -> None:
-    """Run the bot."""
-    application = ApplicationBuilder().token(settings.TELEGRAM_TOKEN).build()
+async def sync_allowed_users(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Apply published changes of CustomUser Telegram IDs to filter_users."""
+    global allowed_user_event_id
+    events = await get_allowed_user_events(allowed_user_event_id)
+
+    for event_id, telegram_id, action in events:
+        if action == AllowedUserEvent.ActionVerbose.ADD:
+            allowed_users.add(telegram_id)
+            filter_users.add_user_ids(telegram_id)
+        else:
+            allowed_users.discard(telegram_id)
+            filter_users.remove_user_ids(telegram_id)
+
+        if event_id > allowed_user_event_id:
+            allowed_user_event_id = event_id
+            logger.info(f'Allowed users: {action} {telegram_id}')
+
+
+async def clean_allowed_user_events(
+        context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Delete old changes of allowed users."""
+    if deleted := await delete_allowed_user_events():
+        logger.info(f'Allowed user events deleted: {deleted}')
+
+
+async def handle_error(update: object,
+                       context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Log errors and report forged or outdated buttons to the user."""
+    if not isinstance(context.error, callback.InvalidCallbackData):
+        logger.error('Update handling error.', exc_info=context.error)
+        return
+
+    logger.warning(f'{context.error} TG: {update.effective_user.id}')
+    await update.effective_chat.send_message(
+        "The button is outdated. Return back to /start_conversation."
+    )
+
+
+async def touch_user_data(update: Update,
+                          context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Mark user_data of the user as recently used."""
+    if update.effective_user:
+        user_data_limiter.touch(context.application, update.effective_user.id)
+
+
+async def report_user_data_size(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Log the memory held by user_data and waits of update queues."""
+    stats = get_user_data_stats(context.application.user_data)
+    logger.info(
+        f"user_data: {stats['users']} users, {stats['total']} bytes, "
+        f"max {stats['max']} bytes (TG: {stats['max_user']}), "
+        f"evicted: {user_data_limiter.evicted}"
+    )
+
+    stats = context.application.update_processor.get_stats()
+    logger.info(
+        f"Update queues: {stats['users']} users, {stats['queued']} updates, "
+        f"wait avg {stats['wait_avg']:.3f}s, max {stats['wait_max']:.3f}s "
+        f"of {stats['waits']}, dropped: {stats['dropped']}"
+    )
+
+
+async def update_ops_board(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Edit the pinned operations board if it is changed."""
+    text = render_ops_board(await get_ops_board())
+    if await ops_board.update(context.bot, text):
+        logger.info(f'Ops board is updated: {ops_board.message_id}')
+
+
+async def drain_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send pending notifications of the outbox."""
+    report = await outbox.drain(context.bot)
+    if report.delivered or report.failed:
+        logger.info(
+            f'Outbox is drained: {report}, latency: {outbox.latency:.2f}s'
+        )
+
+
+async def clean_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Delete outbox messages sent a day ago."""
+    if deleted := await delete_sent_messages(dt.timedelta(days=1)):
+        logger.info(f'Outbox messages deleted: {deleted}')
+
+
+async def probe_reachability(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Check if unreachable users have unblocked the bot."""
+    report = await reachability.probe(
+        context.bot,
+        max_age=dt.timedelta(seconds=settings.REACHABILITY_PROBE_INTERVAL),
+    )
+    logger.info(f'Reachability is probed: {report}')
+
+
+async def post_stop(application: Application) -> None:
+    """Send pending notifications while the bot is still running."""
+    await coalescer.flush()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release resources after the application is stopped."""
+    db_pool.shutdown()
+
+
+def build_application(updater: bool = True) -> Application:
+    """Build the bot application with all handlers registered."""
+    persistence = DatabasePersistence(
+        update_interval=settings.BOT_PERSISTENCE_INTERVAL,
+        max_age=dt.timedelta(seconds=settings.CONVERSATION_TIMEOUT),
+    )
+    builder = ApplicationBuilder()\
+        .token(settings.TELEGRAM_TOKEN)\
+        .persistence(persistence)\
+        .concurrent_updates(UserUpdateProcessor(
+            settings.BOT_CONCURRENT_UPDATES,
+            max_queue=settings.USER_UPDATE_QUEUE_SIZE,
+        ))\
+        .post_stop(post_stop)\
+        .post_shutdown(post_shutdown)
+
+    if not updater:
+        # Updates are put to the bounded update_queue by the webhook view
+        builder = builder.updater(None)\
+            .update_queue(asyncio.Queue(maxsize=settings.WEBHOOK_QUEUE_SIZE))
+
+    application = builder.build()
+
+    application.job_queue.run_repeating(
+        sync_allowed_users,
+        interval=settings.ALLOWED_USERS_SYNC_INTERVAL,
+    )
+    application.job_queue.run_repeating(
+        clean_allowed_user_events,
+        interval=dt.timedelta(hours=1),
+    )
+    application.job_queue.run_repeating(
+        report_user_data_size,
+        interval=settings.USER_DATA_STATS_INTERVAL,
+    )
+    application.job_queue.run_repeating(
+        drain_outbox,
+        interval=settings.OUTBOX_INTERVAL,
+    )
+    application.job_queue.run_repeating(
+        clean_outbox,
+        interval=dt.timedelta(hours=1),
+    )
+    application.job_queue.run_repeating(
+        probe_reachability,
+        interval=settings.REACHABILITY_PROBE_INTERVAL,
+    )
+    if ops_board:
+        application.job_queue.run_repeating(
+            update_ops_board,
+            interval=settings.OPS_BOARD_INTERVAL,
+        )
 
     unknown_handler = MessageHandler(filters.COMMAND, unknown)
     start_handler = CommandHandler('start', start)
@@ -2000,8 +2495,10 @@ def main() -> None:
     help_handler = CommandHandler('help', help_command)
 
     crew_action_handler = ConversationHandler(
+        name='crew_action',
+        persistent=True,
         entry_points=[CallbackQueryHandler(
-            receive_departure, pattern=f"^{CS.SELECT}$"
+            receive_departure, pattern=callback.pattern(CS.SELECT)
         )],
 
         states={
@@ -2045,6 +2542,7 @@ def main() -> None:
         },
 
         fallbacks=[CommandHandler("cancel", stop_nested)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
         map_to_parent={
             CS.STOPPING: CS.END,
             CS.SHOWING: CS.SHOWING
@@ -2052,6 +2550,8 @@ def main() -> None:
     )
 
     crew_archive_handler = ConversationHandler(
+        name='crew_archive',
+        persistent=True,
         entry_points=[CallbackQueryHandler(
             list_user_archived_crews,
             pattern=f"^{CS.CREW_ARCHIVE}$"
@@ -2062,7 +2562,8 @@ def main() -> None:
                 CallbackQueryHandler(display_user_archived_crew)
             ],
             CS.SELECT_ITEM_ACTION: [
-                CallbackQueryHandler(request_track, pattern=f"^{CS.SELECT}$"),
+                CallbackQueryHandler(request_track,
+                                     pattern=callback.pattern(CS.SELECT)),
                 CallbackQueryHandler(list_user_archived_crews,
                                      pattern=f'^{CS.BACK}$'),
                 CallbackQueryHandler(stop_nested, pattern=f"^{CS.STOPPING}$")
@@ -2076,6 +2577,7 @@ def main() -> None:
 
         },
         fallbacks=[CommandHandler("cancel", stop_nested)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
         map_to_parent={
             CS.STOPPING: CS.STOPPING,
             CS.SHOWING: CS.SHOWING,
@@ -2084,6 +2586,8 @@ def main() -> None:
     )
 
     crew_joining_handler = ConversationHandler(
+        name='crew_joining',
+        persistent=True,
         entry_points=[CallbackQueryHandler(
             list_public_crews,
             pattern=f"^({CS.CREW_JOINING}|{CS.CREW_MANAGE_JOINED})$"
@@ -2091,18 +2595,22 @@ def main() -> None:
 
         states={
             CS.DISPLAY_ITEM: [
+                CallbackQueryHandler(list_public_crews,
+                                     pattern=f'^{CS.LIST_ITEM}$'),
                 CallbackQueryHandler(display_crew_for_passenger)
             ],
             CS.SELECT_ITEM_ACTION: [
-                CallbackQueryHandler(apply_to_crew, pattern=f"^{CS.SELECT}$"),
+                CallbackQueryHandler(apply_to_crew,
+                                     pattern=callback.pattern(CS.SELECT)),
                 CallbackQueryHandler(exempt_from_crew,
-                                     pattern=f"^{CS.DELETE}$"),
+                                     pattern=callback.pattern(CS.DELETE)),
                 CallbackQueryHandler(list_public_crews,
                                      pattern=f'^{CS.BACK}$'),
                 CallbackQueryHandler(stop_nested, pattern=f"^{CS.END}$")
             ],
         },
         fallbacks=[CommandHandler("cancel", stop_nested)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
         map_to_parent={
             CS.STOPPING: CS.STOPPING,
             CS.SHOWING: CS.SHOWING
@@ -2110,6 +2618,8 @@ def main() -> None:
     )
 
     crew_update_handler = ConversationHandler(
+        name='crew_update',
+        persistent=True,
         entry_points=[CallbackQueryHandler(
             list_crews, pattern=f"^{CS.CREW_UPDATE}$"
         )],
@@ -2124,33 +2634,41 @@ def main() -> None:
             CS.SELECT_ITEM_ACTION: [
                 crew_action_handler,
                 CallbackQueryHandler(crew_delete_confirmation,
-                                     pattern=f"^{CS.DELETE}$"),
+                                     pattern=callback.pattern(CS.DELETE)),
                 CallbackQueryHandler(crew_change_status,
-                                     pattern=f"^{CS.STATUS}$"),
-                CallbackQueryHandler(list_passengers,
-                                     pattern=f"^{CS.CREW_MANAGE_PASSENGERS}$"),
+                                     pattern=callback.pattern(CS.STATUS)),
+                CallbackQueryHandler(
+                    list_passengers,
+                    pattern=callback.pattern(CS.CREW_MANAGE_PASSENGERS)
+                ),
                 CallbackQueryHandler(list_crews, pattern=f"^{CS.BACK}$"),
                 CallbackQueryHandler(stop_nested, pattern=f"^{CS.END}$")
             ],
             CS.CREW_MANAGE_PASSENGERS: [
-                CallbackQueryHandler(list_passengers,
-                                     pattern=f"^{CS.CREW_MANAGE_PASSENGERS}$"),
+                CallbackQueryHandler(
+                    list_passengers,
+                    pattern=callback.pattern(CS.CREW_MANAGE_PASSENGERS)
+                ),
                 CallbackQueryHandler(accept_join_request,
-                                     pattern=f"^{CS.ACCEPT}$"),
+                                     pattern=callback.pattern(CS.ACCEPT)),
                 CallbackQueryHandler(reject_join_request,
-                                     pattern=f"^{CS.REJECT}$"),
-                CallbackQueryHandler(display_crew, pattern=f"^{CS.BACK}$"),
+                                     pattern=callback.pattern(CS.REJECT)),
+                CallbackQueryHandler(display_crew,
+                                     pattern=callback.pattern(CS.BACK)),
                 CallbackQueryHandler(stop_nested, pattern=f"^{CS.END}$"),
                 CallbackQueryHandler(display_passenger),
             ],
 
             CS.DELETE: [
-                CallbackQueryHandler(crew_delete, pattern=f"^{CS.DELETE}$"),
-                CallbackQueryHandler(display_crew, pattern=f"^{CS.BACK}$"),
+                CallbackQueryHandler(crew_delete,
+                                     pattern=callback.pattern(CS.DELETE)),
+                CallbackQueryHandler(display_crew,
+                                     pattern=callback.pattern(CS.BACK)),
             ],
         },
 
         fallbacks=[CommandHandler("cancel", stop_nested)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
         map_to_parent={
             CS.STOPPING: CS.END,
             CS.SHOWING: CS.SHOWING
@@ -2158,6 +2676,8 @@ def main() -> None:
     )
 
     crew_create_handler = ConversationHandler(
+        name='crew_create',
+        persistent=True,
         entry_points=[CallbackQueryHandler(
             list_departures, pattern=f"^{CS.CREW_CREATION}$")],
 
@@ -2171,6 +2691,7 @@ def main() -> None:
         },
 
         fallbacks=[CommandHandler("cancel", stop_nested)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
         map_to_parent={
             CS.STOPPING: CS.END,
             CS.SHOWING: CS.SHOWING
@@ -2178,6 +2699,8 @@ def main() -> None:
     )
 
     action_handler = ConversationHandler(
+        name='action',
+        persistent=True,
         entry_points=[
             CommandHandler("start_conversation", start_conversation)
         ],
@@ -2233,10 +2756,18 @@ def main() -> None:
                 ),
             ],
             CS.STOPPING: [CallbackQueryHandler(start_conversation)],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, end_idle_conversation)
+            ],
         },
         fallbacks=[CommandHandler("cancel", stop)],
+        conversation_timeout=settings.CONVERSATION_TIMEOUT,
     )
 
+    # Runs before the other handlers for every update
+    application.add_handler(TypeHandler(Update, admission.check), group=-2)
+    application.add_handler(TypeHandler(Update, touch_user_data), group=-1)
+
     application.add_handler(start_handler)
     application.add_handler(restart_handler)
     application.add_handler(restrict_handler)
@@ -2247,8 +2778,21 @@ def main() -> None:
 
     # unknown_handler has to be the last one
     application.add_handler(unknown_handler)
+    application.add_error_handler(handle_error)
+
+    return application
+
+
+def main() -> None:
+    """Run the bot."""
+    if settings.BOT_MODE == 'webhook':
+        raise SystemExit(
+            'BOT_MODE is `webhook`: the bot is served by ASGI application '
+            '`web_dashboard.asgi`. Use `make bot-webhook`.'
+        )
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application = build_application()
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,425 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Protocol
+
+from telegram import Bot, error
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API limits:
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_RATE = 30  # messages per second for the whole bot
+CHAT_RATE = 1  # messages per second for a single chat
+CONCURRENCY = 30
+MAX_RETRIES = 3
+BACKOFF = 0.5  # seconds, doubled on every retry
+COALESCE_WINDOW = 10  # seconds to collect notifications into one message
+
+
+class TokenBucket:
+    """Asynchronous token bucket: `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    @property
+    def is_full(self) -> bool:
+        """Return True if the bucket is fully refilled (idle)."""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens without waiting. Return False if there are too few."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until tokens are available and take them."""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so the next token is available after `seconds`."""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class DeliveryStatus(Enum):
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    BLOCKED = 'blocked'
+    DEACTIVATED = 'deactivated'
+    SKIPPED = 'skipped'
+
+
+def get_forbidden_status(e: error.Forbidden) -> DeliveryStatus:
+    """Return status of the chat the bot is forbidden to write to."""
+    if 'deactivated' in e.message:
+        return DeliveryStatus.DEACTIVATED
+    return DeliveryStatus.BLOCKED
+
+
+class Registry(Protocol):
+    """Reachability of chats consulted by broadcasts."""
+
+    def is_reachable(self, chat_id: int) -> bool:
+        """Return False if messages to the chat can't be delivered."""
+
+    async def record(self, report: 'BroadcastReport') -> None:
+        """Remember delivery results of the broadcast."""
+
+
+@dataclass
+class BroadcastReport:
+    """Result of a broadcast: chat ids grouped by delivery status."""
+    delivered: list[int] = field(default_factory=list)
+    failed: list[int] = field(default_factory=list)
+    blocked: list[int] = field(default_factory=list)
+    deactivated: list[int] = field(default_factory=list)
+    skipped: list[int] = field(default_factory=list)
+    elapsed: float = 0
+
+    def add(self, chat_id: int, status: DeliveryStatus) -> None:
+        getattr(self, status.value).append(chat_id)
+
+    def __str__(self) -> str:
+        return (
+            f'delivered: {len(self.delivered)}, failed: {len(self.failed)}, '
+            f'blocked: {len(self.blocked)}, '
+            f'deactivated: {len(self.deactivated)}, '
+            f'skipped: {len(self.skipped)}, elapsed: {self.elapsed:.2f}s'
+        )
+
+
+class Broadcaster:
+    """
+    Send messages concurrently within the global and per-chat rate limits.
+
+    `RetryAfter` pauses the global bucket for the requested time, network
+    errors are retried with exponential backoff. Broadcasts skip chats
+    unreachable by `registry` and report delivery results to it.
+    """
+
+    def __init__(
+        self,
+        rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        concurrency: int = CONCURRENCY,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF,
+        registry: Registry | None = None,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.registry = registry
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+
+        self._bucket = TokenBucket(rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._semaphore = None
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10_000:
+                self._chat_buckets = {
+                    k: v for k, v in self._chat_buckets.items()
+                    if not v.is_full
+                }
+            bucket = TokenBucket(self.chat_rate, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def send(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        **kwargs
+    ) -> DeliveryStatus:
+        """Send a single message respecting limits. Return delivery status."""
+        status, _ = await self.deliver(bot, chat_id, text, **kwargs)
+        return status
+
+    async def deliver(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        message_id: int | None = None,
+        **kwargs
+    ) -> tuple[DeliveryStatus, int | None]:
+        """
+        Edit the message or send a new one if there is no message to edit.
+        Return delivery status and id of the delivered message.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                await self._get_chat_bucket(chat_id).acquire()
+                await self._bucket.acquire()
+                try:
+                    if message_id is None:
+                        message = await bot.send_message(
+                            chat_id=chat_id, text=text, **kwargs
+                        )
+                        return DeliveryStatus.DELIVERED, message.message_id
+
+                    await bot.edit_message_text(
+                        text, chat_id=chat_id, message_id=message_id,
+                        **kwargs
+                    )
+                    return DeliveryStatus.DELIVERED, message_id
+
+                except error.RetryAfter as e:
+                    logger.warning(
+                        f'Flood control: retry after {e.retry_after}s. '
+                        f'TG: {chat_id}'
+                    )
+                    self._bucket.pause(float(e.retry_after))
+                    continue
+
+                except error.Forbidden as e:
+                    logger.warning(f'Chat is unreachable. TG: {chat_id}, {e}')
+                    return get_forbidden_status(e), None
+
+                except error.BadRequest as e:
+                    if message_id is not None:
+                        if 'not modified' in e.message:
+                            return DeliveryStatus.DELIVERED, message_id
+                        # The message is deleted or too old to be edited
+                        message_id = None
+                        continue
+
+                    logger.warning(f'Message is rejected. TG: {chat_id}, {e}')
+                    return DeliveryStatus.FAILED, None
+
+                except (error.TimedOut, error.NetworkError) as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        logger.warning(
+                            f'Message is not delivered after {attempt} '
+                            f'attempts. TG: {chat_id}, Error: {e}'
+                        )
+                        return DeliveryStatus.FAILED, None
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+                except Exception as e:
+                    logger.warning(
+                        "Unexpected error. User doesn't receive broadcast msg."
+                        f' TG: {chat_id}, Error: {e}'
+                    )
+                    return DeliveryStatus.FAILED, None
+
+    async def broadcast(
+        self,
+        bot: Bot,
+        chat_ids: list[int],
+        text: str,
+        **kwargs
+    ) -> BroadcastReport:
+        """Send the message to every chat concurrently and report results."""
+        report, _ = await self.announce(
+            bot, dict.fromkeys(chat_ids), text, **kwargs
+        )
+        return report
+
+    async def announce(
+        self,
+        bot: Bot,
+        messages: dict[int, int | None],
+        text: str,
+        **kwargs
+    ) -> tuple[BroadcastReport, dict[int, int]]:
+        """
+        Edit the previous message of every chat or send a new one.
+
+        `messages` maps chat ids to ids of their previous messages (None if
+        there is none). Return the report and ids of delivered messages.
+        """
+        start = time.monotonic()
+        report = BroadcastReport()
+
+        if self.registry is not None:
+            reachable = {}
+            for chat_id, message_id in messages.items():
+                if self.registry.is_reachable(chat_id):
+                    reachable[chat_id] = message_id
+                else:
+                    report.add(chat_id, DeliveryStatus.SKIPPED)
+            messages = reachable
+
+        results = await asyncio.gather(*(
+            self.deliver(bot, chat_id, text, message_id, **kwargs)
+            for chat_id, message_id in messages.items()
+        ))
+
+        delivered = {}
+        for chat_id, (status, message_id) in zip(messages, results):
+            report.add(chat_id, status)
+            if message_id is not None:
+                delivered[chat_id] = message_id
+        report.elapsed = time.monotonic() - start
+
+        if self.registry is not None:
+            await self.registry.record(report)
+        return report, delivered
+
+
+@dataclass
+class CrewDigest:
+    """Join request changes of a crew merged into one driver message."""
+    crew: str
+    joined: int = 0
+    left: int = 0
+    total: str = ''
+    notes: list[str] = field(default_factory=list)
+
+    def add(self, delta: int, total: str, note: str | None = None) -> None:
+        if delta > 0:
+            self.joined += delta
+        else:
+            self.left -= delta
+        self.total = total
+        if note:
+            self.notes.append(note)
+
+    def __str__(self) -> str:
+        changes = [
+            f'{sign}{count}' for sign, count in
+            (('+', self.joined), ('–', self.left)) if count
+        ]
+        plural = 's' if self.joined + self.left > 1 else ''
+        emoji = '🟢' if self.joined >= self.left else '🔴'
+        return '\n'.join([
+            f"{emoji} Crew '{self.crew}': {', '.join(changes)} "
+            f"join request{plural}! ({self.total})",
+            *self.notes,
+        ])
+
+
+class Coalescer:
+    """
+    Delay notifications for `window` seconds to send them merged.
+
+    Join request changes of a crew are merged into one digest per driver,
+    a pending broadcast is replaced by a newer one with the same key.
+    """
+
+    def __init__(self, broadcaster: Broadcaster,
+                 window: float = COALESCE_WINDOW) -> None:
+        self.broadcaster = broadcaster
+        self.window = window
+        self.events = 0
+        self.sent = 0
+
+        self._pending: dict[Hashable, tuple] = {}
+        # tasks waiting for the window and tasks sending after it
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._sending: set[asyncio.Task] = set()
+
+    def count_join_requests(
+        self,
+        bot: Bot,
+        chat_id: int,
+        crew_id: int,
+        title: str,
+        delta: int,
+        total: str,
+        note: str | None = None,
+    ) -> None:
+        """
+        Add the change of crew join requests to the driver digest.
+
+        Digests are merged by the crew id, the latest title is shown.
+        """
+        key = ('crew', chat_id, crew_id)
+        if key not in self._pending:
+            self._pending[key] = (bot, [chat_id], CrewDigest(title), None)
+        digest = self._pending[key][2]
+        digest.crew = title
+        digest.add(delta, total, note)
+        self._schedule(key)
+
+    def broadcast(
+        self,
+        bot: Bot,
+        key: Hashable,
+        chat_ids: Iterable[int],
+        text: str,
+        send: Callable[[Bot, list[int], str], Awaitable] | None = None,
+    ) -> None:
+        """
+        Send the message to the chats unless superseded within window.
+
+        A newer message with the key replaces the text, recipients of both
+        are kept. `send` replaces Broadcaster.broadcast.
+        """
+        key = ('broadcast', key)
+        if key in self._pending:
+            chat_ids = [*self._pending[key][1], *chat_ids]
+        self._pending[key] = (bot, list(dict.fromkeys(chat_ids)), text, send)
+        self._schedule(key)
+
+    def _schedule(self, key: Hashable) -> None:
+        self.events += 1
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._send_later(key))
+
+    async def _send_later(self, key: Hashable) -> None:
+        await asyncio.sleep(self.window)
+        # Newer events of the key are scheduled anew while it is sent
+        del self._tasks[key]
+        task = asyncio.current_task()
+        self._sending.add(task)
+        try:
+            await self._send(key)
+        finally:
+            self._sending.discard(task)
+
+    async def _send(self, key: Hashable) -> None:
+        bot, chat_ids, message, send = self._pending.pop(key)
+        send = send or self.broadcaster.broadcast
+        report = await send(bot, chat_ids, str(message))
+        self.sent += len(chat_ids)
+        logger.info(
+            f'Notification is sent: {report} '
+            f'(total events: {self.events}, messages: {self.sent})'
+        )
+
+    async def flush(self) -> None:
+        """
+        Send pending notifications without waiting for the window and wait
+        for the ones being sent.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        await asyncio.gather(
+            *map(self._send, list(self._pending)), *self._sending,
+            return_exceptions=True
+        )
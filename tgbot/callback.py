@@ -0,0 +1,50 @@
+import re
+
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36
+
+MAX_LENGTH = 64  # Telegram limit of callback_data in bytes
+SIGNATURE_LENGTH = 10  # hex chars of HMAC kept in callback_data
+SEPARATOR = ':'
+SALT = 'tgbot.callback'
+
+
+class InvalidCallbackData(ValueError):
+    """Callback data is malformed or its signature is wrong."""
+
+
+def sign(payload: str) -> str:
+    """Return short HMAC signature of the payload."""
+    return salted_hmac(SALT, payload, algorithm='sha256')\
+        .hexdigest()[:SIGNATURE_LENGTH]
+
+
+def encode(action: str, *ids: int) -> str:
+    """
+    Return signed callback_data carrying action and entity ids.
+
+    Ids are base36 encoded: `action:id:...:signature`.
+    """
+    payload = SEPARATOR.join([action, *map(int_to_base36, ids)])
+    data = f'{payload}{SEPARATOR}{sign(payload)}'
+    if len(data.encode()) > MAX_LENGTH:
+        raise ValueError(f'Callback data is too long: {data}')
+    return data
+
+
+def decode(data: str) -> tuple[str, list[int]]:
+    """Return action and ids of signed callback_data."""
+    payload, separator, signature = data.rpartition(SEPARATOR)
+    if not separator or not constant_time_compare(signature, sign(payload)):
+        raise InvalidCallbackData(f'Invalid callback data: {data!r}')
+
+    action, *ids = payload.split(SEPARATOR)
+    try:
+        return action, [base36_to_int(pk) for pk in ids]
+    except ValueError:
+        raise InvalidCallbackData(f'Invalid callback data: {data!r}')
+
+
+def pattern(action: str) -> str:
+    """Return CallbackQueryHandler pattern of the action with or w/o ids."""
+    return f'^{re.escape(action)}(?:{SEPARATOR}|$)'
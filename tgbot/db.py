@@ -0,0 +1,67 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePool:
+    """
+    Run ORM calls in a pool of threads, each one holding its own connection.
+
+    Django async ORM methods (`aget`, `acount`, ...) run every query in a
+    single thread shared by all users. The pool lets independent queries of
+    different users run in parallel. `size=0` keeps the default behaviour.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._executor = None
+        if size:
+            self._executor = ThreadPoolExecutor(
+                max_workers=size,
+                thread_name_prefix='bot-db',
+            )
+
+    @staticmethod
+    def _call(func, *args, **kwargs):
+        """Call func closing expired or broken connection of the thread."""
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    async def run(self, func, *args, **kwargs):
+        """Run sync function with ORM calls and return its result."""
+        if self._executor is None:
+            return await sync_to_async(func)(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._call, func, *args, **kwargs)
+        )
+
+    def shutdown(self) -> None:
+        """Wait for running queries and stop the threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            logger.info('Database pool is stopped.')
+
+
+db_pool = DatabasePool(settings.BOT_DB_POOL_SIZE)
+
+
+def run_in_pool(func):
+    """Decorator makes an async function running func in the database pool."""
+
+    @functools.wraps(func)
+    async def _wrapped_func(*args, **kwargs):
+        return await db_pool.run(func, *args, **kwargs)
+    return _wrapped_func
@@ -0,0 +1,193 @@
+import asyncio
+import datetime as dt
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from django.utils import timezone
+from yandex_geocoder import Client
+
+from web_dashboard.bot_api.models import GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 1024
+CACHE_TTL = dt.timedelta(days=30)
+
+
+def normalize_address(address: str) -> str:
+    """Return address in a canonical form to be used as a cache key."""
+    address = address.lower().replace('ё', 'е')
+    address = re.sub(r'\s*([,;.])\s*', r'\1 ', address)
+    address = re.sub(r'\s+', ' ', address)
+    return address.strip(' ,;.')[:255]
+
+
+def normalize_coordinates(lat: float, lon: float) -> str:
+    """Return coordinates rounded to ~1 m as a cache key."""
+    return f'{lat:.5f},{lon:.5f}'
+
+
+class GeocoderBackend(Protocol):
+    """Synchronous geocoder. Methods are called outside of the event loop."""
+
+    def coordinates(self, address: str) -> tuple[float, float]:
+        """Return (latitude, longitude) of the address."""
+
+    def address(self, lat: float, lon: float) -> str:
+        """Return address of the coordinates."""
+
+
+class YandexBackend:
+    """Yandex geocoder API backend."""
+
+    def __init__(self, api_key: str | None) -> None:
+        self.client = Client(api_key)
+
+    def coordinates(self, address: str) -> tuple[float, float]:
+        lon, lat = map(float, self.client.coordinates(address))
+        return lat, lon
+
+    def address(self, lat: float, lon: float) -> str:
+        return self.client.address(lon, lat)
+
+
+class StubBackend:
+    """Offline backend resolving only known addresses. Useful for tests."""
+
+    def __init__(self, places: dict[str, tuple[float, float]] = None) -> None:
+        self.places = {
+            normalize_address(address): psn
+            for address, psn in (places or {}).items()
+        }
+        self.calls = 0
+
+    def coordinates(self, address: str) -> tuple[float, float]:
+        self.calls += 1
+        try:
+            return self.places[normalize_address(address)]
+        except KeyError:
+            raise ValueError(f'Nothing found for "{address}"')
+
+    def address(self, lat: float, lon: float) -> str:
+        self.calls += 1
+        for address, psn in self.places.items():
+            if normalize_coordinates(*psn) == normalize_coordinates(lat, lon):
+                return address
+        return normalize_coordinates(lat, lon)
+
+
+class LRUCache:
+    """Bounded in-memory cache with expiration."""
+
+    def __init__(self, maxsize: int, ttl: dt.timedelta) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl.total_seconds()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class GeocodingService:
+    """
+    Async geocoder with two cache levels: in-memory LRU and DB table.
+
+    Backend requests run in a separate thread and never block event loop.
+    """
+
+    def __init__(
+        self,
+        backend: GeocoderBackend,
+        cache_size: int = CACHE_SIZE,
+        ttl: dt.timedelta = CACHE_TTL,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self._cache = LRUCache(cache_size, ttl)
+
+    async def _get_stored(self, kind: str, query: str) -> GeocodeCache | None:
+        return await GeocodeCache.objects.filter(
+            kind=kind,
+            query=query,
+            updated_at__gte=timezone.now() - self.ttl,
+        ).afirst()
+
+    async def _store(self, kind: str, query: str, lat: float, lon: float,
+                     address: str = '') -> None:
+        try:
+            await GeocodeCache.objects.aupdate_or_create(
+                kind=kind,
+                query=query,
+                defaults={
+                    'latitude': lat,
+                    'longitude': lon,
+                    'address': address[:255],
+                }
+            )
+        except Exception as e:
+            logger.warning(f'Geocode result is not stored: {query}, {e}')
+
+    async def coordinates(self, address: str) -> tuple[float, float]:
+        """Return (latitude, longitude) of the address."""
+        kind = GeocodeCache.KindVerbose.FORWARD
+        query = normalize_address(address)
+
+        if psn := self._cache.get((kind, query)):
+            return psn
+
+        if stored := await self._get_stored(kind, query):
+            psn = stored.latitude, stored.longitude
+        else:
+            psn = await asyncio.to_thread(self.backend.coordinates, query)
+            await self._store(kind, query, *psn, address=address)
+            logger.info(f'Geocoded: `{query}` -> {psn}')
+
+        self._cache.set((kind, query), psn)
+        return psn
+
+    async def address(self, lat: float, lon: float) -> str:
+        """Return address of the coordinates."""
+        kind = GeocodeCache.KindVerbose.REVERSE
+        query = normalize_coordinates(lat, lon)
+
+        if address := self._cache.get((kind, query)):
+            return address
+
+        if stored := await self._get_stored(kind, query):
+            address = stored.address
+        else:
+            address = await asyncio.to_thread(self.backend.address, lat, lon)
+            await self._store(kind, query, lat, lon, address=address)
+            logger.info(f'Reverse geocoded: {query} -> `{address}`')
+
+        self._cache.set((kind, query), address)
+        return address
+
+
+def get_backend(name: str, api_key: str | None = None) -> GeocoderBackend:
+    """Return geocoder backend by name."""
+    match name:
+        case 'yandex':
+            return YandexBackend(api_key)
+        case 'stub':
+            return StubBackend()
+    raise ValueError(f'Unknown geocoder backend: {name}')
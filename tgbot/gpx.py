@@ -0,0 +1,142 @@
+import datetime as dt
+import math
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import BinaryIO
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, LineString
+
+from web_dashboard.logistics.models import Crew, Track
+from web_dashboard.users.models import CustomUser
+from tgbot.db import run_in_pool
+
+EARTH_RADIUS = 6_371_000  # metres
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Return distance (m) between two points on the Earth surface."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2)\
+        * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+@dataclass
+class GpxTrack:
+    """Points of all track segments of a GPX file joined into one path."""
+    name: str = ''
+    # flat longitude, latitude pairs: 16 bytes per point
+    coords: array = field(default_factory=lambda: array('d'))
+    length: float = 0
+    started_at: dt.datetime | None = None
+    finished_at: dt.datetime | None = None
+
+    @property
+    def points_count(self) -> int:
+        return len(self.coords) // 2
+
+    def get_path(self) -> LineString:
+        """Return the path built from WKB without Python point objects."""
+        coords = self.coords
+        if sys.byteorder == 'big':
+            coords = array('d', coords)
+            coords.byteswap()
+        wkb = struct.pack('<BII', 1, 2, self.points_count) + coords.tobytes()
+        return GEOSGeometry(memoryview(wkb), srid=4326)
+
+
+def get_tag(element) -> str:
+    """Return the tag name without the GPX namespace."""
+    return element.tag.rpartition('}')[2]
+
+
+def parse_time(value: str | None) -> dt.datetime | None:
+    try:
+        return dt.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_gpx(file: BinaryIO | str) -> GpxTrack:
+    """
+    Return the track of the GPX file parsed element by element.
+
+    Parsed points are dropped from the tree, so only the coordinates are
+    kept in memory whatever the size of the file. Raise ValueError if
+    there are less than two track points or a point is invalid.
+    """
+    track = GpxTrack()
+    coords = track.coords
+    parents = []
+    point_time = first_time = last_time = None
+
+    for event, element in iterparse(file, events=('start', 'end')):
+        tag = get_tag(element)
+        if event == 'start':
+            parents.append(element)
+            if tag == 'trkpt':
+                point_time = None
+            continue
+        parents.pop()
+
+        match tag:
+            case 'time':
+                point_time = element.text
+
+            case 'name' if not track.name and element.text:
+                track.name = element.text.strip()
+
+            case 'trkpt':
+                try:
+                    lon = float(element.get('lon'))
+                    lat = float(element.get('lat'))
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        f'Invalid track point: {element.attrib}'
+                    ) from None
+
+                if coords:
+                    track.length += haversine(coords[-2], coords[-1], lon, lat)
+                coords.extend((lon, lat))
+
+                if point_time:
+                    first_time = first_time or point_time
+                    last_time = point_time
+                parents[-1].clear()
+
+    if track.points_count < 2:
+        raise ValueError('GPX file has less than two track points.')
+
+    track.started_at = parse_time(first_time)
+    track.finished_at = parse_time(last_time)
+    return track
+
+
+@run_in_pool
+def save_track(crew: Crew, user: CustomUser, file: BinaryIO | str,
+               name: str = '') -> Track:
+    """
+    Parse the GPX file and save it as the crew track of the user.
+
+    The simplified path keeps points deviating more than
+    TRACK_SIMPLIFY_TOLERANCE (m) from the straight line.
+    """
+    gpx = parse_gpx(file)
+    path = gpx.get_path()
+    tolerance = settings.TRACK_SIMPLIFY_TOLERANCE / 111_320
+
+    return Track.objects.create(
+        crew=crew,
+        user=user,
+        name=(gpx.name or name)[:255],
+        path=path,
+        simplified=path.simplify(tolerance),
+        points_count=gpx.points_count,
+        length=gpx.length,
+        started_at=gpx.started_at,
+        finished_at=gpx.finished_at,
+    )
@@ -0,0 +1,94 @@
+import logging
+
+from django.utils import timezone
+from telegram import Bot, error
+
+from tgbot.announcements import get_text_hash
+from tgbot.broadcast import Broadcaster, DeliveryStatus
+
+logger = logging.getLogger(__name__)
+
+# Telegram limit of message text without the room for update time
+MAX_LENGTH = 4096 - 32
+
+
+def render_ops_board(search_requests: list[dict]) -> str:
+    """Return board text of search requests with departures and crews."""
+    lines = [
+        '📋 Operations board 📋',
+        f'Search requests: {len(search_requests)}, departures: '
+        f"{sum(sreq['departures_count'] for sreq in search_requests)}",
+    ]
+    for sreq in search_requests:
+        lines.extend([
+            '',
+            f"🔎 {sreq['full_name']} ({sreq['city']}), "
+            f"departures: {sreq['departures_count']}",
+            f"🟢 Available: {sreq['available']} "
+            f"({sreq['passengers']}/{sreq['seats']} seats taken)",
+            f"🚗 On mission: {sreq['on_mission']}, "
+            f"↩️ Returning: {sreq['returning']}",
+        ])
+
+    text = '\n'.join(lines)
+    if len(text) > MAX_LENGTH:
+        text = text[:MAX_LENGTH - 1] + '…'
+    return text
+
+
+class OpsBoard:
+    """
+    One pinned message in the coordination chat showing the latest board.
+
+    The message is edited only when the board changes. After a restart the
+    board is found as the message of the bot pinned in the chat.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, chat_id: int) -> None:
+        self.broadcaster = broadcaster
+        self.chat_id = chat_id
+        self.message_id = None
+
+        self._text_hash = None
+        self._pinned_loaded = False
+
+    async def _load_pinned(self, bot: Bot) -> None:
+        try:
+            chat = await bot.get_chat(self.chat_id)
+        except error.TelegramError as e:
+            logger.warning(f'Ops board chat is not available: {e}')
+            return
+
+        pinned = chat.pinned_message
+        if pinned and pinned.from_user and pinned.from_user.id == bot.id:
+            self.message_id = pinned.message_id
+        self._pinned_loaded = True
+
+    async def update(self, bot: Bot, text: str) -> bool:
+        """Show the text on the board. Return False if it is not changed."""
+        text_hash = get_text_hash(text)
+        if text_hash == self._text_hash:
+            return False
+
+        if not self._pinned_loaded:
+            await self._load_pinned(bot)
+
+        updated_at = timezone.localtime().strftime('%d.%m %H:%M')
+        status, message_id = await self.broadcaster.deliver(
+            bot, self.chat_id, f'{text}\n\nUpdated: {updated_at}',
+            self.message_id
+        )
+        if status is not DeliveryStatus.DELIVERED:
+            return False
+
+        if message_id != self.message_id:
+            self.message_id = message_id
+            try:
+                await bot.pin_chat_message(
+                    self.chat_id, message_id, disable_notification=True
+                )
+            except error.TelegramError as e:
+                logger.warning(f'Ops board is not pinned: {e}')
+
+        self._text_hash = text_hash
+        return True
@@ -0,0 +1,189 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+from collections.abc import Callable, Iterable
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from telegram import Bot
+
+from web_dashboard.bot_api.models import OutboxMessage
+from tgbot.broadcast import Broadcaster, BroadcastReport, DeliveryStatus
+from tgbot.db import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+BACKOFF = 5  # seconds before the first retry, doubled after each attempt
+LEASE = 60  # seconds a taken batch is hidden from other workers
+
+Status = OutboxMessage.StatusVerbose
+
+
+def enqueue(chat_ids: Iterable[int], text: str,
+            key: str | None = None) -> None:
+    """
+    Save the message to the chats, once per chat for the same key.
+
+    Call it in the transaction of the change the message reports.
+    """
+    OutboxMessage.objects.bulk_create(
+        [
+            OutboxMessage(chat_id=chat_id, text=text, key=key)
+            for chat_id in chat_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+@run_in_pool
+def commit_with_message(
+    save: Callable[[], None] | None,
+    chat_ids: Iterable[int],
+    text: str,
+    key: str | None = None,
+) -> None:
+    """Run `save` and enqueue the message in one transaction."""
+    with transaction.atomic():
+        if save is not None:
+            save()
+        enqueue(chat_ids, text, key)
+
+
+@run_in_pool
+def take_batch(size: int, lease: float) -> list[OutboxMessage]:
+    """
+    Return due pending messages leased to the caller in the saving order.
+
+    A message waits while an earlier message of its chat is not due: it is
+    retried later or leased to another worker.
+    """
+    now = timezone.now()
+    pending = OutboxMessage.objects.filter(status=Status.PENDING)
+    with transaction.atomic():
+        messages = list(
+            pending
+            .filter(send_after__lte=now)
+            .filter(~Exists(pending.filter(
+                chat_id=OuterRef('chat_id'),
+                pk__lt=OuterRef('pk'),
+                send_after__gt=now,
+            )))
+            .order_by('pk')
+            .select_for_update(skip_locked=True)[:size]
+        )
+        OutboxMessage.objects\
+            .filter(pk__in=[message.pk for message in messages])\
+            .update(send_after=now + dt.timedelta(seconds=lease))
+    return messages
+
+
+@run_in_pool
+def save_batch(messages: list[OutboxMessage]) -> None:
+    OutboxMessage.objects.bulk_update(
+        messages, ['status', 'attempts', 'send_after', 'sent_at']
+    )
+
+
+@run_in_pool
+def delete_sent_messages(max_age: dt.timedelta) -> int:
+    """Delete messages sent or failed before max_age."""
+    deleted, _ = OutboxMessage.objects\
+        .exclude(status=Status.PENDING)\
+        .filter(created_at__lt=timezone.now() - max_age)\
+        .delete()
+    return deleted
+
+
+class OutboxWorker:
+    """
+    Send outbox messages in batches with the broadcaster.
+
+    Chats are served concurrently, messages of a chat one by one in the
+    saving order. Failed messages are retried with exponential backoff,
+    later messages of the chat wait for the retry.
+    """
+
+    def __init__(
+        self,
+        broadcaster: Broadcaster,
+        batch_size: int = BATCH_SIZE,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff: float = BACKOFF,
+        lease: float = LEASE,
+    ) -> None:
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+
+        # seconds from saving to sending, max of the last drain
+        self.latency = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _send_chat(self, bot: Bot, messages: list[OutboxMessage],
+                         report: BroadcastReport) -> None:
+        registry = self.broadcaster.registry
+        for i, message in enumerate(messages):
+            if registry and not registry.is_reachable(message.chat_id):
+                status = DeliveryStatus.SKIPPED
+            else:
+                status = await self.broadcaster.send(
+                    bot, message.chat_id, message.text
+                )
+                message.attempts += 1
+            report.add(message.chat_id, status)
+
+            now = timezone.now()
+            if status is DeliveryStatus.DELIVERED:
+                message.status = Status.SENT
+                message.sent_at = now
+                self.latency = max(
+                    self.latency, (now - message.created_at).total_seconds()
+                )
+            elif (status is DeliveryStatus.FAILED
+                  and message.attempts < self.max_attempts):
+                message.send_after = now + dt.timedelta(
+                    seconds=self.backoff * 2 ** (message.attempts - 1)
+                )
+                # The rest are released and wait for the retry
+                for rest in messages[i + 1:]:
+                    rest.send_after = now
+                return
+            else:
+                message.status = Status.FAILED
+
+    async def drain(self, bot: Bot) -> BroadcastReport:
+        """
+        Send due messages until the outbox is empty. A running drain is
+        not repeated.
+        """
+        report = BroadcastReport()
+        if self._lock.locked():
+            return report
+
+        async with self._lock:
+            start = time.monotonic()
+            self.latency = 0.0
+            while messages := await take_batch(self.batch_size, self.lease):
+                chats = {}
+                for message in messages:
+                    chats.setdefault(message.chat_id, []).append(message)
+
+                await asyncio.gather(*(
+                    self._send_chat(bot, chat_messages, report)
+                    for chat_messages in chats.values()
+                ))
+                await save_batch(messages)
+
+                if len(messages) < self.batch_size:
+                    break
+            report.elapsed = time.monotonic() - start
+
+        if self.broadcaster.registry is not None:
+            await self.broadcaster.registry.record(report)
+        return report
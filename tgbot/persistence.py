@@ -0,0 +1,249 @@
+import asyncio
+import datetime as dt
+import json
+import logging
+from collections import defaultdict
+
+from django.utils import timezone
+from telegram.ext import BasePersistence, PersistenceInput
+
+from web_dashboard.bot_api.models import ConversationRecord
+from tgbot.db import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+WRITE_DELAY = 0.5  # seconds to collect changes into one write
+
+
+def dump_user_data(user_data: dict) -> dict:
+    """
+    Return JSON serializable items of user_data.
+
+    Other values (e.g. model instances cached by handlers) are not stored:
+    handlers reload them.
+    """
+    record = {}
+    for key, value in user_data.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        record[key] = value
+    return record
+
+
+@run_in_pool
+def load_conversations(since: dt.datetime) -> dict:
+    """Return {user id: conversations} of the records changed since."""
+    return dict(
+        ConversationRecord.objects
+        .filter(updated_at__gte=since)
+        .exclude(conversations={})
+        .values_list('user_id', 'conversations')
+    )
+
+
+@run_in_pool
+def load_user_data(user_id: int) -> dict:
+    """Return stored user_data of the user."""
+    return ConversationRecord.objects.filter(user_id=user_id)\
+        .values_list('user_data', flat=True).first() or {}
+
+
+@run_in_pool
+def save_records(records: dict[int, dict]) -> None:
+    """
+    Insert or update records {user id: fields}.
+
+    Records with and without user_data are upserted by two queries.
+    """
+    now = timezone.now()
+    for fields in (['conversations'], ['conversations', 'user_data']):
+        rows = [
+            ConversationRecord(user_id=user_id, updated_at=now, **record)
+            for user_id, record in records.items()
+            if len(record) == len(fields)
+        ]
+        if rows:
+            ConversationRecord.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user_id'],
+                update_fields=[*fields, 'updated_at'],
+            )
+
+
+class DatabasePersistence(BasePersistence):
+    """
+    Keep conversation states and user_data in ConversationRecord rows.
+
+    The application hands over changed data every `update_interval`
+    seconds, the changes are collected for `write_delay` seconds and
+    written by one upsert. user_data of a user is loaded on the first
+    update of the user. Conversations are loaded at startup, only the
+    ones changed within `max_age`.
+
+    Conversation keys have to end with the user id (`per_user=True`).
+    """
+
+    def __init__(
+        self,
+        update_interval: float = 60,
+        write_delay: float = WRITE_DELAY,
+        max_age: dt.timedelta | None = None,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.write_delay = write_delay
+        self.max_age = max_age
+
+        self._conversations = None
+        self._loaded_users = set()
+        self._pending_users = set()
+        self._pending_user_data = {}
+        self._saving_user_data = {}
+        self._write_task = None
+
+    async def _load_conversations(self) -> dict:
+        if self._conversations is None:
+            since = timezone.now() - self.max_age \
+                if self.max_age else dt.datetime.min.replace(tzinfo=dt.UTC)
+
+            records = await load_conversations(since)
+            self._conversations = defaultdict(dict)
+            for conversations in records.values():
+                for name, states in conversations.items():
+                    self._conversations[name].update(
+                        (tuple(key), state) for key, state in states
+                    )
+            logger.info(f'Conversations are loaded for {len(records)} users.')
+        return self._conversations
+
+    async def get_conversations(self, name: str) -> dict:
+        return dict((await self._load_conversations())[name])
+
+    async def update_conversation(self, name: str, key: tuple,
+                                  new_state: object | None) -> None:
+        conversations = await self._load_conversations()
+        if new_state is None:
+            conversations[name].pop(key, None)
+        else:
+            conversations[name][key] = new_state
+
+        self._pending_users.add(key[-1])
+        self._schedule_write()
+
+    async def get_user_data(self) -> dict:
+        # user_data is loaded lazily by refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id not in self._loaded_users:
+            # unsaved user_data of an evicted user is newer than the record
+            data = self._pending_user_data.get(
+                user_id, self._saving_user_data.get(user_id)
+            )
+            if data is None:
+                data = await load_user_data(user_id)
+            user_data.update(data)
+            self._loaded_users.add(user_id)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._pending_user_data[user_id] = dump_user_data(data)
+        self._pending_users.add(user_id)
+        self._schedule_write()
+
+    def evict_user_data(self, user_id: int, data: dict) -> None:
+        """
+        Queue user_data of the user dropped from the application.
+
+        The application skips update_user_data of dropped users, so their
+        last changes are written here. The user_data is loaded again on
+        the next update of the user.
+        """
+        self._loaded_users.discard(user_id)
+        self._pending_user_data[user_id] = dump_user_data(data)
+        self._pending_users.add(user_id)
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        # user_data is saved and unloaded by evict_user_data, the record is
+        # kept. The user may be active again by now, keep the loaded flag.
+        pass
+
+    def _schedule_write(self) -> None:
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._pending_users:
+            await asyncio.sleep(self.write_delay)
+            users, self._pending_users = self._pending_users, set()
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            self._saving_user_data = user_data
+
+            records = {
+                user_id: {'conversations': self._dump_conversations(user_id)}
+                for user_id in users
+            }
+            for user_id, data in user_data.items():
+                records[user_id]['user_data'] = data
+
+            try:
+                await save_records(records)
+            except Exception:
+                logger.exception(f'Records are not saved: {len(records)}')
+                self._pending_users |= users
+                self._pending_user_data = user_data | self._pending_user_data
+                return
+            finally:
+                self._saving_user_data = {}
+
+    def _dump_conversations(self, user_id: int) -> dict:
+        """Return conversation states of the user as JSON."""
+        conversations = {}
+        for name, states in (self._conversations or {}).items():
+            if user_states := [
+                [list(key), state] for key, state in states.items()
+                if key[-1] == user_id
+            ]:
+                conversations[name] = user_states
+        return conversations
+
+    async def flush(self) -> None:
+        if self._pending_users:
+            self._schedule_write()
+        if self._write_task is not None:
+            await self._write_task
+
+    # bot_data, chat_data and callback_data are not stored
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: object) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,296 @@
+import math
+
+from django.contrib.gis.db.models import GeometryField, PointField
+from django.contrib.gis.geos import Point
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import (
+    BooleanField, Count, Exists, F, FloatField, Func, IntegerField, OuterRef,
+    Q, QuerySet, Subquery, Sum, Value
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from web_dashboard.bot_api.cache import (
+    DEPARTURES_KEY, get_dashboard_key, get_user_profile_key
+)
+from web_dashboard.logistics.models import Crew, Departure, JoinRequest, Task
+from web_dashboard.search_requests.models import SearchRequest
+from web_dashboard.users.models import CustomUser
+from tgbot.db import run_in_pool
+
+
+def count_subquery(model, field: str, outer: str = 'pk',
+                   **filters) -> Coalesce:
+    """Return correlated subquery counting model rows related by field."""
+    rows = model.objects.filter(**{field: OuterRef(outer)}, **filters)\
+        .order_by()\
+        .values(field)\
+        .annotate(count=Count('pk'))\
+        .values('count')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def count_all(queryset) -> Subquery:
+    """Return uncorrelated subquery counting all rows of the queryset."""
+    rows = queryset.order_by()\
+        .annotate(count=Func(F('pk'), function='COUNT'))\
+        .values('count')
+    return Subquery(rows, output_field=IntegerField())
+
+
+class Geography(Func):
+    """Cast geometry to PostGIS geography: distances are in metres."""
+    template = '(%(expressions)s)::geography'
+    output_field = GeometryField(geography=True)
+
+
+def nearest_postgis(crews: QuerySet, point: Point, radius: float) -> QuerySet:
+    """
+    Return crews within radius (m) ordered by distance.
+
+    `<->` ordering uses the geography GiST index of pickup_location as
+    KNN search, ST_DWithin uses it to cut off distant crews.
+    """
+    field = Geography(F('pickup_location'))
+    point = Geography(Value(point, output_field=PointField()))
+
+    return crews.filter(
+        Func(field, point, Value(radius), function='ST_DWithin',
+             output_field=BooleanField())
+    ).annotate(
+        distance=Func(field, point, function='ST_Distance',
+                      output_field=FloatField())
+    ).order_by(
+        Func(field, point, arg_joiner=' <-> ', template='%(expressions)s',
+             output_field=FloatField())
+    )
+
+
+def nearest_spatialite(crews: QuerySet, point: Point,
+                       radius: float) -> QuerySet:
+    """
+    Return crews within radius (m) ordered by distance.
+
+    The bounding box of the radius is searched in the R*Tree spatial index
+    of pickup_location, exact distances are computed for the found crews.
+    """
+    lat_delta = radius / 111_320
+    lon_delta = radius / (111_320 * max(math.cos(math.radians(point.y)),
+                                        0.01))
+    bbox = RawSQL(
+        'SELECT ROWID FROM SpatialIndex WHERE f_table_name = %s '
+        'AND f_geometry_column = %s '
+        'AND search_frame = BuildMbr(%s, %s, %s, %s, %s)',
+        (
+            Crew._meta.db_table, 'pickup_location',
+            max(point.x - lon_delta, -180), max(point.y - lat_delta, -90),
+            min(point.x + lon_delta, 180), min(point.y + lat_delta, 90),
+            point.srid,
+        )
+    )
+
+    return crews.filter(pk__in=bbox).annotate(
+        distance=Func(
+            F('pickup_location'), Value(point, output_field=PointField()),
+            Value(1), function='ST_Distance', output_field=FloatField()
+        )
+    ).filter(distance__lte=radius).order_by('distance')
+
+
+@run_in_pool
+def get_nearest_crews(
+    lat: float,
+    lon: float,
+    radius: float,
+    limit: int,
+    offset: int = 0,
+) -> tuple[list[Crew], bool]:
+    """
+    Return a page of available crews nearest to the position and a flag
+    if there are more crews within radius (km).
+
+    `distance` of crews is in metres.
+    """
+    point = Point(lon, lat, srid=4326)
+    crews = Crew.objects.filter(status=Crew.StatusVerbose.AVAILABLE)\
+        .only('title', 'pickup_datetime', 'status', 'passengers_count')
+
+    if connection.ops.spatialite:
+        crews = nearest_spatialite(crews, point, radius * 1000)
+    else:
+        crews = nearest_postgis(crews, point, radius * 1000)
+
+    crews = list(crews[offset:offset + limit + 1])
+    return crews[:limit], len(crews) > limit
+
+
+@run_in_pool
+def get_user_profile(telegram_id: int, fields: set[str]) -> CustomUser:
+    """
+    Return the user with at least the fields loaded.
+
+    Loaded fields are cached under the Telegram ID for all bot processes
+    until the user is saved or the cache times out. Other fields are
+    loaded together with the cached ones.
+    """
+    key = get_user_profile_key(telegram_id)
+    profile = cache.get(key) or {}
+
+    if not fields <= profile.keys():
+        profile = CustomUser.objects\
+            .filter(telegram_id=telegram_id)\
+            .values(*fields, *profile)\
+            .get()
+        cache.set(key, profile, settings.USER_PROFILE_CACHE_TIMEOUT)
+
+    # from_db expects values in the order of model fields
+    names = [
+        field.attname for field in CustomUser._meta.concrete_fields
+        if field.attname in profile
+    ]
+    return CustomUser.from_db(
+        'default', names, [profile[name] for name in names]
+    )
+
+
+@run_in_pool
+def get_open_departures() -> list[Departure]:
+    """
+    Return open departures with search requests, tasks and counts.
+
+    The list is shared by all users and cached until a departure, crew,
+    task or search request is changed.
+    """
+    departures = cache.get(DEPARTURES_KEY)
+    if departures is None:
+        departures = list(
+            Departure.objects
+            .filter(status=Departure.StatusVerbose.OPEN)
+            .select_related('search_request')
+            .prefetch_related('tasks')
+            .annotate(
+                crews_count=count_subquery(Crew, 'departure'),
+                tasks_count=count_subquery(Task, 'departure'),
+            )
+            .order_by('pk')
+        )
+        cache.set(DEPARTURES_KEY, departures)
+    return departures
+
+
+@run_in_pool
+def get_dashboard(user: CustomUser) -> dict:
+    """
+    Return numbers and crews of the user main menu.
+
+    Result is cached per user until a crew or a user join request change.
+    """
+    key = get_dashboard_key(user.pk)
+    dashboard = cache.get(key)
+    if dashboard is not None:
+        return dashboard
+
+    crews = Crew.objects.exclude(status=Crew.StatusVerbose.COMPLETED)
+
+    dashboard = CustomUser.objects.filter(pk=user.pk).annotate(
+        crews_count=count_all(crews),
+        has_join_requests=Exists(
+            JoinRequest.objects.filter(passenger=OuterRef('pk'))
+        ),
+    ).values('crews_count', 'has_join_requests').get()
+
+    dashboard['user_crews'] = list(
+        crews.filter(driver=user)
+        .values('pk', 'title', 'status', 'pickup_datetime',
+                'passengers_count')
+        .order_by('pickup_datetime')
+    )
+
+    cache.set(key, dashboard)
+    return dashboard
+
+
+@run_in_pool
+def get_crew_snapshot(
+    crews: QuerySet,
+    pk: int,
+    user: CustomUser | None = None,
+    related: bool = True,
+) -> Crew:
+    """
+    Return the crew with everything displayed about it in three queries.
+
+    `crews` limits crews available to the user. The crew is loaded with
+    driver, departure, search request and the number of departure crews;
+    passengers and departure tasks are prefetched.
+    `has_user_join_request` is True if the user has asked to join the crew.
+
+    Without `related` only the crew is loaded in one query, e.g. when its
+    messages are already rendered.
+    """
+    annotations = {
+        'driver_tg_id': F('driver__telegram_id'),
+        'departure_crews_count': count_subquery(
+            Crew, 'departure', outer='departure'
+        ),
+    }
+    if user is not None:
+        annotations['has_user_join_request'] = Exists(
+            JoinRequest.objects.filter(crew=OuterRef('pk'), passenger=user)
+        )
+
+    crew = Crew.objects.filter(pk__in=crews.filter(pk=pk).values('pk'))
+    if related:
+        crew = crew\
+            .select_related('driver', 'departure',
+                            'departure__search_request')\
+            .prefetch_related('passengers', 'departure__tasks')
+    return crew.annotate(**annotations).get()
+
+
+@run_in_pool
+def get_ops_board() -> list[dict]:
+    """
+    Return not closed search requests with numbers of open departures
+    and their crews by status in one query.
+
+    `passengers` and `seats` are summed over available crews.
+    """
+    departures = Q(departures__status=Departure.StatusVerbose.OPEN)
+
+    def crews(status: str) -> Q:
+        return departures & Q(departures__crews__status=status)
+
+    available = crews(Crew.StatusVerbose.AVAILABLE)
+    return list(
+        SearchRequest.objects
+        .exclude(status=SearchRequest.StatusVerbose.CLOSED)
+        .annotate(
+            departures_count=Count(
+                'departures', filter=departures, distinct=True
+            ),
+            available=Count('departures__crews', filter=available),
+            on_mission=Count(
+                'departures__crews',
+                filter=crews(Crew.StatusVerbose.ON_MISSION)
+            ),
+            returning=Count(
+                'departures__crews',
+                filter=crews(Crew.StatusVerbose.RETURNING)
+            ),
+            passengers=Coalesce(
+                Sum('departures__crews__passengers_count', filter=available),
+                0
+            ),
+            seats=Coalesce(
+                Sum('departures__crews__passengers_max', filter=available), 0
+            ),
+        )
+        .values(
+            'pk', 'full_name', 'city', 'departures_count', 'available',
+            'on_mission', 'returning', 'passengers', 'seats',
+        )
+        .order_by('pk')
+    )
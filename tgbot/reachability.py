@@ -0,0 +1,128 @@
+import asyncio
+import datetime as dt
+import logging
+
+from django.db.models import Q
+from django.utils import timezone
+from telegram import Bot, error
+from telegram.constants import ChatAction
+
+from web_dashboard.bot_api.models import TelegramUser
+from tgbot.broadcast import (
+    BroadcastReport, DeliveryStatus, get_forbidden_status
+)
+from tgbot.db import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+PROBE_RATE = 1  # probes of unreachable chats per second
+
+Reachability = TelegramUser.ReachabilityVerbose
+
+REACHABILITY = {
+    DeliveryStatus.DELIVERED: Reachability.REACHABLE,
+    DeliveryStatus.BLOCKED: Reachability.BLOCKED,
+    DeliveryStatus.DEACTIVATED: Reachability.DEACTIVATED,
+}
+
+
+def load_reachability() -> tuple[set[int], set[int]]:
+    """Return ids of users who started the bot and of unreachable ones."""
+    started, unreachable = set(), set()
+    for user_id, reachability in TelegramUser.objects.values_list(
+        'user_id', 'reachability'
+    ):
+        started.add(user_id)
+        if reachability != Reachability.REACHABLE:
+            unreachable.add(user_id)
+    return started, unreachable
+
+
+aload_reachability = run_in_pool(load_reachability)
+
+
+@run_in_pool
+def save_reachability(chat_ids: dict[str, list[int]]) -> None:
+    """Update users {reachability: user ids} after delivery attempts."""
+    now = timezone.now()
+    for reachability, user_ids in chat_ids.items():
+        fields = {'reachability': reachability, 'checked_at': now}
+        if reachability == Reachability.REACHABLE:
+            fields['last_delivery'] = now
+        TelegramUser.objects.filter(user_id__in=user_ids).update(**fields)
+
+
+@run_in_pool
+def get_probe_chats(checked_before: dt.datetime) -> list[int]:
+    """Return unreachable users not checked since the time."""
+    return list(
+        TelegramUser.objects
+        .exclude(reachability=Reachability.REACHABLE)
+        .filter(Q(checked_at__lt=checked_before) | Q(checked_at=None))
+        .values_list('user_id', flat=True)
+    )
+
+
+class ReachabilityRegistry:
+    """
+    Chats a broadcast can be delivered to, kept in sync with TelegramUser.
+
+    Users who never started the bot or blocked it and deactivated accounts
+    are unreachable. Blocked and deactivated users are probed again by
+    `probe`: a user who unblocked the bot becomes reachable.
+    """
+
+    def __init__(self, started: set[int] = (),
+                 unreachable: set[int] = ()) -> None:
+        self.started = set(started)
+        self.unreachable = set(unreachable)
+
+    def is_reachable(self, chat_id: int) -> bool:
+        return chat_id in self.started and chat_id not in self.unreachable
+
+    def mark_started(self, chat_id: int) -> None:
+        """Make the chat reachable on /start of the user."""
+        self.started.add(chat_id)
+        self.unreachable.discard(chat_id)
+
+    async def record(self, report: BroadcastReport) -> None:
+        """Save reachability of the chats the broadcast was delivered to."""
+        chat_ids = {
+            reachability: getattr(report, status.value)
+            for status, reachability in REACHABILITY.items()
+            if getattr(report, status.value)
+        }
+        for reachability, user_ids in chat_ids.items():
+            if reachability == Reachability.REACHABLE:
+                self.unreachable.difference_update(user_ids)
+            else:
+                self.unreachable.update(user_ids)
+                logger.info(f'Chats are unreachable: {user_ids}')
+
+        if chat_ids:
+            await save_reachability(chat_ids)
+
+    async def probe(self, bot: Bot, max_age: dt.timedelta,
+                    rate: float = PROBE_RATE) -> BroadcastReport:
+        """
+        Send chat action to unreachable chats not checked within max_age.
+
+        The registry is reloaded first to get users started the bot in
+        other processes.
+        """
+        self.started, self.unreachable = await aload_reachability()
+
+        report = BroadcastReport()
+        for chat_id in await get_probe_chats(timezone.now() - max_age):
+            try:
+                await bot.send_chat_action(chat_id, ChatAction.TYPING)
+                report.add(chat_id, DeliveryStatus.DELIVERED)
+            except error.Forbidden as e:
+                report.add(chat_id, get_forbidden_status(e))
+            except error.TelegramError as e:
+                report.add(chat_id, DeliveryStatus.FAILED)
+                logger.warning(f'Chat is not probed. TG: {chat_id}, {e}')
+            await asyncio.sleep(1 / rate)
+
+        await self.record(report)
+        return report
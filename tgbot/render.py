@@ -0,0 +1,52 @@
+import datetime as dt
+from collections.abc import Awaitable, Callable
+
+from django.core.cache import cache
+
+from web_dashboard.bot_api.cache import get_render_version
+from tgbot.db import run_in_pool
+
+
+def get_render_key(template: str, name: str, pk: int,
+                   tz: dt.timezone | None = None) -> str:
+    """
+    Return cache key of the template rendered for the entity.
+
+    The key holds the entity version and the UTC offset of `tz`: every
+    user in the same timezone sees the same message.
+    """
+    version = get_render_version(name, pk)
+    offset = tz.utcoffset(None) // dt.timedelta(minutes=1) if tz else ''
+    return f'bot:render:{template}:{name}:{pk}:{version}:{offset}'
+
+
+@run_in_pool
+def get_rendered(*args) -> tuple[str, str | None]:
+    """Return cache key and cached message of get_render_key args."""
+    key = get_render_key(*args)
+    return key, cache.get(key)
+
+
+@run_in_pool
+def set_rendered(key: str, msg: str) -> None:
+    cache.set(key, msg)
+
+
+async def render(
+    template: str,
+    name: str,
+    pk: int,
+    tz: dt.timezone | None,
+    build: Callable[[], Awaitable[str]],
+) -> str:
+    """
+    Return the message of the entity rendered by `build`.
+
+    `build` is called on a cache miss only, the message is kept until the
+    entity changes.
+    """
+    key, msg = await get_rendered(template, name, pk, tz)
+    if msg is None:
+        msg = await build()
+        await set_rendered(key, msg)
+    return msg
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = 64
+MAX_USER_QUEUE = 5  # updates of a user processed or waiting at once
+
+
+class UserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates of different users concurrently and updates of the same
+    user one by one in the order they are received.
+
+    Updates of a user wait for the previous ones in a queue of at most
+    `max_queue` updates, further updates are dropped. A waiting update
+    holds one of `max_concurrent_updates` slots, so a single user takes
+    at most `max_queue` of them.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+                 max_queue: int = MAX_USER_QUEUE) -> None:
+        super().__init__(max_concurrent_updates)
+        self.max_queue = max_queue
+        self.dropped = 0
+
+        # user id -> (lock, number of updates processed or waiting)
+        self._queues: dict[int, tuple[asyncio.Lock, int]] = {}
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @staticmethod
+    def _get_user_id(update: object) -> int | None:
+        if isinstance(update, Update):
+            if user := update.effective_user:
+                return user.id
+            if chat := update.effective_chat:
+                return chat.id
+        return None
+
+    async def do_process_update(self, update: object,
+                                coroutine: Awaitable[Any]) -> None:
+        user_id = self._get_user_id(update)
+        if user_id is None:
+            await coroutine
+            return
+
+        lock, depth = self._queues.get(user_id, (None, 0))
+        if depth >= self.max_queue:
+            self.dropped += 1
+            logger.warning(f'Update queue is full, update is dropped. '
+                           f'TG: {user_id}')
+            coroutine.close()
+            return
+        if lock is None:
+            lock = asyncio.Lock()
+        self._queues[user_id] = lock, depth + 1
+
+        try:
+            start = time.monotonic()
+            async with lock:
+                wait = time.monotonic() - start
+                self._waits += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+
+                await coroutine
+        finally:
+            lock, depth = self._queues[user_id]
+            if depth > 1:
+                self._queues[user_id] = lock, depth - 1
+            else:
+                del self._queues[user_id]
+
+    def get_stats(self) -> dict:
+        """
+        Return queue wait times (s) since the previous call, numbers of
+        queued users and dropped updates.
+        """
+        stats = {
+            'users': len(self._queues),
+            'queued': sum(depth for _, depth in self._queues.values()),
+            'waits': self._waits,
+            'wait_avg': self._wait_total / self._waits if self._waits else 0,
+            'wait_max': self._wait_max,
+            'dropped': self.dropped,
+        }
+        self._waits = 0
+        self._wait_total = self._wait_max = 0.0
+        return stats
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
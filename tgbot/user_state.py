@@ -0,0 +1,89 @@
+import logging
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+
+class UserDataLimiter:
+    """
+    Keep user_data of at most `max_users` recently active users.
+
+    `touch` is called on every update: user_data of the least recently
+    active users above the limit are dropped from the application. The
+    persistence gets the dropped user_data by its `evict_user_data` hook.
+    """
+
+    def __init__(self, max_users: int) -> None:
+        self.max_users = max_users
+        self.evicted = 0
+
+        self._recent = OrderedDict()
+
+    def touch(self, application: Application, user_id: int) -> None:
+        """Mark the user as the most recently active one."""
+        self._recent[user_id] = None
+        self._recent.move_to_end(user_id)
+
+        while len(self._recent) > self.max_users:
+            user_id, _ = self._recent.popitem(last=False)
+            evict = getattr(application.persistence, 'evict_user_data', None)
+            if evict is not None:
+                evict(user_id, application.user_data.get(user_id, {}))
+            application.drop_user_data(user_id)
+            self.evicted += 1
+
+
+async def end_idle_conversation(update: Update,
+                                context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Clear user_data of the conversation ended by timeout."""
+    logger.info(f'Conversation timeout. TG: {update.effective_user.id}')
+    context.user_data.clear()
+
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Conversation is ended due to inactivity. "
+             "Return back to /start_conversation."
+    )
+
+
+def get_size(obj: object, seen: set | None = None) -> int:
+    """Return approximate number of bytes held by the object and its items."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, Mapping):
+        size += sum(
+            get_size(key, seen) + get_size(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(get_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += get_size(vars(obj), seen)
+    return size
+
+
+def get_user_data_stats(user_data: Mapping[int, dict]) -> dict:
+    """Return number of users and total/max bytes of their user_data."""
+    sizes = {
+        user_id: get_size(data) for user_id, data in user_data.items()
+    }
+    max_user = max(sizes, key=sizes.get, default=None)
+    return {
+        'users': len(sizes),
+        'total': sum(sizes.values()),
+        'max': sizes.get(max_user, 0),
+        'max_user': max_user,
+    }
@@ -0,0 +1,155 @@
+import asyncio
+import importlib
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+DEDUP_SIZE = 1000  # number of the last update ids to check for duplicates
+PUT_TIMEOUT = 5  # seconds to wait for a free slot in the update queue
+
+
+class WebhookUnavailable(Exception):
+    """Update can't be accepted now, Telegram should redeliver it later."""
+
+
+class WebhookBot:
+    """
+    Run the bot application inside ASGI process in webhook mode.
+
+    Updates received by the webhook view are deduplicated by `update_id` and
+    put to the bounded update queue of the application. When the queue is
+    full, the view answers 503 and Telegram redelivers the update later.
+    """
+
+    def __init__(
+        self,
+        dedup_size: int = DEDUP_SIZE,
+        put_timeout: float = PUT_TIMEOUT,
+    ) -> None:
+        self.dedup_size = dedup_size
+        self.put_timeout = put_timeout
+        self.application = None
+        self.accepting = False
+
+        self._seen = OrderedDict()
+
+    async def startup(self) -> None:
+        """Build and start the application and register the webhook."""
+        # tgbot.bot runs DB queries at import, it can't be done in event loop
+        bot = await asyncio.to_thread(importlib.import_module, 'tgbot.bot')
+
+        self.application = bot.build_application(updater=False)
+        await self.application.initialize()
+        await self.application.bot.set_webhook(
+            url=settings.TELEGRAM_WEBHOOK_URL,
+            secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=bot.ALLOWED_UPDATES,
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        )
+        await self.application.start()
+        self.accepting = True
+        logger.info(f'Webhook is set: {settings.TELEGRAM_WEBHOOK_URL}')
+
+    async def shutdown(self) -> None:
+        """Stop accepting updates, process the queued ones and stop."""
+        self.accepting = False
+        if self.application is None:
+            return
+
+        if self.application.running:
+            logger.info(
+                f'Draining {self.application.update_queue.qsize()} updates.'
+            )
+            await self.application.stop()
+            # Hooks are called by run_polling/run_webhook only
+            if self.application.post_stop:
+                await self.application.post_stop(self.application)
+        await self.application.shutdown()
+        if self.application.post_shutdown:
+            await self.application.post_shutdown(self.application)
+
+    def _remember(self, update_id: int) -> bool:
+        """Remember update id. Return False if it was already received."""
+        if update_id in self._seen:
+            return False
+
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        return True
+
+    def _forget(self, update_id: int) -> None:
+        self._seen.pop(update_id, None)
+
+    async def put(self, data: dict) -> bool:
+        """
+        Put update to the application queue.
+
+        Return False for a duplicate. Raise ValueError for invalid update
+        and WebhookUnavailable if the application is not running or the
+        queue stays full.
+        """
+        update_id = data.get('update_id') if isinstance(data, dict) else None
+        if type(update_id) is not int:
+            raise ValueError('Update has no update_id.')
+        if not self.accepting:
+            raise WebhookUnavailable('Bot is not running.')
+
+        if not self._remember(update_id):
+            logger.info(f'Duplicate update is skipped: {update_id}')
+            return False
+
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            self._forget(update_id)
+            raise ValueError(f'Invalid update: {update_id}') from e
+
+        try:
+            await asyncio.wait_for(
+                self.application.update_queue.put(update),
+                timeout=self.put_timeout,
+            )
+        except TimeoutError:
+            self._forget(update_id)
+            logger.warning(f'Update queue is full. Update: {update_id}')
+            raise WebhookUnavailable('Update queue is full.')
+        return True
+
+
+webhook_bot = WebhookBot()
+
+
+class BotLifespan:
+    """ASGI wrapper starting and stopping the bot with the server."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            match message['type']:
+                case 'lifespan.startup':
+                    try:
+                        await webhook_bot.startup()
+                    except Exception as e:
+                        logger.exception('Bot startup is failed.')
+                        await send({
+                            'type': 'lifespan.startup.failed',
+                            'message': str(e),
+                        })
+                        return
+                    await send({'type': 'lifespan.startup.complete'})
+
+                case 'lifespan.shutdown':
+                    await webhook_bot.shutdown()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_dashboard.settings')
 
 application = get_asgi_application()
+
+# Webhook mode: the Telegram bot runs in the same process and receives
+# updates through `bot_api` webhook view.
+from django.conf import settings  # noqa: E402
+
+if settings.BOT_MODE == 'webhook':
+    from tgbot.webhook import BotLifespan
+
+    application = BotLifespan(application)
@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+DEPARTURES_KEY = 'bot:departures'
+DASHBOARD_GENERATION_KEY = 'bot:dashboard'
+RENDER_VERSION_KEY = 'bot:render:{name}:{pk}'
+
+
+def invalidate_departures() -> None:
+    """Drop cached list of open departures."""
+    cache.delete(DEPARTURES_KEY)
+
+
+def get_dashboard_key(user_id: int) -> str:
+    """Return cache key of the user main menu of the current generation."""
+    generation = cache.get(DASHBOARD_GENERATION_KEY, 0)
+    return f'bot:dashboard:{generation}:{user_id}'
+
+
+def invalidate_dashboard(user_id: int) -> None:
+    """Drop cached main menu of the user."""
+    cache.delete(get_dashboard_key(user_id))
+
+
+def get_user_profile_key(telegram_id: int) -> str:
+    """Return cache key of the user profile fields loaded by the bot."""
+    return f'bot:user:{telegram_id}'
+
+
+def invalidate_user_profile(telegram_id: int) -> None:
+    """Drop cached profile of the user."""
+    cache.delete(get_user_profile_key(telegram_id))
+
+
+def invalidate_dashboards() -> None:
+    """Drop cached main menus of all users, they expire by timeout."""
+    cache.set(DASHBOARD_GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def get_render_version(name: str, pk: int) -> int:
+    """
+    Return version of the messages rendered for the entity.
+
+    The version is created on first use and dropped on change of the
+    entity, so messages rendered before the change are not found anymore.
+    """
+    key = RENDER_VERSION_KEY.format(name=name, pk=pk)
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def invalidate_render(name: str, pks) -> None:
+    """Drop versions of messages rendered for the entities."""
+    cache.delete_many(
+        [RENDER_VERSION_KEY.format(name=name, pk=pk) for pk in pks]
+    )
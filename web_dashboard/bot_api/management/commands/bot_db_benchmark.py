@@ -0,0 +1,77 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tgbot.db import DatabasePool
+from web_dashboard.logistics.models import Crew
+from web_dashboard.users.models import CustomUser
+
+
+def main_menu_queries(user_id: int) -> None:
+    """Run the same queries as the bot main menu handler."""
+    user = CustomUser.objects.get(pk=user_id)
+    crews = Crew.objects.exclude(status=Crew.StatusVerbose.COMPLETED)
+    crews.count()
+    list(
+        crews.filter(driver=user)
+        .only('title', 'pickup_datetime', 'status', 'passengers_count')
+    )
+    user.join_requests.exists()
+
+
+class Command(BaseCommand):
+    help = 'Measure bot handler latency: single DB thread vs thread pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Number of concurrent simulated users.')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Number of handler calls per user.')
+        parser.add_argument('--pool-size', type=int,
+                            default=settings.BOT_DB_POOL_SIZE or 8)
+
+    async def simulate_user(self, pool, user_id, requests, latencies):
+        for _ in range(requests):
+            start = time.perf_counter()
+            await pool.run(main_menu_queries, user_id)
+            latencies.append(time.perf_counter() - start)
+
+    async def simulate(self, pool, user_ids, requests) -> list[float]:
+        latencies = []
+        await asyncio.gather(*(
+            self.simulate_user(pool, user_id, requests, latencies)
+            for user_id in user_ids
+        ))
+        return latencies
+
+    def handle(self, *args, **options):
+        users = options['users']
+        user_ids = list(CustomUser.objects.values_list('pk', flat=True))
+        if not user_ids:
+            raise CommandError('There are no users in the database.')
+        # Reuse existing users if there are fewer than simulated ones
+        user_ids = [user_ids[i % len(user_ids)] for i in range(users)]
+
+        modes = [
+            ('sync_to_async', 0),
+            (f'pool ({options["pool_size"]} threads)', options['pool_size']),
+        ]
+        for title, size in modes:
+            pool = DatabasePool(size)
+            start = time.perf_counter()
+            latencies = asyncio.run(
+                self.simulate(pool, user_ids, options['requests'])
+            )
+            elapsed = time.perf_counter() - start
+            pool.shutdown()
+
+            percentiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'{title}: {users} users, {len(latencies)} calls, '
+                f'p50: {percentiles[49] * 1000:.1f} ms, '
+                f'p99: {percentiles[98] * 1000:.1f} ms, '
+                f'throughput: {len(latencies) / elapsed:.0f} calls/s'
+            )
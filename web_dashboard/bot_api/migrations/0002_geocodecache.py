@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('F', 'Address to coordinates'), ('R', 'Coordinates to address')], max_length=1, verbose_name='Kind')),
+                ('query', models.CharField(help_text='Normalized address or rounded `latitude,longitude`.', max_length=255, verbose_name='Query')),
+                ('latitude', models.FloatField(verbose_name='Latitude')),
+                ('longitude', models.FloatField(verbose_name='Longitude')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='Address')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+            ],
+            options={
+                'unique_together': {('kind', 'query')},
+            },
+        ),
+    ]
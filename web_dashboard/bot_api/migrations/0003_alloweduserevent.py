@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0002_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllowedUserEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_id', models.BigIntegerField(verbose_name='Telegram ID')),
+                ('action', models.CharField(choices=[('A', 'Add'), ('R', 'Remove')], max_length=1, verbose_name='Action')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+        ),
+    ]
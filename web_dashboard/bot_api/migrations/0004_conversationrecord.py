@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0003_alloweduserevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationRecord',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='User ID')),
+                ('user_data', models.JSONField(default=dict, verbose_name='User data')),
+                ('conversations', models.JSONField(default=dict, help_text='States by conversation name: [[key, state], ...].', verbose_name='Conversations')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0004_conversationrecord'),
+        ('logistics', '0019_crew_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrewAnnouncement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='Chat ID')),
+                ('message_id', models.BigIntegerField(verbose_name='Message ID')),
+                ('text_hash', models.CharField(help_text='Hash of the message text to skip unchanged edits.', max_length=16, verbose_name='Text hash')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+                ('crew', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='announcements', to='logistics.crew', verbose_name='Crew')),
+            ],
+            options={
+                'unique_together': {('crew', 'chat_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-17 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0005_crewannouncement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramuser',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, help_text='Time of the last delivery attempt or probe.', null=True, verbose_name='Checked at'),
+        ),
+        migrations.AddField(
+            model_name='telegramuser',
+            name='last_delivery',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last delivery'),
+        ),
+        migrations.AddField(
+            model_name='telegramuser',
+            name='reachability',
+            field=models.CharField(choices=[('R', 'Reachable'), ('B', 'Blocked the bot'), ('D', 'Deactivated')], default='R', max_length=1, verbose_name='Reachability'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 17:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_api', '0006_telegramuser_reachability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='Chat ID')),
+                ('text', models.TextField(verbose_name='Text')),
+                ('key', models.CharField(blank=True, help_text='The message is saved once per chat for the same key.', max_length=64, null=True, verbose_name='Deduplication key')),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('S', 'Sent'), ('F', 'Failed')], default='P', max_length=1, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Failed messages are retried later, taken messages are leased to one worker until the time.', verbose_name='Send after')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'send_after'], name='bot_api_out_status_30762c_idx')],
+                'unique_together': {('chat_id', 'key')},
+            },
+        ),
+    ]
@@ -1,11 +1,22 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
 class TelegramUser(models.Model):
     """
     Represents a Telegram User to track actions and activities of the user.
+
+    Users without a row have never started the bot and can't receive
+    messages, unreachable users are skipped by broadcasts until re-probed.
     """
+
+    class ReachabilityVerbose(models.TextChoices):
+        """Delivery state choices."""
+        REACHABLE = 'R', _('Reachable')
+        BLOCKED = 'B', _('Blocked the bot')
+        DEACTIVATED = 'D', _('Deactivated')
+
     user_id = models.BigIntegerField(
         primary_key=True,
         verbose_name=_('User ID'),
@@ -15,6 +26,71 @@ class TelegramUser(models.Model):
         _('Last action'),
     )
 
+    reachability = models.CharField(
+        _('Reachability'),
+        max_length=1,
+        choices=ReachabilityVerbose.choices,
+        default=ReachabilityVerbose.REACHABLE,
+    )
+
+    last_delivery = models.DateTimeField(
+        _('Last delivery'),
+        null=True,
+        blank=True,
+    )
+
+    checked_at = models.DateTimeField(
+        _('Checked at'),
+        null=True,
+        blank=True,
+        help_text=_('Time of the last delivery attempt or probe.'),
+    )
+
+    created_at = models.DateTimeField(
+        _('Created at'),
+        auto_now_add=True
+    )
+
+    updated_at = models.DateTimeField(
+        _('Updated at'),
+        auto_now=True
+    )
+
+
+class GeocodeCache(models.Model):
+    """Stores geocoder results to avoid repeated requests to geocoder API."""
+
+    class KindVerbose(models.TextChoices):
+        """Lookup direction choices."""
+        FORWARD = 'F', _('Address to coordinates')
+        REVERSE = 'R', _('Coordinates to address')
+
+    kind = models.CharField(
+        _('Kind'),
+        max_length=1,
+        choices=KindVerbose.choices,
+    )
+
+    query = models.CharField(
+        _('Query'),
+        max_length=255,
+        help_text=_('Normalized address or rounded `latitude,longitude`.'),
+    )
+
+    latitude = models.FloatField(
+        _('Latitude'),
+    )
+
+    longitude = models.FloatField(
+        _('Longitude'),
+    )
+
+    address = models.CharField(
+        _('Address'),
+        max_length=255,
+        blank=True,
+    )
+
     created_at = models.DateTimeField(
         _('Created at'),
         auto_now_add=True
@@ -24,3 +100,178 @@ class TelegramUser(models.Model):
         _('Updated at'),
         auto_now=True
     )
+
+    class Meta:
+        unique_together = ('kind', 'query')
+
+    def __str__(self) -> str:
+        """String representation."""
+        return f'{self.query} -> ({self.latitude}, {self.longitude})'
+
+
+class AllowedUserEvent(models.Model):
+    """
+    Outbox of CustomUser Telegram ID changes polled by the bot to keep
+    the allowed users filter up to date.
+    """
+
+    class ActionVerbose(models.TextChoices):
+        """Filter change choices."""
+        ADD = 'A', _('Add')
+        REMOVE = 'R', _('Remove')
+
+    telegram_id = models.BigIntegerField(
+        _('Telegram ID'),
+    )
+
+    action = models.CharField(
+        _('Action'),
+        max_length=1,
+        choices=ActionVerbose.choices,
+    )
+
+    created_at = models.DateTimeField(
+        _('Created at'),
+        auto_now_add=True
+    )
+
+    def __str__(self) -> str:
+        """String representation."""
+        return f'{self.get_action_display()} {self.telegram_id}'
+
+
+class ConversationRecord(models.Model):
+    """
+    Persisted bot conversation states and user_data of a Telegram user,
+    kept as compact JSON to resume conversations after the bot restart.
+    """
+    user_id = models.BigIntegerField(
+        primary_key=True,
+        verbose_name=_('User ID'),
+    )
+
+    user_data = models.JSONField(
+        _('User data'),
+        default=dict,
+    )
+
+    conversations = models.JSONField(
+        _('Conversations'),
+        default=dict,
+        help_text=_('States by conversation name: [[key, state], ...].'),
+    )
+
+    updated_at = models.DateTimeField(
+        _('Updated at'),
+        auto_now=True
+    )
+
+    def __str__(self) -> str:
+        """String representation."""
+        return f'{self.user_id}: {self.conversations}'
+
+
+class CrewAnnouncement(models.Model):
+    """
+    The last crew announcement sent to a chat, edited in place on changes
+    of the crew instead of sending a new message.
+    """
+    crew = models.ForeignKey(
+        'logistics.Crew',
+        on_delete=models.CASCADE,
+        related_name='announcements',
+        verbose_name=_('Crew'),
+    )
+
+    chat_id = models.BigIntegerField(
+        _('Chat ID'),
+    )
+
+    message_id = models.BigIntegerField(
+        _('Message ID'),
+    )
+
+    text_hash = models.CharField(
+        _('Text hash'),
+        max_length=16,
+        help_text=_('Hash of the message text to skip unchanged edits.'),
+    )
+
+    updated_at = models.DateTimeField(
+        _('Updated at'),
+        auto_now=True
+    )
+
+    class Meta:
+        unique_together = ('crew', 'chat_id')
+
+    def __str__(self) -> str:
+        """String representation."""
+        return f'{self.crew_id} -> {self.chat_id}: {self.message_id}'
+
+
+class OutboxMessage(models.Model):
+    """
+    Bot notification saved in the transaction of the change it reports
+    and sent by the bot outbox worker, so it survives the bot restart.
+    """
+
+    class StatusVerbose(models.TextChoices):
+        """Delivery state choices."""
+        PENDING = 'P', _('Pending')
+        SENT = 'S', _('Sent')
+        FAILED = 'F', _('Failed')
+
+    chat_id = models.BigIntegerField(
+        _('Chat ID'),
+    )
+
+    text = models.TextField(
+        _('Text'),
+    )
+
+    key = models.CharField(
+        _('Deduplication key'),
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text=_('The message is saved once per chat for the same key.'),
+    )
+
+    status = models.CharField(
+        _('Status'),
+        max_length=1,
+        choices=StatusVerbose.choices,
+        default=StatusVerbose.PENDING,
+    )
+
+    attempts = models.PositiveSmallIntegerField(
+        _('Attempts'),
+        default=0,
+    )
+
+    send_after = models.DateTimeField(
+        _('Send after'),
+        default=timezone.now,
+        help_text=_('Failed messages are retried later, taken messages '
+                    'are leased to one worker until the time.'),
+    )
+
+    created_at = models.DateTimeField(
+        _('Created at'),
+        auto_now_add=True
+    )
+
+    sent_at = models.DateTimeField(
+        _('Sent at'),
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        unique_together = ('chat_id', 'key')
+        indexes = [models.Index(fields=['status', 'send_after'])]
+
+    def __str__(self) -> str:
+        """String representation."""
+        return f'{self.chat_id}: {self.text[:32]}'
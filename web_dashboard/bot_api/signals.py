@@ -0,0 +1,187 @@
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save
+)
+from django.db.models import Q
+from django.dispatch import receiver
+
+from web_dashboard.logistics.models import Crew, Departure, JoinRequest, Task
+from web_dashboard.search_requests.models import SearchRequest
+from web_dashboard.users.models import CustomUser
+from .cache import (
+    invalidate_dashboard, invalidate_dashboards, invalidate_departures,
+    invalidate_render, invalidate_user_profile
+)
+from .models import AllowedUserEvent
+
+
+@receiver(post_init, sender=CustomUser)
+def remember_telegram_id(sender, instance, **kwargs):
+    """Keep loaded telegram_id to detect its change on save."""
+    instance._loaded_telegram_id = instance.__dict__.get('telegram_id')
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_profile_cache(sender, instance, **kwargs):
+    """Drop cached bot profile of the user under old and new Telegram ID."""
+    telegram_ids = {instance._loaded_telegram_id}
+    if 'telegram_id' in instance.__dict__:
+        telegram_ids.add(instance.telegram_id)
+    else:
+        telegram_ids.update(
+            CustomUser.objects.filter(pk=instance.pk)
+            .values_list('telegram_id', flat=True)
+        )
+    for telegram_id in telegram_ids - {None}:
+        invalidate_user_profile(telegram_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def publish_telegram_id_change(sender, instance, created, **kwargs):
+    """Publish add/remove events of allowed users for the bot."""
+    if 'telegram_id' not in instance.__dict__:
+        return
+
+    old_id = None if created else instance._loaded_telegram_id
+    new_id = instance.telegram_id
+    if old_id == new_id:
+        return
+
+    events = []
+    if old_id is not None:
+        events.append(AllowedUserEvent(
+            telegram_id=old_id, action=AllowedUserEvent.ActionVerbose.REMOVE
+        ))
+    if new_id is not None:
+        events.append(AllowedUserEvent(
+            telegram_id=new_id, action=AllowedUserEvent.ActionVerbose.ADD
+        ))
+    AllowedUserEvent.objects.bulk_create(events)
+    instance._loaded_telegram_id = new_id
+
+
+@receiver(post_delete, sender=CustomUser)
+def publish_telegram_id_removal(sender, instance, **kwargs):
+    """Publish remove event of the deleted user."""
+    if instance._loaded_telegram_id is not None:
+        AllowedUserEvent.objects.create(
+            telegram_id=instance._loaded_telegram_id,
+            action=AllowedUserEvent.ActionVerbose.REMOVE,
+        )
+
+
+@receiver(post_save, sender=SearchRequest)
+@receiver(post_delete, sender=SearchRequest)
+@receiver(post_save, sender=Departure)
+@receiver(post_delete, sender=Departure)
+@receiver(post_save, sender=Crew)
+@receiver(post_delete, sender=Crew)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_departures_cache(sender, instance, **kwargs):
+    """Drop cached departures when a departure or its items change."""
+    invalidate_departures()
+
+
+@receiver(post_save, sender=Crew)
+@receiver(post_delete, sender=Crew)
+@receiver(m2m_changed, sender=Crew.passengers.through)
+def invalidate_dashboards_cache(sender, **kwargs):
+    """Drop cached main menus showing the total number of crews."""
+    invalidate_dashboards()
+
+
+@receiver(post_save, sender=JoinRequest)
+@receiver(post_delete, sender=JoinRequest)
+def invalidate_passenger_dashboard_cache(sender, instance, **kwargs):
+    """Drop cached main menu of the join request passenger."""
+    invalidate_dashboard(instance.passenger_id)
+
+
+# Fields of users displayed in crew messages
+CREW_USER_FIELDS = {
+    'first_name', 'last_name', 'patronymic_name', 'nickname', 'phone_number',
+    'telegram_id',
+}
+
+
+def invalidate_departure_render(departure_ids) -> None:
+    """Drop rendered messages of the departures and their crews."""
+    invalidate_render('departure', departure_ids)
+    invalidate_render(
+        'crew',
+        Crew.objects.filter(departure__in=departure_ids)
+        .values_list('pk', flat=True)
+    )
+
+
+@receiver(post_init, sender=Crew)
+def remember_departure(sender, instance, **kwargs):
+    """Keep loaded departure to drop its messages on move of the crew."""
+    instance._loaded_departure_id = instance.__dict__.get('departure_id')
+
+
+@receiver(post_save, sender=Crew)
+@receiver(post_delete, sender=Crew)
+def invalidate_crew_render(sender, instance, **kwargs):
+    """Drop rendered messages of the crew and crews of its departures."""
+    departure_id = instance.__dict__.get('departure_id')
+    invalidate_render('crew', [instance.pk])
+    invalidate_departure_render(
+        {departure_id, instance._loaded_departure_id} - {None}
+    )
+    instance._loaded_departure_id = departure_id
+
+
+@receiver(post_save, sender=Departure)
+@receiver(post_delete, sender=Departure)
+def invalidate_departure_render_cache(sender, instance, **kwargs):
+    """Drop rendered messages of the departure."""
+    invalidate_departure_render([instance.pk])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_render(sender, instance, **kwargs):
+    """Drop rendered messages listing tasks of the departure."""
+    invalidate_departure_render([instance.departure_id])
+
+
+@receiver(post_save, sender=SearchRequest)
+@receiver(post_delete, sender=SearchRequest)
+def invalidate_search_request_render(sender, instance, **kwargs):
+    """Drop rendered messages of departures of the search request."""
+    invalidate_departure_render(list(
+        Departure.objects.filter(search_request=instance.pk)
+        .values_list('pk', flat=True)
+    ))
+
+
+@receiver(m2m_changed, sender=Crew.passengers.through)
+def invalidate_passengers_render(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    """Drop rendered messages of crews with changed passengers."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_render('crew', [instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_crews = list(
+            instance.passenger_crews.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        invalidate_render('crew', instance._cleared_crews)
+    elif action in ('post_add', 'post_remove'):
+        invalidate_render('crew', pk_set)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_crews_render(sender, instance, created, update_fields,
+                                 **kwargs):
+    """Drop rendered messages of crews showing the driver or passenger."""
+    if created or update_fields and not CREW_USER_FIELDS & update_fields:
+        return
+    invalidate_render(
+        'crew',
+        Crew.objects.filter(Q(driver=instance) | Q(passengers=instance))
+        .values_list('pk', flat=True)
+    )
@@ -1,3 +1,1223 @@
-from django.test import TestCase
+import asyncio
+import datetime as dt
+import io
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.gis.geos import Point
+from django.db import connections
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.utils import timezone
+from telegram import Chat, Message, Update, User, error
+from telegram.ext import (
+    ApplicationBuilder, ApplicationHandlerStop, ConversationHandler,
+    MessageHandler, TypeHandler, filters
+)
+from telegram.warnings import PTBUserWarning
+
+from tgbot import callback
+from tgbot.admission import BUSY_TEXT, Admission
+from tgbot.announcements import announce_crew, get_text_hash
+from tgbot.broadcast import (
+    Broadcaster, BroadcastReport, Coalescer, DeliveryStatus, TokenBucket
+)
+from tgbot.db import DatabasePool, db_pool
+from tgbot.geocoding import GeocodingService, StubBackend, normalize_address
+from tgbot.gpx import parse_gpx, save_track
+from tgbot.ops_board import OpsBoard, render_ops_board
+from tgbot.outbox import OutboxWorker, commit_with_message
+from tgbot.persistence import DatabasePersistence
+from tgbot.queries import (
+    get_crew_snapshot, get_dashboard, get_nearest_crews, get_open_departures,
+    get_ops_board, get_user_profile
+)
+from tgbot.reachability import (
+    ReachabilityRegistry, aload_reachability, load_reachability
+)
+from tgbot.render import get_render_key
+from tgbot.update_processor import UserUpdateProcessor
+from tgbot.user_state import (
+    UserDataLimiter, end_idle_conversation, get_size, get_user_data_stats
+)
+from tgbot.webhook import WebhookBot
+from web_dashboard.logistics.models import (
+    Crew, Departure, JoinRequest, Task, Track
+)
+from web_dashboard.logistics.tests import create_crew
+from web_dashboard.search_requests.models import SearchRequest
+from web_dashboard.users.models import CustomUser
+from .models import (
+    AllowedUserEvent, ConversationRecord, CrewAnnouncement, GeocodeCache,
+    OutboxMessage, TelegramUser
+)
+from .views import TelegramWebhookView
+
+
+class GeocodingServiceTest(TestCase):
+    """Test cached geocoding with the offline backend."""
+
+    def setUp(self):
+        self.backend = StubBackend({'Yerevan, Abovyan 1': (40.18, 44.52)})
+        self.geocoder = GeocodingService(self.backend)
+
+    def test_normalize_address(self):
+        self.assertEqual(
+            normalize_address('  Yerevan ,Abovyan   1. '),
+            'yerevan, abovyan 1'
+        )
+
+    async def test_coordinates_cached(self):
+        psn = await self.geocoder.coordinates('Yerevan, Abovyan 1')
+        self.assertEqual(psn, (40.18, 44.52))
+
+        await self.geocoder.coordinates('yerevan ,  abovyan 1')
+        self.assertEqual(self.backend.calls, 1)
+        self.assertTrue(await GeocodeCache.objects.filter(
+            kind=GeocodeCache.KindVerbose.FORWARD,
+            query='yerevan, abovyan 1',
+        ).aexists())
+
+    async def test_coordinates_stored(self):
+        await self.geocoder.coordinates('Yerevan, Abovyan 1')
+
+        geocoder = GeocodingService(self.backend)
+        psn = await geocoder.coordinates('Yerevan, Abovyan 1')
+        self.assertEqual(psn, (40.18, 44.52))
+        self.assertEqual(self.backend.calls, 1)
+
+    async def test_address(self):
+        address = await self.geocoder.address(40.18, 44.52)
+        self.assertEqual(address, 'yerevan, abovyan 1')
+
+        await self.geocoder.address(40.180001, 44.520001)
+        self.assertEqual(self.backend.calls, 1)
+
+    async def test_nothing_found(self):
+        with self.assertRaises(ValueError):
+            await self.geocoder.coordinates('Unknown place')
+
+
+class AllowedUserEventTest(TestCase):
+    """Test publishing of CustomUser Telegram ID changes."""
+
+    def get_events(self):
+        return list(
+            AllowedUserEvent.objects.order_by('pk')
+            .values_list('telegram_id', 'action')
+        )
+
+    def test_events(self):
+        ADD = AllowedUserEvent.ActionVerbose.ADD
+        REMOVE = AllowedUserEvent.ActionVerbose.REMOVE
+
+        user = CustomUser.objects.create(
+            username='user', dateofbirth='2000-01-01', telegram_id=1
+        )
+        self.assertEqual(self.get_events(), [(1, ADD)])
+
+        user.first_name = 'Name'
+        user.save()
+        self.assertEqual(len(self.get_events()), 1)
+
+        user = CustomUser.objects.get(pk=user.pk)
+        user.telegram_id = 2
+        user.save()
+        self.assertEqual(self.get_events()[1:], [(1, REMOVE), (2, ADD)])
+
+        user.delete()
+        self.assertEqual(self.get_events()[3:], [(2, REMOVE)])
+
+    def test_deferred_telegram_id(self):
+        CustomUser.objects.create(username='user', dateofbirth='2000-01-01')
+        user = CustomUser.objects.only('first_name').get()
+        user.first_name = 'Name'
+        user.save()
+        self.assertEqual(self.get_events(), [])
+
+
+class CallbackDataTest(SimpleTestCase):
+    """Test signed callback data of inline buttons."""
+
+    def test_encode_decode(self):
+        data = callback.encode(chr(5), 1, 2**40)
+        self.assertLessEqual(len(data.encode()), callback.MAX_LENGTH)
+        self.assertEqual(callback.decode(data), (chr(5), [1, 2**40]))
+        self.assertEqual(callback.decode(callback.encode('A')), ('A', []))
+        self.assertRegex(data, callback.pattern(chr(5)))
+        self.assertRegex(chr(5), callback.pattern(chr(5)))
+        self.assertNotRegex(data, callback.pattern(chr(6)))
+
+    def test_invalid(self):
+        data = callback.encode('A', 10)
+        for invalid in ('A', '10', data.replace(':a:', ':b:'), data[:-1]):
+            with self.assertRaises(callback.InvalidCallbackData):
+                callback.decode(invalid)
+
+        with self.settings(SECRET_KEY='other'):
+            with self.assertRaises(callback.InvalidCallbackData):
+                callback.decode(data)
+
+    def test_too_long(self):
+        with self.assertRaises(ValueError):
+            callback.encode('A', *range(1000, 1020))
+
+
+class UserDataLimiterTest(SimpleTestCase):
+    """Test LRU eviction and size of user_data."""
+
+    class Application:
+        def __init__(self, persistence=None):
+            self.persistence = persistence
+            self.user_data = {}
+            self.dropped = []
+
+        def drop_user_data(self, user_id):
+            self.user_data.pop(user_id, None)
+            self.dropped.append(user_id)
+
+    def test_evict_least_recent(self):
+        application = self.Application()
+        limiter = UserDataLimiter(max_users=2)
+
+        for user_id in (1, 2, 1, 3, 4):
+            limiter.touch(application, user_id)
+
+        self.assertEqual(application.dropped, [2, 1])
+        self.assertEqual(limiter.evicted, 2)
+
+    def test_evict_to_persistence(self):
+        persistence = mock.Mock()
+        application = self.Application(persistence)
+        application.user_data[1] = {'status': 'A'}
+        limiter = UserDataLimiter(max_users=1)
+
+        limiter.touch(application, 1)
+        limiter.touch(application, 2)
+
+        persistence.evict_user_data.assert_called_once_with(
+            1, {'status': 'A'}
+        )
+        self.assertEqual(application.dropped, [1])
+
+    def test_size(self):
+        small = {'status': 'A'}
+        large = {'status': 'A', 'draft': {'title': 'x' * 1000}}
+        self.assertGreater(get_size(large), get_size(small) + 1000)
+
+        shared = ['x' * 1000]
+        self.assertLess(get_size([shared, shared]), get_size(shared) + 100)
+
+        stats = get_user_data_stats({1: small, 2: large})
+        self.assertEqual(stats['users'], 2)
+        self.assertEqual(stats['max_user'], 2)
+        self.assertEqual(
+            stats['total'], get_size(small) + get_size(large)
+        )
+
+
+class ConversationTimeoutTest(SimpleTestCase):
+    """Test nested conversations end together with the parent one."""
+
+    timeout = 0.05
+
+    async def enter(self, update, context):
+        context.user_data[update.message.text] = True
+        return 1
+
+    def get_update(self, update_id, text):
+        message = Message(
+            update_id, timezone.now(), Chat(1, 'private'),
+            from_user=User(1, 'User', False), text=text,
+        )
+        message.set_bot(self.application.bot)
+        return Update(update_id, message=message)
+
+    @mock.patch('telegram.Bot.get_me', mock.AsyncMock())
+    @mock.patch('telegram.Bot.bot', new_callable=mock.PropertyMock,
+                return_value=User(2, 'Bot', True))
+    @mock.patch('telegram.Bot.send_message', new_callable=mock.AsyncMock)
+    async def test_timeout(self, send_message, bot):
+        self.application = ApplicationBuilder().token('1:A').updater(None)\
+            .build()
+        # the same nesting and timeouts as in tgbot.bot
+        with self.assertWarnsRegex(PTBUserWarning,
+                                   'conversation_timeout.*nested'):
+            nested = ConversationHandler(
+                entry_points=[
+                    MessageHandler(filters.Text(['nested']), self.enter)
+                ],
+                states={1: [MessageHandler(filters.TEXT, self.enter)]},
+                fallbacks=[],
+                conversation_timeout=self.timeout,
+            )
+            parent = ConversationHandler(
+                entry_points=[
+                    MessageHandler(filters.Text(['start']), self.enter)
+                ],
+                states={
+                    1: [nested],
+                    ConversationHandler.TIMEOUT: [
+                        TypeHandler(Update, end_idle_conversation)
+                    ],
+                },
+                fallbacks=[],
+                conversation_timeout=self.timeout,
+            )
+        self.application.add_handler(parent)
+
+        async with self.application:
+            await self.application.start()
+            await self.application.process_update(
+                self.get_update(1, 'start')
+            )
+            await self.application.process_update(
+                self.get_update(2, 'nested')
+            )
+            self.assertEqual(nested._conversations, {(1, 1): 1})
+            self.assertEqual(self.application.user_data[1],
+                             {'start': True, 'nested': True})
+
+            await asyncio.sleep(self.timeout * 4)
+            await self.application.stop()
+
+        self.assertEqual(parent._conversations, {})
+        self.assertEqual(nested._conversations, {})
+        self.assertEqual(self.application.user_data[1], {})
+        send_message.assert_awaited_once()
+
+
+class DatabasePoolTest(SimpleTestCase):
+    """Test ORM calls run in pool threads keeping their connections."""
+
+    def get_connection(self):
+        return threading.current_thread().name, id(connections['default'])
+
+    async def test_run(self):
+        pool = DatabasePool(1)
+        self.addCleanup(pool.shutdown)
+
+        with mock.patch('tgbot.db.close_old_connections') as close:
+            first = await pool.run(self.get_connection)
+            second = await pool.run(self.get_connection)
+
+        self.assertTrue(first[0].startswith('bot-db'))
+        # the thread and its connection are reused
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, self.get_connection())
+        # expired connections are closed before and after every call
+        self.assertEqual(close.call_count, 4)
+
+    async def test_error(self):
+        pool = DatabasePool(1)
+        self.addCleanup(pool.shutdown)
+
+        with mock.patch('tgbot.db.close_old_connections') as close:
+            with self.assertRaises(ZeroDivisionError):
+                await pool.run(lambda: 1 / 0)
+        self.assertEqual(close.call_count, 2)
+
+    async def test_concurrent(self):
+        pool = DatabasePool(2)
+        self.addCleanup(pool.shutdown)
+        barrier = threading.Barrier(2, timeout=1)
+
+        # both calls wait for each other, so they must run in parallel
+        await asyncio.gather(pool.run(barrier.wait), pool.run(barrier.wait))
+
+    async def test_without_pool(self):
+        pool = DatabasePool(0)
+        name, _ = await pool.run(self.get_connection)
+        self.assertFalse(name.startswith('bot-db'))
+        pool.shutdown()
+
+
+class TokenBucketTest(SimpleTestCase):
+    """Test tokens are refilled with the rate up to the capacity."""
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('tgbot.broadcast.time.monotonic',
+                             lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+        self.now += 0.15
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+        self.now += 10
+        self.assertTrue(bucket.is_full)
+        self.assertTrue(bucket.try_acquire(2))
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10)
+        bucket.pause(1)
+        self.now += 0.5
+        self.assertFalse(bucket.try_acquire())
+        self.now += 0.7
+        self.assertTrue(bucket.try_acquire())
+
+
+class BroadcasterTest(SimpleTestCase):
+    """Test delivery statuses, retries and edits of messages."""
+
+    def get_bot(self, *results):
+        return mock.Mock(send_message=mock.AsyncMock(side_effect=[
+            mock.Mock(message_id=9) if result is None else result
+            for result in results
+        ]))
+
+    async def test_acquire_waits(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+
+    async def test_retry_after(self):
+        bot = self.get_bot(error.RetryAfter(0.05), None)
+        broadcaster = Broadcaster(chat_rate=1000)
+
+        start = time.monotonic()
+        status = await broadcaster.send(bot, 1, 'Text')
+        self.assertEqual(status, DeliveryStatus.DELIVERED)
+        self.assertEqual(bot.send_message.await_count, 2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    async def test_network_errors(self):
+        bot = self.get_bot(error.NetworkError('Reset'), error.TimedOut(), None)
+        broadcaster = Broadcaster(chat_rate=1000, backoff=0.001)
+        self.assertEqual(await broadcaster.send(bot, 1, 'Text'),
+                         DeliveryStatus.DELIVERED)
+        self.assertEqual(bot.send_message.await_count, 3)
+
+        bot = self.get_bot(*[error.TimedOut()] * 3)
+        broadcaster = Broadcaster(chat_rate=1000, max_retries=2,
+                                  backoff=0.001)
+        self.assertEqual(await broadcaster.send(bot, 1, 'Text'),
+                         DeliveryStatus.FAILED)
+        self.assertEqual(bot.send_message.await_count, 3)
+
+    async def test_broadcast_report(self):
+        async def send_message(chat_id, text):
+            match chat_id:
+                case 2:
+                    raise error.Forbidden('Forbidden: bot was blocked by '
+                                          'the user')
+                case 3:
+                    raise error.Forbidden('Forbidden: user is deactivated')
+                case 4:
+                    raise error.BadRequest('Chat not found')
+            return mock.Mock(message_id=chat_id)
+
+        report = await Broadcaster(chat_rate=1000).broadcast(
+            mock.Mock(send_message=send_message), [1, 2, 3, 4, 5], 'Text'
+        )
+        self.assertEqual(report.delivered, [1, 5])
+        self.assertEqual(report.blocked, [2])
+        self.assertEqual(report.deactivated, [3])
+        self.assertEqual(report.failed, [4])
+        self.assertTrue(str(report).startswith(
+            'delivered: 2, failed: 1, blocked: 1, deactivated: 1, skipped: 0'
+        ))
+
+    async def test_announce(self):
+        async def edit_message_text(text, chat_id, message_id):
+            if message_id == 6:
+                raise error.BadRequest('Message to edit not found')
+            if message_id == 8:
+                raise error.BadRequest('Message is not modified')
+
+        bot = mock.Mock(
+            send_message=mock.AsyncMock(return_value=mock.Mock(message_id=9)),
+            edit_message_text=edit_message_text,
+        )
+        report, delivered = await Broadcaster(chat_rate=1000).announce(
+            bot, {1: None, 2: 5, 3: 6, 4: 8}, 'Text'
+        )
+
+        self.assertEqual(delivered, {1: 9, 2: 5, 3: 9, 4: 8})
+        self.assertEqual(bot.send_message.await_count, 2)
+        self.assertEqual(len(report.delivered), 4)
+
+    async def test_skip_unreachable(self):
+        bot = mock.Mock(send_message=mock.AsyncMock(
+            side_effect=[mock.Mock(message_id=9), error.Forbidden(
+                'Forbidden: user is deactivated'
+            )]
+        ))
+        registry = mock.Mock(
+            is_reachable=lambda chat_id: chat_id != 3,
+            record=mock.AsyncMock(),
+        )
+        report, delivered = await Broadcaster(
+            chat_rate=1000, registry=registry
+        ).announce(bot, {1: None, 2: None, 3: None}, 'Text')
+
+        self.assertEqual(bot.send_message.await_count, 2)
+        self.assertEqual(report.skipped, [3])
+        self.assertEqual(report.deactivated, [2])
+        registry.record.assert_awaited_once_with(report)
+
+
+class AdmissionTest(SimpleTestCase):
+    """Test updates over the limits are answered without handling."""
+
+    def get_update(self, data=None, message_id=1):
+        query = mock.Mock(
+            data=data, from_user=mock.Mock(id=1), answer=mock.AsyncMock(),
+            message=mock.Mock(message_id=message_id),
+        ) if data else None
+        return mock.Mock(
+            callback_query=query,
+            effective_user=mock.Mock(id=1),
+            effective_message=mock.Mock(reply_text=mock.AsyncMock()),
+        )
+
+    async def test_duplicate_callback(self):
+        admission = Admission()
+        await admission.check(self.get_update('apply'), None)
+
+        update = self.get_update('apply')
+        with self.assertRaises(ApplicationHandlerStop):
+            await admission.check(update, None)
+        update.callback_query.answer.assert_awaited_once_with(None)
+
+        # the same button of another message
+        await admission.check(self.get_update('apply', message_id=2), None)
+
+    async def test_rate_limit(self):
+        admission = Admission(rate=1, burst=2)
+        await admission.check(self.get_update(), None)
+        await admission.check(self.get_update(), None)
+
+        for _ in range(2):
+            update = self.get_update()
+            with self.assertRaises(ApplicationHandlerStop):
+                await admission.check(update, None)
+        # the message is answered once
+        update.effective_message.reply_text.assert_not_awaited()
+        self.assertEqual(admission.rejected, 2)
+
+    async def test_limit(self):
+        admission = Admission(concurrency=1)
+        started = asyncio.Event()
+
+        @admission.limit
+        async def handler(update, context):
+            started.set()
+            await asyncio.sleep(0.01)
+            return 1
+
+        task = asyncio.create_task(handler(self.get_update('list'), None))
+        await started.wait()
+
+        update = self.get_update('list')
+        self.assertIsNone(await handler(update, None))
+        update.callback_query.answer.assert_awaited_once_with(BUSY_TEXT)
+        self.assertEqual(await task, 1)
+
+
+class UserUpdateProcessorTest(SimpleTestCase):
+    """Test updates of a user are ordered and users run concurrently."""
+
+    def get_update(self, user_id):
+        return Update(1, message=Message(
+            1, timezone.now(), Chat(user_id, 'private'),
+            from_user=User(user_id, 'User', False),
+        ))
+
+    async def test_order(self):
+        processor = UserUpdateProcessor(max_queue=2)
+        handled = []
+
+        async def handle(name, delay):
+            await asyncio.sleep(delay)
+            handled.append(name)
+
+        await asyncio.gather(
+            processor.process_update(self.get_update(1), handle('1a', 0.02)),
+            processor.process_update(self.get_update(1), handle('1b', 0)),
+            processor.process_update(self.get_update(1), handle('1c', 0)),
+            processor.process_update(self.get_update(2), handle('2a', 0)),
+        )
+
+        self.assertEqual(handled, ['2a', '1a', '1b'])
+        stats = processor.get_stats()
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['users'], 0)
+        self.assertGreater(stats['wait_max'], 0.01)
+
+
+GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <metadata><time>2024-05-01T08:00:00Z</time></metadata>
+  <trk>
+    <name>Forest</name>
+    <trkseg>
+      <trkpt lat="40.0" lon="44.0"><time>2024-05-01T10:00:00Z</time></trkpt>
+      <trkpt lat="40.0" lon="44.001"></trkpt>
+    </trkseg>
+    <trkseg>
+      <trkpt lat="40.0" lon="44.002"><time>2024-05-01T11:30:00Z</time></trkpt>
+    </trkseg>
+  </trk>
+</gpx>"""
+
+
+class GpxTest(SimpleTestCase):
+    """Test GPX track points are parsed as a stream."""
+
+    def test_parse(self):
+        track = parse_gpx(io.BytesIO(GPX))
+        self.assertEqual(track.name, 'Forest')
+        self.assertEqual(track.points_count, 3)
+        self.assertAlmostEqual(track.length, 170.4, places=0)
+        self.assertEqual(track.finished_at - track.started_at,
+                         dt.timedelta(hours=1, minutes=30))
+
+        path = track.get_path()
+        self.assertEqual(path.srid, 4326)
+        self.assertEqual(path.coords[-1], (44.002, 40.0))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_gpx(io.BytesIO(b'<gpx><trk><trkseg><trkpt lat="1" lon="2"/>'
+                                 b'</trkseg></trk></gpx>'))
+        with self.assertRaises(ValueError):
+            parse_gpx(io.BytesIO(b'<gpx><trk><trkseg><trkpt lat="1"/>'
+                                 b'</trkseg></trk></gpx>'))
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET='secret')
+class TelegramWebhookViewTest(SimpleTestCase):
+    """Test updates are validated, deduplicated and queued."""
+
+    def setUp(self):
+        self.webhook_bot = WebhookBot(put_timeout=0.01)
+        self.webhook_bot.application = mock.Mock(
+            bot=None, update_queue=asyncio.Queue(maxsize=1)
+        )
+        self.webhook_bot.accepting = True
+        patcher = mock.patch('web_dashboard.bot_api.views.webhook_bot',
+                             self.webhook_bot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, data, token='secret'):
+        request = RequestFactory().post(
+            '/telegram/', data, content_type='application/json',
+            headers={'X-Telegram-Bot-Api-Secret-Token': token},
+        )
+        response = await TelegramWebhookView.as_view()(request)
+        return response.status_code
+
+    async def test_secret_token(self):
+        self.assertEqual(await self.post({'update_id': 1}, 'other'), 403)
+        self.assertEqual(await self.post({'update_id': 1}, ''), 403)
+        with self.settings(TELEGRAM_WEBHOOK_SECRET=None):
+            self.assertEqual(await self.post({'update_id': 1}, ''), 403)
+        self.assertTrue(self.webhook_bot.application.update_queue.empty())
+
+    async def test_duplicate(self):
+        self.assertEqual(await self.post({'update_id': 1}), 200)
+        self.assertEqual(await self.post({'update_id': 1}), 200)
+        self.assertEqual(self.webhook_bot.application.update_queue.qsize(), 1)
+
+    async def test_invalid(self):
+        for data in ({}, {'update_id': '1'}, [1], 'update'):
+            self.assertEqual(await self.post(data), 400)
+
+        self.assertEqual(
+            await self.post({'update_id': 1, 'message': 'text'}), 400
+        )
+        # the update isn't taken for a duplicate when redelivered
+        self.assertEqual(await self.post({'update_id': 1}), 200)
+
+    async def test_queue_full(self):
+        self.assertEqual(await self.post({'update_id': 1}), 200)
+        self.assertEqual(await self.post({'update_id': 2}), 503)
+
+        queue = self.webhook_bot.application.update_queue
+        queue.get_nowait()
+        self.assertEqual(await self.post({'update_id': 2}), 200)
+        self.assertEqual(queue.get_nowait().update_id, 2)
+
+    async def test_not_running(self):
+        self.webhook_bot.accepting = False
+        self.assertEqual(await self.post({'update_id': 1}), 503)
+
+
+class CoalescerTest(SimpleTestCase):
+    """Test notifications are merged and superseded within the window."""
+
+    def setUp(self):
+        self.bot = mock.Mock()
+        self.broadcaster = mock.Mock(broadcast=mock.AsyncMock())
+
+    async def test_digest(self):
+        coalescer = Coalescer(self.broadcaster, window=0.01)
+        for delta in (1, 1, 1):
+            coalescer.count_join_requests(
+                self.bot, 10, 1, 'A-1 (Active)', delta, '3/4'
+            )
+        # crew title changes with its status
+        coalescer.count_join_requests(self.bot, 10, 1, 'A-1', -1, '3/4')
+        coalescer.count_join_requests(
+            self.bot, 20, 2, 'B-2', -1, '0/4', '⚠ Name left the crew.'
+        )
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.broadcaster.broadcast.await_count, 2)
+        self.broadcaster.broadcast.assert_any_await(
+            self.bot, [10], "🟢 Crew 'A-1': +3, –1 join requests! (3/4)"
+        )
+        self.broadcaster.broadcast.assert_any_await(
+            self.bot, [20],
+            "🔴 Crew 'B-2': –1 join request! (0/4)\n⚠ Name left the crew."
+        )
+        self.assertEqual((coalescer.events, coalescer.sent), (5, 2))
+
+    async def test_superseded_broadcast(self):
+        coalescer = Coalescer(self.broadcaster)
+        coalescer.broadcast(self.bot, ('crew', 1), [1, 2], 'Created')
+        coalescer.broadcast(self.bot, ('crew', 1), [1, 2], 'Updated')
+        await coalescer.flush()
+
+        self.broadcaster.broadcast.assert_awaited_once_with(
+            self.bot, [1, 2], 'Updated'
+        )
+
+    async def test_flush_waits_for_sending(self):
+        started, sent = asyncio.Event(), asyncio.Event()
+
+        async def broadcast(bot, chat_ids, text):
+            started.set()
+            await asyncio.sleep(0.02)
+            sent.set()
+
+        coalescer = Coalescer(mock.Mock(broadcast=broadcast), window=0)
+        coalescer.broadcast(self.bot, ('crew', 1), [1], 'Created')
+        await started.wait()
+
+        await coalescer.flush()
+        self.assertTrue(sent.is_set())
+        self.assertEqual(coalescer.sent, 1)
+
+
+# Queries run in the test thread to see the test transaction
+@mock.patch.object(db_pool, '_executor', None)
+class DatabasePersistenceTest(TestCase):
+    """Test conversations and user_data saved as ConversationRecord."""
+
+    async def test_save_and_load(self):
+        persistence = DatabasePersistence(write_delay=0)
+        self.assertEqual(await persistence.get_conversations('action'), {})
+
+        await persistence.update_conversation('action', (1, 1), 'A')
+        await persistence.update_conversation('nested', (1, 1), 'B')
+        await persistence.update_conversation('action', (2, 2), 'C')
+        await persistence.update_user_data(
+            1, {'status': 'A', 'psn': (40.18, 44.52), 'user': object()}
+        )
+        await persistence.flush()
+        self.assertEqual(await ConversationRecord.objects.acount(), 2)
+
+        persistence = DatabasePersistence(write_delay=0)
+        self.assertEqual(
+            await persistence.get_conversations('action'),
+            {(1, 1): 'A', (2, 2): 'C'}
+        )
+        self.assertEqual(
+            await persistence.get_conversations('nested'), {(1, 1): 'B'}
+        )
+
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        self.assertEqual(user_data, {'status': 'A', 'psn': [40.18, 44.52]})
+
+        await persistence.update_conversation('nested', (1, 1), None)
+        await persistence.flush()
+        record = await ConversationRecord.objects.aget(user_id=1)
+        self.assertEqual(record.conversations, {'action': [[[1, 1], 'A']]})
+        self.assertEqual(record.user_data['status'], 'A')
+
+    async def test_evict_user_data(self):
+        persistence = DatabasePersistence(write_delay=0)
+        await persistence.refresh_user_data(1, {})
+
+        persistence.evict_user_data(1, {'status': 'A'})
+        await persistence.drop_user_data(1)
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        self.assertEqual(user_data, {'status': 'A'})
+
+        await persistence.flush()
+        record = await ConversationRecord.objects.aget(user_id=1)
+        self.assertEqual(record.user_data, {'status': 'A'})
+
+    async def test_expired_conversations(self):
+        persistence = DatabasePersistence(write_delay=0)
+        await persistence.update_conversation('action', (1, 1), 'A')
+        await persistence.flush()
+        await ConversationRecord.objects.aupdate(
+            updated_at=timezone.now() - dt.timedelta(hours=2)
+        )
+
+        persistence = DatabasePersistence(
+            write_delay=0, max_age=dt.timedelta(hours=1)
+        )
+        self.assertEqual(await persistence.get_conversations('action'), {})
+
+
+class OpsBoardTest(SimpleTestCase):
+    """Test the pinned board is edited only on changes."""
+
+    search_request = {
+        'pk': 1, 'full_name': 'Missing Person', 'city': 'Yerevan',
+        'departures_count': 2, 'available': 3, 'on_mission': 1,
+        'returning': 0, 'passengers': 5, 'seats': 9,
+    }
+
+    def test_render(self):
+        text = render_ops_board([self.search_request])
+        self.assertIn('departures: 2', text)
+        self.assertIn('Available: 3 (5/9 seats taken)', text)
+
+        text = render_ops_board([self.search_request] * 100)
+        self.assertLessEqual(len(text), 4096 - 32)
+
+    async def test_update(self):
+        pinned = mock.Mock(message_id=5, from_user=mock.Mock(id=1))
+        bot = mock.Mock(
+            id=1,
+            get_chat=mock.AsyncMock(
+                return_value=mock.Mock(pinned_message=pinned)
+            ),
+            edit_message_text=mock.AsyncMock(),
+            pin_chat_message=mock.AsyncMock(),
+        )
+        board = OpsBoard(Broadcaster(chat_rate=1000), chat_id=-100)
+
+        self.assertTrue(await board.update(bot, 'A'))
+        self.assertFalse(await board.update(bot, 'A'))
+        self.assertTrue(await board.update(bot, 'B'))
+
+        # the board pinned before is edited
+        self.assertEqual(board.message_id, 5)
+        self.assertEqual(bot.edit_message_text.await_count, 2)
+        bot.pin_chat_message.assert_not_awaited()
+
+
+# Queries run in the test thread to see the test transaction
+@mock.patch.object(db_pool, '_executor', None)
+class CrewAnnouncementTest(TestCase):
+    """Test crew announcements are edited in place."""
+
+    def setUp(self):
+        self.crew = create_crew()
+        self.bot = mock.Mock(
+            send_message=mock.AsyncMock(
+                return_value=mock.Mock(message_id=10)
+            ),
+            edit_message_text=mock.AsyncMock(),
+        )
+
+    async def announce(self, chat_ids, text):
+        return await announce_crew(
+            Broadcaster(chat_rate=1000), self.crew.pk, self.bot, chat_ids,
+            text
+        )
+
+    async def test_edit_in_place(self):
+        await self.announce([1, 2], 'Available')
+        self.assertEqual(self.bot.send_message.await_count, 2)
+
+        # chats with the same text are skipped, new chats get a message
+        await self.announce([1, 3], 'Available')
+        self.assertEqual(self.bot.send_message.await_count, 3)
+        self.bot.edit_message_text.assert_not_awaited()
+
+        report = await self.announce([], 'On mission')
+        self.assertEqual(self.bot.edit_message_text.await_count, 3)
+        self.assertEqual(len(report.delivered), 3)
+        self.assertEqual(
+            await CrewAnnouncement.objects.filter(
+                crew=self.crew, text_hash=get_text_hash('On mission')
+            ).acount(),
+            3
+        )
+
+
+@mock.patch.object(db_pool, '_executor', None)
+class ReachabilityRegistryTest(TestCase):
+    """Test delivery results are saved and unreachable chats re-probed."""
+
+    def setUp(self):
+        TelegramUser.objects.bulk_create([
+            TelegramUser(user_id=user_id, last_action=timezone.now())
+            for user_id in (1, 2)
+        ])
+        self.registry = ReachabilityRegistry(*load_reachability())
+
+    async def test_record(self):
+        self.assertTrue(self.registry.is_reachable(1))
+        self.assertFalse(self.registry.is_reachable(3))
+
+        await self.registry.record(
+            BroadcastReport(delivered=[1], blocked=[2])
+        )
+        self.assertFalse(self.registry.is_reachable(2))
+
+        user = await TelegramUser.objects.aget(user_id=1)
+        self.assertIsNotNone(user.last_delivery)
+        self.assertEqual(await aload_reachability(), ({1, 2}, {2}))
+
+    async def test_probe(self):
+        async def send_chat_action(chat_id, action):
+            if chat_id == 2:
+                raise error.Forbidden('Forbidden: bot was blocked by the user')
+
+        await self.registry.record(BroadcastReport(blocked=[1, 2]))
+        bot = mock.Mock(
+            send_chat_action=mock.AsyncMock(side_effect=send_chat_action)
+        )
+
+        report = await self.registry.probe(
+            bot, max_age=dt.timedelta(0), rate=1000
+        )
+        self.assertEqual(report.delivered, [1])
+        self.assertEqual(report.blocked, [2])
+        self.assertTrue(self.registry.is_reachable(1))
+
+        # recently checked chats are not probed
+        await self.registry.probe(bot, max_age=dt.timedelta(days=1))
+        self.assertEqual(bot.send_chat_action.await_count, 2)
+
+
+@mock.patch.object(db_pool, '_executor', None)
+class TrackTest(TestCase):
+    """Test uploaded tracks are saved with the simplified path."""
+
+    def setUp(self):
+        self.crew = create_crew()
+
+    async def test_save_track(self):
+        track = await save_track(self.crew, None, io.BytesIO(GPX), 'Upload')
+
+        self.assertEqual(track.name, 'Forest')
+        # the middle point is on the straight line
+        self.assertEqual(track.simplified.num_points, 2)
+        self.assertEqual(track.duration, dt.timedelta(hours=1, minutes=30))
+        self.assertTrue(
+            await Track.objects
+            .filter(crew__departure=self.crew.departure_id)
+            .aexists()
+        )
+
+
+@mock.patch.object(db_pool, '_executor', None)
+class OutboxTest(TestCase):
+    """Test saved notifications are sent in order and retried."""
+
+    async def test_drain(self):
+        async def send_message(chat_id, text):
+            if chat_id == 2:
+                raise error.BadRequest('Chat not found')
+            return mock.Mock(message_id=1)
+
+        await commit_with_message(None, [1, 2], 'A', key='a')
+        await commit_with_message(None, [1, 2], 'A', key='a')
+        await commit_with_message(None, [1], 'B')
+        self.assertEqual(await OutboxMessage.objects.acount(), 3)
+
+        bot = mock.Mock(send_message=mock.AsyncMock(side_effect=send_message))
+        worker = OutboxWorker(Broadcaster(chat_rate=1000), backoff=60)
+        report = await worker.drain(bot)
+
+        self.assertEqual(report.delivered, [1, 1])
+        self.assertEqual(report.failed, [2])
+        self.assertEqual(
+            [call.kwargs['text'] for call in bot.send_message.await_args_list
+             if call.kwargs['chat_id'] == 1],
+            ['A', 'B']
+        )
+
+        # the next message of the chat waits for the retry
+        await commit_with_message(None, [2], 'C')
+        report = await worker.drain(bot)
+        self.assertEqual(bot.send_message.await_count, 3)
+        self.assertEqual(
+            await OutboxMessage.objects.filter(
+                status=OutboxMessage.StatusVerbose.PENDING
+            ).acount(),
+            2
+        )
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class BotQueriesTest(TestCase):
+    """Test cached read paths of the bot."""
+
+    def setUp(self):
+        search_request = SearchRequest.objects.create(
+            full_name='Missing Person',
+            city='Yerevan',
+            disappearance_date=dt.date(2024, 5, 1),
+            features='-',
+            clothing='-',
+            personal_belongings='-',
+            health_condition='-',
+            reporter_full_name='Reporter',
+            reporter_contact_details='-',
+            reporter_relationship='-',
+        )
+        self.departure = Departure.objects.create(
+            search_request=search_request
+        )
+        Task.objects.create(
+            departure=self.departure,
+            title='Task',
+            address='Yerevan',
+            coordinates=Point(44.52, 40.18),
+        )
+        self.driver = CustomUser.objects.create(
+            username='driver', dateofbirth='2000-01-01'
+        )
+
+    def create_crew(self, lon=44.52, lat=40.18):
+        return Crew.objects.create(
+            departure=self.departure,
+            title='Crew',
+            driver=self.driver,
+            passengers_max=3,
+            pickup_location=Point(lon, lat, srid=4326),
+            pickup_datetime=timezone.now(),
+        )
+
+    def test_counts_in_one_query(self):
+        self.create_crew()
+        self.create_crew()
+
+        # departures with counts and prefetched tasks
+        with self.assertNumQueries(2):
+            departures = get_open_departures.__wrapped__()
+        self.assertEqual(departures[0].crews_count, 2)
+        self.assertEqual(departures[0].tasks_count, 1)
+
+        with self.assertNumQueries(0):
+            departures = get_open_departures.__wrapped__()
+            self.assertEqual(len(departures[0].tasks.all()), 1)
+
+    def test_invalidated(self):
+        get_open_departures.__wrapped__()
+        self.create_crew()
+        departures = get_open_departures.__wrapped__()
+        self.assertEqual(departures[0].crews_count, 1)
+
+        self.departure.status = Departure.StatusVerbose.CLOSED
+        self.departure.save()
+        self.assertEqual(get_open_departures.__wrapped__(), [])
+
+    def test_dashboard(self):
+        crew = self.create_crew()
+        passenger = CustomUser.objects.create(
+            username='passenger', dateofbirth='2000-01-01'
+        )
+
+        with self.assertNumQueries(2):
+            dashboard = get_dashboard.__wrapped__(self.driver)
+        self.assertEqual(dashboard['crews_count'], 1)
+        self.assertEqual(dashboard['user_crews'][0]['passengers_count'], 0)
+
+        dashboard = get_dashboard.__wrapped__(passenger)
+        self.assertEqual(dashboard['user_crews'], [])
+        self.assertFalse(dashboard['has_join_requests'])
+
+        JoinRequest.objects.create(passenger=passenger, crew=crew)
+        crew.passengers.add(passenger)
+
+        with self.assertNumQueries(2):
+            dashboard = get_dashboard.__wrapped__(passenger)
+        self.assertTrue(dashboard['has_join_requests'])
+
+        dashboard = get_dashboard.__wrapped__(self.driver)
+        self.assertEqual(dashboard['user_crews'][0]['passengers_count'], 1)
+
+        with self.assertNumQueries(0):
+            get_dashboard.__wrapped__(self.driver)
+
+    def test_user_profile(self):
+        self.driver.telegram_id = 100
+        self.driver.save()
+
+        with self.assertNumQueries(1):
+            user = get_user_profile.__wrapped__(100, {'id', 'timezone'})
+        self.assertEqual(user.pk, self.driver.pk)
+        self.assertEqual(user.get_deferred_fields() & {'id', 'timezone'},
+                         set())
+
+        with self.assertNumQueries(0):
+            get_user_profile.__wrapped__(100, {'timezone'})
+
+        # missing fields are loaded together with the cached ones
+        with self.assertNumQueries(1):
+            get_user_profile.__wrapped__(100, {'has_car'})
+        with self.assertNumQueries(0):
+            user = get_user_profile.__wrapped__(
+                100, {'id', 'timezone', 'has_car'}
+            )
+
+        user.timezone = 240
+        user.save(update_fields=['timezone'])
+        user = get_user_profile.__wrapped__(100, {'timezone'})
+        self.assertEqual(user.timezone, 240)
+
+        # the profile is dropped under the old Telegram ID
+        self.driver.telegram_id = 200
+        self.driver.save()
+        with self.assertRaises(CustomUser.DoesNotExist):
+            get_user_profile.__wrapped__(100, {'timezone'})
+
+    def test_crew_snapshot(self):
+        crew = self.create_crew()
+        self.create_crew()
+        passengers = [
+            CustomUser.objects.create(
+                username=f'passenger{i}', dateofbirth='2000-01-01'
+            ) for i in range(3)
+        ]
+        status = JoinRequest.StatusVerbose
+        for passenger, jreq_status in zip(passengers, status.values):
+            JoinRequest.objects.create(
+                passenger=passenger, crew=crew, status=jreq_status
+            )
+        crew.passengers.add(passengers[1])
+
+        with self.assertNumQueries(3):
+            snapshot = get_crew_snapshot.__wrapped__(
+                Crew.objects.filter(driver=self.driver), crew.pk,
+                passengers[0]
+            )
+            self.assertEqual(len(snapshot.passengers.all()), 1)
+            self.assertEqual(len(snapshot.departure.tasks.all()), 1)
+            self.assertEqual(snapshot.departure.search_request.city,
+                             'Yerevan')
+
+        self.assertEqual(snapshot.pending_count, 1)
+        self.assertEqual(snapshot.rejected_count, 1)
+        self.assertEqual(snapshot.departure_crews_count, 2)
+        self.assertTrue(snapshot.has_user_join_request)
+        self.assertEqual(snapshot.driver_tg_id, self.driver.telegram_id)
+
+    def test_crew_snapshot_without_related(self):
+        crew = self.create_crew()
+        with self.assertNumQueries(1):
+            snapshot = get_crew_snapshot.__wrapped__(
+                Crew.objects.all(), crew.pk, self.driver, related=False
+            )
+        self.assertEqual(snapshot.departure_crews_count, 1)
+        self.assertFalse(snapshot.has_user_join_request)
+
+    def test_render_key(self):
+        crew = self.create_crew()
+        tz = dt.timezone(dt.timedelta(hours=4))
+
+        def assertChanged(changed=True):
+            new_key = get_render_key('info', 'crew', crew.pk, tz)
+            self.assertEqual(new_key != key, changed)
+            return new_key
+
+        key = get_render_key('info', 'crew', crew.pk, tz)
+        with self.assertNumQueries(0):
+            key = assertChanged(False)
+        self.assertNotEqual(
+            get_render_key('info', 'crew', crew.pk, dt.timezone.utc), key
+        )
+
+        crew.passengers.add(self.driver)
+        key = assertChanged()
+
+        self.driver.timezone = 240
+        self.driver.save(update_fields=['timezone'])
+        key = assertChanged(False)
+        self.driver.nickname = 'Driver'
+        self.driver.save()
+        key = assertChanged()
+
+        # departure items are shown in the detailed crew info
+        departure_key = get_render_key('info', 'departure', self.departure.pk)
+        Task.objects.create(
+            departure=self.departure,
+            title='Task 2',
+            address='Yerevan',
+            coordinates=Point(44.52, 40.18),
+        )
+        key = assertChanged()
+        self.assertNotEqual(
+            get_render_key('info', 'departure', self.departure.pk),
+            departure_key
+        )
+
+        # number of departure crews is changed
+        self.create_crew()
+        key = assertChanged()
+
+    def test_ops_board(self):
+        self.create_crew()
+        crew = self.create_crew()
+        crew.passengers.add(self.driver)
+        Crew.objects.create(
+            departure=Departure.objects.create(
+                search_request=self.departure.search_request
+            ),
+            title='Crew',
+            driver=self.driver,
+            passengers_max=2,
+            pickup_location=Point(44.52, 40.18, srid=4326),
+            pickup_datetime=timezone.now(),
+            status=Crew.StatusVerbose.ON_MISSION,
+        )
+
+        with self.assertNumQueries(1):
+            board = get_ops_board.__wrapped__()
+        self.assertEqual(len(board), 1)
+        self.assertEqual(
+            {key: board[0][key] for key in (
+                'departures_count', 'available', 'on_mission', 'returning',
+                'passengers', 'seats',
+            )},
+            {
+                'departures_count': 2, 'available': 2, 'on_mission': 1,
+                'returning': 0, 'passengers': 1, 'seats': 6,
+            }
+        )
+
+    def test_nearest_crews(self):
+        far = self.create_crew(lat=40.63)  # ~50 km to the north
+        near = self.create_crew()
+        self.create_crew(37.62, 55.75)  # ~1800 km
+
+        crews, more = get_nearest_crews.__wrapped__(40.18, 44.52, 100, 10)
+        self.assertEqual([crew.pk for crew in crews], [near.pk, far.pk])
+        self.assertFalse(more)
+        self.assertAlmostEqual(crews[1].distance / 1000, 50, delta=1)
+
+        crews, more = get_nearest_crews.__wrapped__(40.18, 44.52, 100, 1)
+        self.assertEqual([crew.pk for crew in crews], [near.pk])
+        self.assertTrue(more)
+
+        crews, more = get_nearest_crews.__wrapped__(40.18, 44.52, 100, 1, 1)
+        self.assertEqual([crew.pk for crew in crews], [far.pk])
+        self.assertFalse(more)
@@ -5,4 +5,9 @@ from . import views
 
 urlpatterns = [
     path('', csrf.csrf_exempt(views.WebhookView.as_view()), name='webhook'),
+    path(
+        'telegram/',
+        csrf.csrf_exempt(views.TelegramWebhookView.as_view()),
+        name='telegram_webhook'
+    ),
 ]
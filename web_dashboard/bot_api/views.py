@@ -4,13 +4,19 @@ from functools import wraps
 from django.views import View
 from django.conf import settings
 from django.core import serializers
-from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+)
 from django.utils.translation import gettext as _
 from secrets import compare_digest
 
 from web_dashboard.search_requests.models import SearchRequest
 from web_dashboard.logistics.models import Departure
 from web_dashboard.logistics.serializers import DepartureSerializer
+from tgbot.webhook import webhook_bot, WebhookUnavailable
 
 
 class AuthTokenMixinView(View):
@@ -27,7 +33,7 @@ class AuthTokenMixinView(View):
             """
             given_token = request.headers.get("Authorization", "")
 
-            if not compare_digest(
+            if not settings.DJANGO_TG_TOKEN or not compare_digest(
                 given_token, f'access_token {settings.DJANGO_TG_TOKEN}'
             ):
 
@@ -88,3 +94,31 @@ class WebhookView(AuthTokenMixinView):
         }
 
         return JsonResponse(json_response)
+
+
+class TelegramWebhookView(View):
+    """Receive Telegram updates and pass them to the bot (webhook mode)."""
+
+    async def post(self, request, *args, **kwargs) -> HttpResponse:
+        """Validate secret token and put the update to the bot queue."""
+        given_token = request.headers.get(
+            'X-Telegram-Bot-Api-Secret-Token', ''
+        )
+        if not settings.TELEGRAM_WEBHOOK_SECRET or not compare_digest(
+            given_token, settings.TELEGRAM_WEBHOOK_SECRET
+        ):
+            return HttpResponseForbidden(
+                'Incorect webhook token.', content_type="text/plain"
+            )
+
+        try:
+            await webhook_bot.put(json.loads(request.body))
+        except ValueError:
+            return HttpResponseBadRequest(
+                'Invalid update.', content_type="text/plain"
+            )
+        except WebhookUnavailable as e:
+            # Telegram redelivers the update on any non 2xx response
+            return HttpResponse(str(e), status=503, content_type="text/plain")
+
+        return HttpResponse()
@@ -6,3 +6,4 @@ admin.site.register(models.Crew)
 admin.site.register(models.JoinRequest)
 admin.site.register(models.Task)
 admin.site.register(models.Departure)
+admin.site.register(models.Track)
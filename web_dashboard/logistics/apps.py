@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LogisticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'web_dashboard.logistics'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,309 @@
+import io
+import math
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from django.db import transaction
+from PIL import Image
+
+from .models import Coverage, Crew, Departure, Track
+
+METRES_PER_DEGREE = 111_320
+MAX_CELLS = 4_000_000  # the cell size is increased for larger areas
+
+# RGBA colors of 0, 1, 2, 3+ tracks per cell
+COLORS = np.array([
+    [0, 0, 0, 0],
+    [255, 237, 160, 160],
+    [254, 178, 76, 180],
+    [240, 59, 32, 200],
+], dtype=np.uint8)
+
+
+def get_coords(line: LineString) -> np.ndarray:
+    """Return (n, 2) longitudes and latitudes of the line read from WKB."""
+    # byte order (1), geometry type (4) and number of points (4)
+    return np.frombuffer(line.wkb, dtype='<f8', offset=9).reshape(-1, 2)
+
+
+def get_lat_scale(coverage: Coverage) -> float:
+    """Return length of a longitude degree in latitude degrees of the grid."""
+    middle = coverage.lat + coverage.height * coverage.cell_size \
+        / METRES_PER_DEGREE / 2
+    return math.cos(math.radians(middle))
+
+
+def get_counts(coverage: Coverage) -> np.ndarray:
+    return np.frombuffer(coverage.counts, dtype='<u2')\
+        .reshape(coverage.height, coverage.width)
+
+
+def create_grid(departure: Departure) -> Coverage:
+    """
+    Return empty coverage of the area around the departure tasks and the
+    search request location with COVERAGE_MARGIN (m).
+    """
+    points = np.array(
+        [task.coordinates.coords for task in departure.tasks.all()]
+        + [departure.search_request.location.coords]
+    )
+    (min_lon, min_lat), (max_lon, max_lat) = points.min(0), points.max(0)
+
+    margin = settings.COVERAGE_MARGIN / METRES_PER_DEGREE
+    lat_scale = math.cos(math.radians((min_lat + max_lat) / 2))
+    min_lon -= margin / lat_scale
+    max_lon += margin / lat_scale
+    min_lat -= margin
+    max_lat += margin
+
+    width = (max_lon - min_lon) * METRES_PER_DEGREE * lat_scale
+    height = (max_lat - min_lat) * METRES_PER_DEGREE
+    cell_size = max(settings.COVERAGE_CELL_SIZE,
+                    math.sqrt(width * height / MAX_CELLS))
+    width, height = math.ceil(width / cell_size), math.ceil(height / cell_size)
+
+    return Coverage(
+        departure=departure,
+        lon=min_lon,
+        lat=min_lat,
+        cell_size=cell_size,
+        width=width,
+        height=height,
+        counts=np.zeros((height, width), dtype='<u2').tobytes(),
+    )
+
+
+def clip_segments(starts: np.ndarray, ends: np.ndarray, low: np.ndarray,
+                  high: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (n, 2) starts and ends of the segments clipped to the box,
+    segments outside of it are dropped.
+    """
+    deltas = ends - starts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_low, t_high = (low - starts) / deltas, (high - starts) / deltas
+    t_in, t_out = np.fmin(t_low, t_high), np.fmax(t_low, t_high)
+
+    # a segment parallel to an axis is within its bounds entirely or never
+    inside = (starts >= low) & (starts <= high)
+    parallel = deltas == 0
+    t_in[parallel] = np.where(inside, -np.inf, np.inf)[parallel]
+    t_out[parallel] = np.where(inside, np.inf, -np.inf)[parallel]
+
+    t_in = np.maximum(t_in.max(1), 0)
+    t_out = np.minimum(t_out.min(1), 1)
+    kept = t_in <= t_out
+    starts, deltas = starts[kept], deltas[kept]
+    return (starts + deltas * t_in[kept, None],
+            starts + deltas * t_out[kept, None])
+
+
+def rasterize(coverage: Coverage, coords: np.ndarray,
+              sweep_width: float) -> np.ndarray:
+    """
+    Return bool mask of the grid cells within half of the sweep width (m)
+    of the path with (n, 2) longitudes and latitudes.
+    """
+    mask = np.zeros((coverage.height, coverage.width), dtype=bool)
+    radius = sweep_width / 2 / coverage.cell_size
+    r = math.ceil(radius)
+
+    # cells from the grid corner in the local equirectangular projection
+    xy = (coords - (coverage.lon, coverage.lat)) * METRES_PER_DEGREE
+    xy[:, 0] *= get_lat_scale(coverage)
+    xy /= coverage.cell_size
+
+    # segments are clipped to the grid with the sweep radius around it,
+    # an outlier fix far away isn't sampled
+    starts, ends = clip_segments(
+        xy[:-1] if len(xy) > 1 else xy, xy[1:] if len(xy) > 1 else xy,
+        np.array([-r - 1, -r - 1]),
+        np.array([coverage.width + r + 1, coverage.height + r + 1]),
+    )
+
+    # every segment is sampled at least twice per cell, ends included
+    deltas = ends - starts
+    steps = np.ceil(np.hypot(*deltas.T) * 2).astype(np.int64)
+    samples = steps + 1
+    segments = np.repeat(np.arange(len(deltas)), samples)
+    offsets = np.arange(samples.sum()) - np.repeat(samples.cumsum() - samples,
+                                                   samples)
+    t = offsets / np.maximum(steps, 1)[segments]
+    xy = starts[segments] + deltas[segments] * t[:, None]
+
+    cells = np.unique(np.floor(xy).astype(np.int64), axis=0)
+
+    # cells of the disk of the sweep radius around a cell
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1].reshape(2, -1)
+    disk = np.hypot(dx, dy) <= radius + 0.5
+    dx, dy = dx[disk], dy[disk]
+
+    x = (cells[:, 0, None] + dx).ravel()
+    y = (cells[:, 1, None] + dy).ravel()
+    inside = (x >= 0) & (x < coverage.width) & (y >= 0) \
+        & (y < coverage.height)
+    mask[y[inside], x[inside]] = True
+    return mask
+
+
+def add_tracks(coverage: Coverage, tracks) -> None:
+    """Add the simplified paths of tracks to the coverage counts."""
+    counts = get_counts(coverage).copy()
+    for track in tracks:
+        counts += rasterize(coverage, get_coords(track.simplified),
+                            settings.COVERAGE_SWEEP_WIDTH)
+        coverage.tracks_count += 1
+
+    coverage.counts = counts.tobytes()
+    coverage.covered_count = int(np.count_nonzero(counts))
+
+
+def build_coverage(departure: Departure) -> Coverage:
+    """Return the departure coverage built from all its tracks unsaved."""
+    coverage = create_grid(departure)
+    add_tracks(
+        coverage,
+        Track.objects.filter(crew__departure=departure).only('simplified')
+    )
+    return coverage
+
+
+def get_coverage(departure: Departure) -> Coverage:
+    """Return the saved departure coverage or build it without saving."""
+    try:
+        return departure.coverage
+    except Coverage.DoesNotExist:
+        return build_coverage(departure)
+
+
+def lock_departures(departure_ids) -> list[int]:
+    """
+    Lock rows of the departures and return ids of the existing ones.
+
+    Coverage writes of a departure are serialized by the lock.
+    """
+    return list(
+        Departure.objects.select_for_update()
+        .filter(pk__in=departure_ids).order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def save_coverage(departure_id: int) -> None:
+    """Build and save the coverage of the departure with tracks if missing."""
+    with transaction.atomic():
+        if not lock_departures([departure_id]):
+            return
+        if Coverage.objects.filter(departure=departure_id).exists():
+            return
+        if not Track.objects.filter(crew__departure=departure_id).exists():
+            return
+        departure = Departure.objects.select_related('search_request')\
+            .get(pk=departure_id)
+        build_coverage(departure).save()
+
+
+def reset_coverage(departure_ids) -> None:
+    """
+    Drop coverages of the departures, they are built anew after commit of
+    the transaction.
+    """
+    departure_ids = set(departure_ids) - {None}
+    with transaction.atomic():
+        lock_departures(departure_ids)
+        Coverage.objects.filter(departure__in=departure_ids).delete()
+
+    def rebuild():
+        for departure_id in departure_ids:
+            save_coverage(departure_id)
+    transaction.on_commit(rebuild)
+
+
+def add_track(track: Track) -> None:
+    """
+    Add the new track to the coverage of its departure or build it.
+
+    A coverage built after the track was saved counts it already, one
+    missing more than the track is built anew.
+    """
+    departure_id = Crew.objects.filter(pk=track.crew_id)\
+        .values_list('departure_id', flat=True).first()
+    with transaction.atomic():
+        if not lock_departures([departure_id]):
+            return
+        coverage = Coverage.objects.filter(departure=departure_id).first()
+        if coverage is None:
+            save_coverage(departure_id)
+            return
+
+        missing = Track.objects.filter(crew__departure=departure_id)\
+            .count() - coverage.tracks_count
+        if missing == 1:
+            add_tracks(coverage, [track])
+            coverage.save()
+        elif missing:
+            coverage.delete()
+            save_coverage(departure_id)
+
+
+def to_geojson(coverage: Coverage) -> dict:
+    """
+    Return FeatureCollection of covered cells with their counts.
+
+    Adjacent cells of a row with the same count are merged into one
+    rectangle.
+    """
+    counts = get_counts(coverage)
+    starts = np.ones(counts.shape, dtype=bool)
+    starts[:, 1:] = counts[:, 1:] != counts[:, :-1]
+    rows, cols = np.nonzero(starts)
+
+    # a run ends at the start of the next one or at the end of the row
+    ends = np.append(cols[1:], coverage.width)
+    ends[np.append(rows[1:] != rows[:-1], True)] = coverage.width
+    values = counts[rows, cols]
+    covered = values > 0
+
+    cell_lat = coverage.cell_size / METRES_PER_DEGREE
+    cell_lon = cell_lat / get_lat_scale(coverage)
+
+    features = []
+    for row, start, end, count in zip(
+        rows[covered].tolist(), cols[covered].tolist(),
+        ends[covered].tolist(), values[covered].tolist()
+    ):
+        west = coverage.lon + start * cell_lon
+        east = coverage.lon + end * cell_lon
+        south = coverage.lat + row * cell_lat
+        north = south + cell_lat
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[
+                    [west, south], [east, south], [east, north],
+                    [west, north], [west, south],
+                ]],
+            },
+            'properties': {'count': count},
+        })
+
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'properties': {
+            'tracks_count': coverage.tracks_count,
+            'covered_percent': round(coverage.covered_percent, 2),
+        },
+    }
+
+
+def to_png(coverage: Coverage) -> bytes:
+    """Return PNG heatmap of the counts, north is up."""
+    counts = get_counts(coverage)
+    colors = COLORS[np.minimum(counts, len(COLORS) - 1)]
+
+    output = io.BytesIO()
+    Image.fromarray(np.flipud(colors)).save(output, 'PNG')
+    return output.getvalue()
@@ -0,0 +1,80 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from web_dashboard.logistics.models import Crew, Departure, JoinRequest
+from web_dashboard.users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput of concurrent join request accepts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Number of join requests accepted at once.')
+        parser.add_argument('--seats', type=int, default=4,
+                            help='Max passengers of the crew.')
+        parser.add_argument('--workers', type=int, default=20,
+                            help='Number of concurrent threads.')
+
+    @staticmethod
+    def accept(crew_id: int, jreq: JoinRequest) -> bool:
+        try:
+            Crew.objects.get(pk=crew_id).accept_join_request(jreq)
+            return True
+        except ValueError:
+            return False
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        departure = Departure.objects.first()
+        if departure is None:
+            raise CommandError('There are no departures in the database.')
+
+        # Temporary users and crew are deleted with their join requests
+        prefix = f'accept-benchmark-{uuid.uuid4().hex[:8]}'
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}-{i}', dateofbirth='2000-01-01')
+            for i in range(options['requests'] + 1)
+        ])
+        users = CustomUser.objects.filter(username__startswith=prefix)
+        try:
+            driver, *passengers = users.order_by('pk')
+            crew = Crew.objects.create(
+                departure=departure,
+                title='Benchmark',
+                driver=driver,
+                passengers_max=options['seats'],
+                pickup_location=Point(0, 0, srid=4326),
+                pickup_datetime=timezone.now(),
+            )
+            jreqs = [
+                JoinRequest.objects.create(passenger=passenger, crew=crew)
+                for passenger in passengers
+            ]
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                accepted = sum(pool.map(
+                    self.accept, [crew.pk] * len(jreqs), jreqs
+                ))
+            elapsed = time.perf_counter() - start
+
+            crew.refresh_from_db()
+            self.stdout.write(
+                f'{len(jreqs)} concurrent accepts to {options["seats"]} '
+                f'seats by {options["workers"]} threads in {elapsed:.2f} s: '
+                f'{len(jreqs) / elapsed:.0f} accepts/s, accepted: '
+                f'{accepted}, passengers: {crew.passengers_count}'
+            )
+            if accepted != min(options['seats'], len(jreqs)) \
+                    or crew.passengers_count != accepted:
+                raise CommandError('The crew is overfilled.')
+        finally:
+            users.delete()
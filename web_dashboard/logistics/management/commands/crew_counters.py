@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from web_dashboard.logistics.models import Crew
+
+
+class Command(BaseCommand):
+    help = 'Check crew passengers/join requests counters and repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Recount drifted counters.')
+
+    def handle(self, *args, **options):
+        actual = {
+            f'actual_{name}': expression
+            for name, expression in Crew.counted().items()
+        }
+        drifted = Crew.objects.annotate(**actual).exclude(**{
+            name: F(f'actual_{name}') for name in Crew.COUNTERS
+        })
+
+        pks = []
+        for crew in drifted.only('title', 'status', *Crew.COUNTERS):
+            pks.append(crew.pk)
+            changes = ', '.join(
+                f'{name}: {getattr(crew, name)} -> '
+                f'{getattr(crew, f"actual_{name}")}'
+                for name in Crew.COUNTERS
+                if getattr(crew, name) != getattr(crew, f'actual_{name}')
+            )
+            self.stdout.write(f'{crew}: {changes}')
+
+        if not pks:
+            self.stdout.write(self.style.SUCCESS('Crew counters are valid.'))
+        elif options['fix']:
+            Crew.objects.filter(pk__in=pks).update(**Crew.counted())
+            self.stdout.write(
+                self.style.SUCCESS(f'Crew counters are fixed: {len(pks)}')
+            )
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Drifted crews: {len(pks)}. Use --fix to recount.'
+            ))
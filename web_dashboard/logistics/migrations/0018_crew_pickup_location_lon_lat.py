@@ -0,0 +1,67 @@
+# Generated by Django 5.0.6 on 2026-10-17 12:00
+
+from django.contrib.gis.geos import Point
+from django.db import migrations
+
+
+def is_lat_lon(point: Point, reference: Point | None) -> bool:
+    """
+    Return True if the point looks saved by the bot as Point(lat, lon).
+
+    Pickup locations set in the admin map widget are already (lon, lat).
+    A point is taken for (lat, lon) if its y is not a valid latitude or if
+    swapped it is closer to the search request location of the departure.
+    """
+    x, y = point.coords
+    if abs(y) > 90:
+        return True
+    if reference is None or x == y:
+        return False
+    lon, lat = reference.coords
+    return (y - lon) ** 2 + (x - lat) ** 2 < (x - lon) ** 2 + (y - lat) ** 2
+
+
+def swap_coordinates(apps, schema_editor):
+    """
+    The bot saved pickup locations as Point(lat, lon): make them
+    Point(lon, lat) as required by SRID 4326 distance functions.
+    """
+    Crew = apps.get_model('logistics', 'Crew')
+    crews = Crew.objects.values_list(
+        'pk', 'pickup_location', 'departure__search_request__location'
+    )
+    for pk, location, reference in crews:
+        if is_lat_lon(location, reference):
+            x, y = location.coords
+            Crew.objects.filter(pk=pk).update(
+                pickup_location=Point(y, x, srid=4326)
+            )
+
+
+def create_geography_index(apps, schema_editor):
+    """Index used by KNN and ST_DWithin searches on geography."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS logistics_crew_pickup_geog_idx '
+            'ON logistics_crew USING GIST ((pickup_location::geography))'
+        )
+
+
+def drop_geography_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS logistics_crew_pickup_geog_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0017_joinrequest'),
+    ]
+
+    operations = [
+        # swapped points can't be told from the others after migration
+        migrations.RunPython(swap_coordinates, migrations.RunPython.noop),
+        migrations.RunPython(create_geography_index, drop_geography_index),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.6 on 2026-10-17 13:00
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Crew = apps.get_model('logistics', 'Crew')
+    JoinRequest = apps.get_model('logistics', 'JoinRequest')
+
+    def count(model, field, **filters):
+        rows = model.objects\
+            .filter(**{field: models.OuterRef('pk')}, **filters)\
+            .order_by()\
+            .values(field)\
+            .annotate(count=models.Count('pk'))\
+            .values('count')
+        return Coalesce(
+            models.Subquery(rows, output_field=models.IntegerField()), 0
+        )
+
+    Crew.objects.update(
+        passengers_count=count(Crew.passengers.through, 'crew'),
+        pending_count=count(JoinRequest, 'crew', status='P'),
+        rejected_count=count(JoinRequest, 'crew', status='R'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0018_crew_pickup_location_lon_lat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crew',
+            name='passengers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Passengers'),
+        ),
+        migrations.AddField(
+            model_name='crew',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Pending join requests'),
+        ),
+        migrations.AddField(
+            model_name='crew',
+            name='rejected_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Rejected join requests'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:00
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0019_crew_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Track',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255, verbose_name='Name')),
+                ('path', django.contrib.gis.db.models.fields.LineStringField(srid=4326, verbose_name='Path')),
+                ('simplified', django.contrib.gis.db.models.fields.LineStringField(help_text='Douglas-Peucker simplified path to display.', srid=4326, verbose_name='Simplified path')),
+                ('points_count', models.PositiveIntegerField(verbose_name='Number of points')),
+                ('length', models.FloatField(help_text='Metres.', verbose_name='Length')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('crew', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='logistics.crew', verbose_name='Crew')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tracks', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+        ),
+    ]
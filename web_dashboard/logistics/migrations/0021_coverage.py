@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0020_track'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Coverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lon', models.FloatField(help_text='South-west corner of the grid.', verbose_name='Longitude')),
+                ('lat', models.FloatField(help_text='South-west corner of the grid.', verbose_name='Latitude')),
+                ('cell_size', models.FloatField(help_text='Metres.', verbose_name='Cell size')),
+                ('width', models.PositiveIntegerField(verbose_name='Width')),
+                ('height', models.PositiveIntegerField(verbose_name='Height')),
+                ('counts', models.BinaryField(help_text='Row-major uint16 counts, the first row is southern.', verbose_name='Counts')),
+                ('tracks_count', models.PositiveIntegerField(default=0, verbose_name='Number of tracks')),
+                ('covered_count', models.PositiveIntegerField(default=0, verbose_name='Number of covered cells')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+                ('departure', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='coverage', to='logistics.departure', verbose_name='Departure')),
+            ],
+        ),
+    ]
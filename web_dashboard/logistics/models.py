@@ -1,5 +1,9 @@
-from django.db import models
-from django.contrib.gis.db.models import PointField
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.contrib.gis.db.models import LineStringField, PointField
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from location_field.models.spatial import LocationField
@@ -125,6 +129,25 @@ class Crew(GetFieldsMixin, models.Model):
         null=True,
     )
 
+    # Counters are maintained by logistics.signals, see Crew._do_update()
+    passengers_count = models.PositiveIntegerField(
+        _('Passengers'),
+        default=0,
+        editable=False,
+    )
+
+    pending_count = models.PositiveIntegerField(
+        _('Pending join requests'),
+        default=0,
+        editable=False,
+    )
+
+    rejected_count = models.PositiveIntegerField(
+        _('Rejected join requests'),
+        default=0,
+        editable=False,
+    )
+
     created_at = models.DateTimeField(
         _('Created at'),
         auto_now_add=True
@@ -135,34 +158,136 @@ class Crew(GetFieldsMixin, models.Model):
         auto_now=True
     )
 
+    COUNTERS = ('passengers_count', 'pending_count', 'rejected_count')
+
     def __str__(self) -> str:
         """Representation of a single instance."""
         return f'{self.title}-{self.id} ({self.get_status_display()})'
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        """
+        Update the crew without counters: they are changed only by UPDATE
+        queries, a loaded instance may hold outdated values. A new crew is
+        inserted with its counters.
+        """
+        values = [
+            value for value in values if value[0].name not in self.COUNTERS
+        ]
+        return super()._do_update(base_qs, using, pk_val, values,
+                                  update_fields, forced_update)
+
+    @classmethod
+    def change_counters(cls, pk: int, **deltas: int) -> None:
+        """Atomically add deltas to the crew counters."""
+        deltas = {
+            name: models.F(name) + delta
+            for name, delta in deltas.items() if delta
+        }
+        if deltas:
+            cls.objects.filter(pk=pk).update(**deltas)
+
+    @classmethod
+    def counted(cls) -> dict:
+        """Return expressions counting actual values of the counters."""
+        def count(model, field, **filters):
+            rows = model.objects\
+                .filter(**{field: models.OuterRef('pk')}, **filters)\
+                .order_by()\
+                .values(field)\
+                .annotate(count=models.Count('pk'))\
+                .values('count')
+            return Coalesce(
+                models.Subquery(rows, output_field=models.IntegerField()), 0
+            )
+
+        status = JoinRequest.StatusVerbose
+        return {
+            'passengers_count': count(cls.passengers.through, 'crew'),
+            'pending_count': count(JoinRequest, 'crew',
+                                   status=status.PENDING),
+            'rejected_count': count(JoinRequest, 'crew',
+                                    status=status.REJECTED),
+        }
+
     def get_absolute_url(self) -> str:
         """Return absolute url to the object."""
         return reverse('logistics:crew_read', kwargs={'pk': self.pk})
 
-    async def aaccept_join_request(self, join_request):
-        """Async accept JoinRequest to crew and change it status."""
-        if join_request.crew != self:
+    def accept_join_request(self, join_request) -> None:
+        """
+        Accept JoinRequest and add the passenger to the crew.
+
+        The join request row is locked first, then a seat is taken by one
+        conditional UPDATE of the crew counters, so concurrent accepts can't
+        overfill the crew or count a request twice.
+        """
+        if join_request.crew_id != self.pk:
             raise ValueError("This join request does not belong to this crew.")
-        if await self.passengers.acount() >= self.passengers_max:
-            raise ValueError("The crew has already reached the maximum number of passengers.")  # noqa: E501
 
-        join_request.status = JoinRequest.StatusVerbose.ACCEPTED
-        await join_request.asave()
-        await self.passengers.aadd(join_request.passenger)
-        await self.asave()
+        Passenger = self.passengers.through
+        accepted = JoinRequest.StatusVerbose.ACCEPTED
+        with transaction.atomic():
+            status, is_passenger = JoinRequest.objects\
+                .select_for_update()\
+                .filter(pk=join_request.pk)\
+                .annotate(is_passenger=models.Exists(Passenger.objects.filter(
+                    crew=models.OuterRef('crew'),
+                    customuser=models.OuterRef('passenger'),
+                )))\
+                .values_list('status', 'is_passenger')\
+                .get()
+
+            deltas = JoinRequest.counter_deltas(status, accepted)
+            crews = Crew.objects.filter(pk=self.pk)
+            if not is_passenger:
+                deltas['passengers_count'] += 1
+                crews = crews.filter(
+                    passengers_count__lt=models.F('passengers_max')
+                )
+            changes = {
+                name: models.F(name) + delta
+                for name, delta in deltas.items() if delta
+            }
+            # An accepted passenger changes no counters
+            if changes and not crews.update(**changes):
+                raise ValueError("The crew has already reached the maximum number of passengers.")  # noqa: E501
+
+            if status != accepted:
+                JoinRequest.objects.filter(pk=join_request.pk)\
+                    .update(status=accepted)
+            if not is_passenger:
+                Passenger.objects.create(
+                    crew_id=self.pk, customuser_id=join_request.passenger_id
+                )
+            self.save()
+
+        join_request.status = join_request._loaded_status = accepted
+        self.refresh_from_db(fields=self.COUNTERS)
+
+    async def aaccept_join_request(self, join_request) -> None:
+        """Async accept JoinRequest to crew and change it status."""
+        await sync_to_async(self.accept_join_request)(join_request)
+
+    def reject_join_request(self, join_request) -> None:
+        """
+        Reject JoinRequest and remove the passenger from the crew.
+
+        The join request row is locked by its save first, so a concurrent
+        accept is counted before or after the rejection, never twice.
+        """
+        if join_request.crew_id != self.pk:
+            raise ValueError("This join request does not belong to this crew.")
+        with transaction.atomic():
+            join_request.status = JoinRequest.StatusVerbose.REJECTED
+            join_request.save()
+            self.passengers.remove(join_request.passenger)
+            self.save()
+        self.refresh_from_db(fields=self.COUNTERS)
 
     async def areject_join_request(self, join_request):
         """Async reject JoinRequest and change it status and remove it."""
-        if join_request.crew != self:
-            raise ValueError("This join request does not belong to this crew.")
-        join_request.status = JoinRequest.StatusVerbose.REJECTED
-        await join_request.asave()
-        await self.passengers.aremove(join_request.passenger)
-        await self.asave()
+        await sync_to_async(self.reject_join_request)(join_request)
 
 
 class JoinRequest(models.Model):
@@ -202,6 +327,37 @@ class JoinRequest(models.Model):
     class Meta:
         unique_together = ('passenger', 'crew')
 
+    STATUS_COUNTERS = {
+        StatusVerbose.PENDING: 'pending_count',
+        StatusVerbose.REJECTED: 'rejected_count',
+    }
+
+    @classmethod
+    def counter_deltas(cls, old_status: str | None,
+                       new_status: str | None) -> Counter:
+        """Return crew counters changes of a join request status change."""
+        deltas = Counter()
+        if counter := cls.STATUS_COUNTERS.get(old_status):
+            deltas[counter] -= 1
+        if counter := cls.STATUS_COUNTERS.get(new_status):
+            deltas[counter] += 1
+        return deltas
+
+    def lock_status(self) -> str | None:
+        """Lock the row and return its saved status, None if deleted."""
+        return JoinRequest.objects.select_for_update()\
+            .filter(pk=self.pk).values_list('status', flat=True).first()
+
+    def save(self, *args, **kwargs):
+        """
+        Save the join request with the row locked: the counters are changed
+        from the saved status, a concurrent accept may have changed it.
+        """
+        with transaction.atomic():
+            if not self._state.adding:
+                self._loaded_status = self.lock_status()
+            super().save(*args, **kwargs)
+
     @property
     def emoji(self):
         match self.status:
@@ -269,3 +425,140 @@ class Task(GetFieldsMixin, models.Model):
     def __str__(self) -> str:
         """Representation of a single instance."""
         return f'{self.title} ({self.coordinates.coords})'
+
+
+class Track(models.Model):
+    """GPS track of a crew uploaded by a member as GPX file."""
+    crew = models.ForeignKey(
+        Crew,
+        related_name='tracks',
+        verbose_name=_('Crew'),
+        on_delete=models.CASCADE,
+    )
+
+    user = models.ForeignKey(
+        CustomUser,
+        related_name='tracks',
+        verbose_name=_('User'),
+        on_delete=models.SET_NULL,
+        null=True,
+    )
+
+    name = models.CharField(
+        _('Name'),
+        max_length=255,
+        blank=True,
+    )
+
+    path = LineStringField(
+        _('Path'),
+        srid=4326,
+    )
+
+    simplified = LineStringField(
+        _('Simplified path'),
+        srid=4326,
+        help_text=_('Douglas-Peucker simplified path to display.'),
+    )
+
+    points_count = models.PositiveIntegerField(
+        _('Number of points'),
+    )
+
+    length = models.FloatField(
+        _('Length'),
+        help_text=_('Metres.'),
+    )
+
+    started_at = models.DateTimeField(
+        _('Started at'),
+        null=True,
+        blank=True,
+    )
+
+    finished_at = models.DateTimeField(
+        _('Finished at'),
+        null=True,
+        blank=True,
+    )
+
+    created_at = models.DateTimeField(
+        _('Created at'),
+        auto_now_add=True
+    )
+
+    @property
+    def duration(self):
+        """Return time between the first and the last points if known."""
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+    def __str__(self) -> str:
+        """Representation of a single instance."""
+        return f'{self.name} ({self.length / 1000:.1f} km) -> {self.crew}'
+
+
+class Coverage(models.Model):
+    """
+    Raster of a departure search area: numbers of tracks passed within the
+    sweep width of every cell. Tracks are added as they are uploaded.
+    """
+    departure = models.OneToOneField(
+        Departure,
+        related_name='coverage',
+        verbose_name=_('Departure'),
+        on_delete=models.CASCADE,
+    )
+
+    lon = models.FloatField(
+        _('Longitude'),
+        help_text=_('South-west corner of the grid.'),
+    )
+
+    lat = models.FloatField(
+        _('Latitude'),
+        help_text=_('South-west corner of the grid.'),
+    )
+
+    cell_size = models.FloatField(
+        _('Cell size'),
+        help_text=_('Metres.'),
+    )
+
+    width = models.PositiveIntegerField(
+        _('Width'),
+    )
+
+    height = models.PositiveIntegerField(
+        _('Height'),
+    )
+
+    counts = models.BinaryField(
+        _('Counts'),
+        help_text=_('Row-major uint16 counts, the first row is southern.'),
+    )
+
+    tracks_count = models.PositiveIntegerField(
+        _('Number of tracks'),
+        default=0,
+    )
+
+    covered_count = models.PositiveIntegerField(
+        _('Number of covered cells'),
+        default=0,
+    )
+
+    updated_at = models.DateTimeField(
+        _('Updated at'),
+        auto_now=True
+    )
+
+    @property
+    def covered_percent(self) -> float:
+        """Return the share of the area covered by tracks."""
+        return 100 * self.covered_count / (self.width * self.height)
+
+    def __str__(self) -> str:
+        """Representation of a single instance."""
+        return f'{self.departure}: {self.covered_percent:.1f}% covered'
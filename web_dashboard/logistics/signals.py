@@ -0,0 +1,143 @@
+from collections import Counter
+
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from web_dashboard.search_requests.models import SearchRequest
+from .coverage import add_track, reset_coverage
+from .models import Crew, JoinRequest, Task, Track
+
+
+@receiver(post_init, sender=JoinRequest)
+def remember_status(sender, instance, **kwargs):
+    """Keep loaded status to detect its change on save."""
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=JoinRequest)
+def count_join_request(sender, instance, created, **kwargs):
+    """Update pending/rejected counters of the crew."""
+    old_status = None if created else instance._loaded_status
+    deltas = JoinRequest.counter_deltas(old_status, instance.status)
+    Crew.change_counters(instance.crew_id, **deltas)
+    instance._loaded_status = instance.status
+
+
+@receiver(pre_delete, sender=JoinRequest)
+def lock_join_request(sender, instance, **kwargs):
+    """Lock the row to uncount its saved status, it may be changed."""
+    instance._loaded_status = instance.lock_status()
+
+
+@receiver(post_delete, sender=JoinRequest)
+def uncount_join_request(sender, instance, **kwargs):
+    """Update pending/rejected counters of the crew."""
+    deltas = JoinRequest.counter_deltas(instance._loaded_status, None)
+    Crew.change_counters(instance.crew_id, **deltas)
+
+
+@receiver(m2m_changed, sender=Crew.passengers.through)
+def count_passengers(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Update passengers counter of the crews.
+
+    `pk_set` of post_add holds only really added rows, rows to be removed
+    are counted before removal.
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        rows = sender.objects.filter(
+            **{'customuser' if reverse else 'crew': instance}
+        )
+        if pk_set is not None:
+            rows = rows.filter(
+                **{'crew__in' if reverse else 'customuser__in': pk_set}
+            )
+        instance._removed_passengers = Counter(
+            rows.values_list('crew_id', flat=True)
+        )
+
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_removed_passengers', Counter())
+        for crew_id, count in removed.items():
+            Crew.change_counters(crew_id, passengers_count=-count)
+        instance._removed_passengers = Counter()
+
+    elif action == 'post_add' and pk_set:
+        if reverse:
+            for crew_id in pk_set:
+                Crew.change_counters(crew_id, passengers_count=1)
+        else:
+            Crew.change_counters(instance.pk, passengers_count=len(pk_set))
+
+
+@receiver(post_init, sender=Track)
+def remember_track_crew(sender, instance, **kwargs):
+    """Keep loaded crew to drop coverages on move of the track."""
+    instance._loaded_crew_id = instance.__dict__.get('crew_id')
+
+
+@receiver(post_save, sender=Track)
+def add_track_to_coverage(sender, instance, created, **kwargs):
+    """
+    Count the new track in the coverage of its departure. A changed track
+    is counted anew in the coverages of its old and new departures.
+    """
+    if created:
+        add_track(instance)
+    else:
+        reset_coverage(
+            Crew.objects
+            .filter(pk__in=[instance.crew_id, instance._loaded_crew_id])
+            .values_list('departure_id', flat=True)
+        )
+    instance._loaded_crew_id = instance.crew_id
+
+
+@receiver(post_delete, sender=Track)
+def remove_track_from_coverage(sender, instance, **kwargs):
+    """Drop the coverage counting the deleted track."""
+    reset_coverage(
+        Crew.objects.filter(pk=instance.crew_id)
+        .values_list('departure_id', flat=True)
+    )
+
+
+@receiver(post_init, sender=Crew)
+def remember_crew_departure(sender, instance, **kwargs):
+    """Keep loaded departure to drop coverages on move of the crew."""
+    instance._coverage_departure_id = instance.__dict__.get('departure_id')
+
+
+@receiver(post_save, sender=Crew)
+def reset_crew_coverage(sender, instance, created, **kwargs):
+    """Drop coverages counting tracks of the crew moved to a departure."""
+    departure_id = instance.__dict__.get('departure_id')
+    if not created and departure_id != instance._coverage_departure_id \
+            and instance.tracks.exists():
+        reset_coverage([departure_id, instance._coverage_departure_id])
+    instance._coverage_departure_id = departure_id
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def reset_task_coverage(sender, instance, **kwargs):
+    """Drop the coverage: its area is built around the tasks."""
+    reset_coverage([instance.departure_id])
+
+
+@receiver(post_init, sender=SearchRequest)
+def remember_location(sender, instance, **kwargs):
+    """Keep loaded location to detect its change on save."""
+    instance._loaded_location = instance.__dict__.get('location')
+
+
+@receiver(post_save, sender=SearchRequest)
+def reset_search_request_coverage(sender, instance, created, **kwargs):
+    """Drop coverages of departures if the search location is changed."""
+    if not created and instance.location != instance._loaded_location:
+        reset_coverage(
+            instance.departures.values_list('pk', flat=True)
+        )
+    instance._loaded_location = instance.location
@@ -1,3 +1,415 @@
-from django.test import TestCase
+import datetime as dt
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.contrib.gis.geos import LineString, Point
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from web_dashboard.search_requests.models import SearchRequest
+from web_dashboard.users.models import CustomUser
+from .coverage import (
+    add_track, get_coverage, get_counts, rasterize, to_geojson, to_png
+)
+from .models import Coverage, Crew, Departure, JoinRequest, Task, Track
+
+
+def create_crew(passengers_max: int = 3) -> Crew:
+    """Create a crew with departure, search request and driver."""
+    search_request = SearchRequest.objects.create(
+        full_name='Missing Person',
+        city='Yerevan',
+        disappearance_date=dt.date(2024, 5, 1),
+        features='-',
+        clothing='-',
+        personal_belongings='-',
+        health_condition='-',
+        reporter_full_name='Reporter',
+        reporter_contact_details='-',
+        reporter_relationship='-',
+    )
+    driver = CustomUser.objects.create(
+        username='driver', dateofbirth='2000-01-01'
+    )
+    return Crew.objects.create(
+        departure=Departure.objects.create(search_request=search_request),
+        title='Crew',
+        driver=driver,
+        passengers_max=passengers_max,
+        pickup_location=Point(44.52, 40.18, srid=4326),
+        pickup_datetime=timezone.now(),
+    )
+
+
+def create_users(number: int) -> list[CustomUser]:
+    return [
+        CustomUser.objects.create(
+            username=f'passenger{i}', dateofbirth='2000-01-01'
+        ) for i in range(number)
+    ]
+
+
+class SwapCoordinatesTest(SimpleTestCase):
+    """Test only pickup locations saved by the bot as (lat, lon) swap."""
+
+    def test_is_lat_lon(self):
+        is_lat_lon = importlib.import_module(
+            'web_dashboard.logistics.migrations.'
+            '0018_crew_pickup_location_lon_lat'
+        ).is_lat_lon
+        reference = Point(44.5, 40.2)
+
+        self.assertTrue(is_lat_lon(Point(40.18, 44.52), reference))
+        self.assertFalse(is_lat_lon(Point(44.52, 40.18), reference))
+        self.assertTrue(is_lat_lon(Point(55.03, 120.5), None))
+        self.assertFalse(is_lat_lon(Point(40.18, 44.52), None))
+
+
+class RasterizeTest(SimpleTestCase):
+    """Test paths are rasterized only within the grid."""
+
+    # 2 km grid of 10 m cells
+    coverage = SimpleNamespace(
+        lon=82.904, lat=55.02, cell_size=10, width=200, height=200
+    )
+    start, end = (82.919782, 55.029738), (82.935482, 55.029738)
+
+    def test_outlier(self):
+        mask = rasterize(self.coverage, np.array([self.start, self.end]), 30)
+        # the strip leaves the grid at its east edge
+        self.assertAlmostEqual(mask.sum(), 500, delta=10)
+
+        # a fix at (0, 0) isn't sampled all the way
+        outlier = rasterize(
+            self.coverage, np.array([self.start, self.end, (0, 0)]), 30
+        )
+        self.assertTrue((outlier >= mask).all())
+        self.assertFalse(
+            rasterize(self.coverage, np.array([(0, 0), (1, 1)]), 30).any()
+        )
+        self.assertEqual(
+            rasterize(self.coverage, np.array([self.start]), 30).sum(), 13
+        )
+
+
+class CrewCountersTest(TestCase):
+    """Test crew counters maintained on join requests and passengers."""
+
+    def setUp(self):
+        self.crew = create_crew()
+        self.users = create_users(3)
+
+    def assertCounters(self, passengers, pending, rejected):
+        self.crew.refresh_from_db()
+        self.assertEqual(
+            (self.crew.passengers_count, self.crew.pending_count,
+             self.crew.rejected_count),
+            (passengers, pending, rejected)
+        )
+
+    def test_join_requests(self):
+        jreqs = [
+            JoinRequest.objects.create(passenger=user, crew=self.crew)
+            for user in self.users
+        ]
+        self.assertCounters(0, 3, 0)
+
+        jreqs[0].status = JoinRequest.StatusVerbose.REJECTED
+        jreqs[0].save()
+        jreqs[0].save()
+        self.assertCounters(0, 2, 1)
+
+        jreqs[1].status = JoinRequest.StatusVerbose.ACCEPTED
+        jreqs[1].save()
+        self.assertCounters(0, 1, 1)
+
+        jreqs[0].delete()
+        JoinRequest.objects.filter(pk=jreqs[2].pk).delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_passengers(self):
+        self.crew.passengers.add(*self.users)
+        self.crew.passengers.add(self.users[0])
+        self.assertCounters(3, 0, 0)
+
+        self.crew.passengers.remove(self.users[0], self.users[0])
+        self.assertCounters(2, 0, 0)
+
+        self.users[1].passenger_crews.remove(self.crew)
+        self.users[0].passenger_crews.add(self.crew)
+        self.assertCounters(2, 0, 0)
+
+        self.crew.passengers.clear()
+        self.assertCounters(0, 0, 0)
+
+    def test_save_keeps_counters(self):
+        crew = Crew.objects.get(pk=self.crew.pk)
+        self.crew.passengers.add(self.users[0])
+
+        crew.title = 'New title'
+        crew.save()
+        self.assertCounters(1, 0, 0)
+
+    def test_save_deferred(self):
+        crew = Crew.objects.only('title').get(pk=self.crew.pk)
+        self.crew.passengers.add(self.users[0])
+
+        crew.title = 'New title'
+        crew.save()
+        self.assertIn('passengers_max', crew.get_deferred_fields())
+        self.assertCounters(1, 0, 0)
+        self.assertEqual(self.crew.title, 'New title')
+
+    def test_save_deleted(self):
+        crew = Crew.objects.get(pk=self.crew.pk)
+        Crew.objects.filter(pk=crew.pk).delete()
+        crew.save()
+        self.assertTrue(Crew.objects.filter(pk=crew.pk).exists())
+
+    async def test_accept_and_reject(self):
+        crew = self.crew
+        jreq = await JoinRequest.objects.acreate(
+            passenger=self.users[0], crew=crew
+        )
+
+        await crew.aaccept_join_request(jreq)
+        self.assertEqual((crew.passengers_count, crew.pending_count), (1, 0))
+
+        await crew.aaccept_join_request(jreq)
+        self.assertEqual((crew.passengers_count, crew.pending_count), (1, 0))
+
+        await crew.areject_join_request(jreq)
+        self.assertEqual(
+            (crew.passengers_count, crew.rejected_count), (0, 1)
+        )
+
+    def test_command(self):
+        self.crew.passengers.add(self.users[0])
+        JoinRequest.objects.create(passenger=self.users[1], crew=self.crew)
+        Crew.objects.update(passengers_count=5, pending_count=0)
+
+        out = StringIO()
+        call_command('crew_counters', stdout=out)
+        self.assertIn('Drifted crews: 1', out.getvalue())
+        self.assertCounters(5, 0, 0)
+
+        call_command('crew_counters', '--fix', stdout=out)
+        self.assertCounters(1, 1, 0)
+
+        out = StringIO()
+        call_command('crew_counters', stdout=out)
+        self.assertIn('Crew counters are valid.', out.getvalue())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentAcceptTest(TransactionTestCase):
+    """Test concurrent accepts of join requests don't overfill a crew."""
+
+    requests = 100
+    workers = 20
+
+    def test_concurrent_accept(self):
+        crew = create_crew(passengers_max=4)
+        jreqs = [
+            JoinRequest.objects.create(passenger=user, crew=crew)
+            for user in create_users(self.requests)
+        ]
+
+        def accept(jreq):
+            try:
+                Crew.objects.get(pk=crew.pk).accept_join_request(jreq)
+                return True
+            except ValueError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            accepted = sum(executor.map(accept, jreqs))
+
+        crew.refresh_from_db()
+        self.assertEqual(accepted, 4)
+        self.assertEqual(crew.passengers.count(), 4)
+        self.assertEqual(
+            (crew.passengers_count, crew.pending_count, crew.rejected_count),
+            (4, self.requests - 4, 0)
+        )
+        accepted = JoinRequest.objects.filter(
+            status=JoinRequest.StatusVerbose.ACCEPTED
+        )
+        self.assertEqual(accepted.count(), 4)
+
+        # accepting again changes nothing
+        crew.accept_join_request(accepted.first())
+        self.assertEqual(
+            (crew.passengers_count, crew.pending_count, crew.rejected_count),
+            (4, self.requests - 4, 0)
+        )
+
+    def test_concurrent_accept_and_reject(self):
+        crew = create_crew(passengers_max=self.requests)
+        jreqs = [
+            JoinRequest.objects.create(passenger=user, crew=crew)
+            for user in create_users(self.requests)
+        ]
+
+        def change(method, jreq):
+            try:
+                getattr(Crew.objects.get(pk=crew.pk), method)(
+                    JoinRequest.objects.get(pk=jreq.pk)
+                )
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(
+                change,
+                ['accept_join_request', 'reject_join_request']
+                * self.requests,
+                [jreq for jreq in jreqs for _ in range(2)],
+            ))
+
+        crew = Crew.objects.annotate(
+            **{f'actual_{name}': value
+               for name, value in Crew.counted().items()}
+        ).get(pk=crew.pk)
+        self.assertEqual(crew.pending_count, 0)
+        for name in Crew.COUNTERS:
+            self.assertEqual(
+                getattr(crew, name), getattr(crew, f'actual_{name}')
+            )
+        self.assertEqual(crew.passengers_count + crew.rejected_count,
+                         self.requests)
+
+    def test_command(self):
+        crew = create_crew()
+        out = StringIO()
+        call_command('accept_benchmark', '--requests', '20', '--seats', '4',
+                     stdout=out)
+        self.assertIn('accepts/s, accepted: 4, passengers: 4',
+                      out.getvalue())
+        self.assertEqual(
+            list(CustomUser.objects.values_list('pk', flat=True)),
+            [crew.driver_id]
+        )
+
+
+class CoverageTest(TestCase):
+    """Test tracks are rasterized around the search location."""
+
+    def setUp(self):
+        self.crew = create_crew()
+        self.departure = self.crew.departure
+
+    def create_track(self):
+        # 1 km to the east of the search location (82.919782, 55.029738)
+        path = LineString((82.919782, 55.029738), (82.935482, 55.029738),
+                          srid=4326)
+        return Track.objects.create(
+            crew=self.crew, path=path, simplified=path, points_count=2,
+            length=1000,
+        )
+
+    def test_incremental(self):
+        self.create_track()
+        coverage = get_coverage(self.departure)
+        # 2 km around the location in 10 m cells
+        self.assertEqual(coverage.width, 200)
+        self.assertAlmostEqual(coverage.height, 200, delta=1)
+        self.assertEqual(coverage.tracks_count, 1)
+        # 1 km long and 3 cells wide strip
+        self.assertAlmostEqual(coverage.covered_count, 300, delta=10)
+
+        self.create_track()
+        coverage.refresh_from_db()
+        self.assertEqual(coverage.tracks_count, 2)
+        self.assertEqual(get_counts(coverage).max(), 2)
+        self.assertAlmostEqual(coverage.covered_percent, 0.75, delta=0.05)
+
+        geojson = to_geojson(coverage)
+        self.assertEqual(len(geojson['features']), 3)
+        self.assertTrue(to_png(coverage).startswith(b'\x89PNG'))
+
+    def test_add_track_once(self):
+        track = self.create_track()
+        # the coverage built after the track was saved counts it
+        add_track(track)
+        coverage = Coverage.objects.get(departure=self.departure)
+        self.assertEqual(coverage.tracks_count, 1)
+
+        # tracks missed by the coverage are counted on its rebuild
+        Track.objects.bulk_create([
+            Track(crew=self.crew, path=track.path, simplified=track.path,
+                  points_count=2, length=1000)
+        ])
+        self.create_track()
+        coverage = Coverage.objects.get(departure=self.departure)
+        self.assertEqual(coverage.tracks_count, 3)
+        self.assertEqual(get_counts(coverage).max(), 3)
+
+    def test_reset_on_task_change(self):
+        self.create_track()
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(
+                departure=self.departure,
+                title='Task',
+                address='Novosibirsk',
+                coordinates=Point(82.95, 55.03),
+            )
+        coverage = Coverage.objects.get(departure=self.departure)
+        self.assertGreater(coverage.width, 200)
+        self.assertEqual(coverage.tracks_count, 1)
+
+    def test_reset_on_track_delete(self):
+        tracks = [self.create_track(), self.create_track()]
+        with self.captureOnCommitCallbacks(execute=True):
+            tracks[0].delete()
+        coverage = Coverage.objects.get(departure=self.departure)
+        self.assertEqual(coverage.tracks_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tracks[1].delete()
+        self.assertFalse(
+            Coverage.objects.filter(departure=self.departure).exists()
+        )
+
+    def test_reset_on_crew_move(self):
+        self.create_track()
+        departure = Departure.objects.create(
+            search_request=self.departure.search_request
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crew.departure = departure
+            self.crew.save()
+
+        self.assertFalse(
+            Coverage.objects.filter(departure=self.departure).exists()
+        )
+        self.assertEqual(
+            Coverage.objects.get(departure=departure).tracks_count, 1
+        )
+
+    def test_detail_view_reads_only(self):
+        url = reverse('logistics:read', args=[self.departure.pk])
+        self.client.force_login(self.crew.driver)
+        self.client.get(url)
+        self.assertFalse(Coverage.objects.exists())
+
+        response = self.client.get(
+            reverse('logistics:coverage_png', args=[self.departure.pk])
+        )
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertFalse(Coverage.objects.exists())
+
+        self.create_track()
+        response = self.client.get(url)
+        coverage = response.context['coverage']
+        self.assertEqual(coverage.get_deferred_fields(), {'counts'})
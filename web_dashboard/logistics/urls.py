@@ -34,4 +34,16 @@ urlpatterns = [
         views.DepartureDeleteView.as_view(),
         name='delete'
     ),
+    path(
+        '<int:pk>/coverage.png',
+        views.DepartureCoverageView.as_view(),
+        {'format': 'png'},
+        name='coverage_png'
+    ),
+    path(
+        '<int:pk>/coverage.geojson',
+        views.DepartureCoverageView.as_view(),
+        {'format': 'geojson'},
+        name='coverage_geojson'
+    ),
 ]
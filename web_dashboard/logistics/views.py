@@ -1,3 +1,4 @@
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.db import transaction
 from django.views import View
@@ -7,6 +8,7 @@ from django.contrib.messages.views import SuccessMessageMixin
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from . import models, filters, forms
+from .coverage import get_coverage, to_geojson, to_png
 
 
 class DepartureBaseView(SuccessMessageMixin, View):
@@ -69,6 +71,26 @@ class DepartureCreateView(DepartureFormValidMixin,
 class DepartureDetailView(DepartureBaseView, DetailView):
     """Departure detail view."""
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Counts are loaded by the coverage image only
+        context['coverage'] = models.Coverage.objects.defer('counts')\
+            .filter(departure=self.object).first()
+        return context
+
+
+class DepartureCoverageView(DepartureBaseView, DetailView):
+    """Coverage of the departure area by tracks as PNG or GeoJSON."""
+
+    # @overide
+    def get(self, request, *args, **kwargs):
+        """Return the coverage in the format of the URL."""
+        coverage = get_coverage(self.get_object())
+        if kwargs['format'] == 'png':
+            return HttpResponse(to_png(coverage), content_type='image/png')
+        return JsonResponse(to_geojson(coverage),
+                            content_type='application/geo+json')
+
 
 class DepartureUpdateView(DepartureFormValidMixin,
                           DepartureBaseView,
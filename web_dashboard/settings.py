@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import tempfile
 import dj_database_url
 
 from pathlib import Path
@@ -144,6 +145,30 @@ if os.getenv('DB_ENGINE', 'SQLite') == 'SQLite':
     DATABASES['default'] = SQLITE_SETTINGS
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The bot and the dashboard invalidate cached entries of each other,
+# so the backend has to be shared by the processes (file, DB, Redis).
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'web_dashboard_cache')
+        ),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    }
+}
+
+# Seconds to keep user profiles cached by the bot, they are also dropped
+# on save of the user
+USER_PROFILE_CACHE_TIMEOUT = int(os.getenv('USER_PROFILE_CACHE_TIMEOUT', 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -226,6 +251,11 @@ LOCATION_FIELD = {
     'provider.yandex.api_key': os.getenv('YMAP_TOKEN')
 }
 
+# Telegram bot geocoder: `yandex` or `stub` (offline, for tests)
+GEOCODER_BACKEND = os.getenv('GEOCODER_BACKEND', 'yandex')
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', 1024))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 30))  # Days
+
 
 # Media
 # https://docs.djangoproject.com/en/5.0/ref/settings/#media-root
@@ -241,5 +271,66 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Django - Telegram Bot Token
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-# DJANGO_TG_TOKEN = os.getenv("DJANGO_TG_TOKEN")
-# WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+DJANGO_TG_TOKEN = os.getenv("DJANGO_TG_TOKEN")
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+
+# Number of threads (and DB connections) running bot queries.
+# 0 runs queries in the single thread of Django async ORM.
+BOT_DB_POOL_SIZE = int(os.getenv('BOT_DB_POOL_SIZE', 8))
+
+# Seconds between polls of CustomUser Telegram ID changes by the bot
+ALLOWED_USERS_SYNC_INTERVAL = float(
+    os.getenv('ALLOWED_USERS_SYNC_INTERVAL', 1)
+)
+
+# Crews to join are searched within the radius (km) around the passenger
+CREWS_SEARCH_RADIUS = float(os.getenv('CREWS_SEARCH_RADIUS', 100))
+CREWS_PAGE_SIZE = int(os.getenv('CREWS_PAGE_SIZE', 10))
+# Points of uploaded tracks within the distance (m) of the simplified
+# path are dropped from it
+TRACK_SIMPLIFY_TOLERANCE = float(os.getenv('TRACK_SIMPLIFY_TOLERANCE', 5))
+# Coverage of a departure area: cell size, width of the strip seen from
+# a track and the margin around tasks and the search location (m)
+COVERAGE_CELL_SIZE = float(os.getenv('COVERAGE_CELL_SIZE', 10))
+COVERAGE_SWEEP_WIDTH = float(os.getenv('COVERAGE_SWEEP_WIDTH', 20))
+COVERAGE_MARGIN = float(os.getenv('COVERAGE_MARGIN', 1000))
+
+# Updates per second and at once of a single user, more are answered
+# "please wait"; expensive handlers running at once
+USER_UPDATE_RATE = float(os.getenv('USER_UPDATE_RATE', 2))
+USER_UPDATE_BURST = float(os.getenv('USER_UPDATE_BURST', 5))
+BOT_HANDLER_CONCURRENCY = int(
+    os.getenv('BOT_HANDLER_CONCURRENCY', BOT_DB_POOL_SIZE)
+)
+# Updates of different users processed at once, updates of a user are
+# processed in order and at most queue size of them wait
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 64))
+USER_UPDATE_QUEUE_SIZE = int(os.getenv('USER_UPDATE_QUEUE_SIZE', 5))
+
+# Seconds of inactivity after which a bot conversation is ended
+CONVERSATION_TIMEOUT = float(os.getenv('CONVERSATION_TIMEOUT', 3600))
+# user_data is kept for this number of the most recently active users
+USER_DATA_MAX_USERS = int(os.getenv('USER_DATA_MAX_USERS', 1000))
+# Seconds between reports of memory held by user_data
+USER_DATA_STATS_INTERVAL = float(os.getenv('USER_DATA_STATS_INTERVAL', 600))
+# Seconds between saves of conversation states and user_data to DB
+BOT_PERSISTENCE_INTERVAL = float(os.getenv('BOT_PERSISTENCE_INTERVAL', 5))
+# Seconds to collect crew notifications into one message
+NOTIFICATION_WINDOW = float(os.getenv('NOTIFICATION_WINDOW', 10))
+# Group chat with the pinned operations board edited every interval seconds
+OPS_BOARD_CHAT_ID = int(os.getenv('OPS_BOARD_CHAT_ID', 0)) or None
+OPS_BOARD_INTERVAL = float(os.getenv('OPS_BOARD_INTERVAL', 60))
+# Seconds between sendings of saved notifications
+OUTBOX_INTERVAL = float(os.getenv('OUTBOX_INTERVAL', 1))
+# Seconds between probes of users who blocked the bot
+REACHABILITY_PROBE_INTERVAL = float(
+    os.getenv('REACHABILITY_PROBE_INTERVAL', 86400)
+)
+
+# Telegram bot updates: `polling` or `webhook` (served by ASGI application)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Public URL of the webhook view: https://HOST/WEBHOOK_URL/telegram/
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 100))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))